@@ -14,6 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import itertools
+
 class CGpm(object):
     """Interface for composable generative population models.
 
@@ -133,6 +135,39 @@ class CGpm(object):
         """
         raise NotImplementedError
 
+    def logpdf_batch(self, rowid, targets, constraints=None, inputs_list=None):
+        """Return the density of `targets` given `constraints` and each inputs.
+
+        inputs_list : list<dict{int:value}>
+            A list of `inputs`, each as in `logpdf`.
+
+        Returns a list whose i-th entry is the `logpdf` of `targets` given
+        `constraints` and `inputs_list[i]`. The default calls `logpdf` once
+        per inputs; a CGpm may override it to share the work across inputs.
+        """
+        return [
+            self.logpdf(rowid, targets, constraints, inputs)
+            for inputs in inputs_list
+        ]
+
+    def simulate_batch(self, rowid, targets, constraints=None,
+            inputs_list=None):
+        """Return one sample of `targets` given `constraints` and each inputs.
+
+        inputs_list : list<dict{int:value}>
+            A list of `inputs`, each as in `simulate`.
+
+        Returns a list whose i-th entry is a sample, as returned by `simulate`
+        with N=None, of `targets` given `constraints` and `inputs_list[i]`.
+        The default calls `simulate` once per run of equal consecutive inputs;
+        a CGpm may override it to share the work across inputs.
+        """
+        samples = []
+        for inputs, run in itertools.groupby(inputs_list):
+            samples.extend(self.simulate(
+                rowid, targets, constraints, inputs, N=len(list(run))))
+        return samples
+
     def logpdf_score(self):
         """Return joint density of all observations and current latent state."""
         raise NotImplementedError
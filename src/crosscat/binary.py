@@ -0,0 +1,554 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Binary serialization of State and Engine to a directory of typed arrays.
+
+A State is saved to a directory holding
+
+    metadata.pkl    Small python metadata (cctypes, hypers, alphas, ...).
+    X.<g>.npy       Dataset as float64, one row per column of the State.
+    Zv.<g>.npy      View of each column, as int64.
+    Zr.<g>.npy      Row partition of each view, as int64 (n_views, n_rows).
+    suffstats.<g>.npz
+                    Sufficient statistics of the clusters of each collapsed
+                    column without inputs, as one array per statistic with
+                    one entry per cluster, under keys `<col>/<stat>`.
+    deltas.pkl      Optional checkpoint deltas appended by Checkpointer.
+
+where <g> is the generation in metadata.pkl, so that an interrupted save
+leaves metadata.pkl referring to the complete arrays of the previous save.
+
+Loading restores the sufficient statistics of the clusters directly rather
+than incorporating each observation. An Engine is saved to a directory with
+its own metadata.pkl and X.npy, shared by the states in `states/<stateno>`.
+
+With `mmap=True`, X.npy and Zr.npy are memory-mapped read-only and the views
+of each State are constructed on first access, so that processes serving
+queries start quickly and share the dataset through the page cache.
+"""
+
+import copy
+import importlib
+import os
+
+import cPickle as pickle
+
+from collections import OrderedDict
+
+import numpy as np
+
+from cgpm.crosscat.engine import Engine
+from cgpm.crosscat.state import State
+from cgpm.utils import general as gu
+from cgpm.utils.trace import Trace
+
+
+FORMAT_VERSION = 2
+
+METADATA = 'metadata.pkl'
+X_ARRAY = 'X.npy'
+ZV_ARRAY = 'Zv.npy'
+ZR_ARRAY = 'Zr.npy'
+SUFFSTATS_ARRAY = 'suffstats.npz'
+DELTAS = 'deltas.pkl'
+STATES_DIR = 'states'
+
+
+def _write_atomic(path, write):
+    """Call write on a file open at a temporary name, then rename it to path,
+    so that path holds either its previous or its new contents in full."""
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        write(f)
+    os.rename(temporary, path)
+
+
+def _array_path(path, name, generation):
+    """Return the path of the array `name` of the given generation."""
+    root, extension = os.path.splitext(name)
+    return os.path.join(path, '%s.%d%s' % (root, generation, extension))
+
+
+def _write_pickle(obj, path):
+    _write_atomic(
+        path, lambda f: pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL))
+
+
+def _write_array(array, path):
+    _write_atomic(path, lambda f: np.save(f, array))
+
+
+def _read_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _validate_format(metadata, factory):
+    if metadata.get('format', None) != FORMAT_VERSION:
+        raise ValueError(
+            'Unknown binary format: %s.' % (metadata.get('format', None),))
+    if tuple(metadata['factory']) != factory:
+        raise ValueError('Binary path holds a %s.' % (metadata['factory'],))
+
+
+def _state_dataset(state):
+    """Return the dataset of `state` as an (n_cols, n_rows) float array."""
+    return np.asarray(
+        [state.X[c] for c in state.outputs], dtype=float).reshape(
+            (len(state.outputs), state.n_rows()))
+
+
+def _state_suffstats(state):
+    """Return dict of arrays of the sufficient statistics of clusters of the
+    collapsed dims of `state` without inputs, keyed by `<col>/<stat>`."""
+    arrays = dict()
+    for view in state.views.itervalues():
+        clusters = sorted(set(view.Zr().itervalues()))
+        for dim in view.dims.itervalues():
+            if not dim.is_collapsed() or len(dim.inputs) > 1:
+                continue
+            suffstats = [dim.clusters[k].get_suffstats() for k in clusters]
+            arrays['%d/clusters' % (dim.index,)] = \
+                np.asarray(clusters, dtype=int)
+            for stat in (suffstats[0] if suffstats else []):
+                arrays['%d/%s' % (dim.index, stat)] = \
+                    np.asarray([s[stat] for s in suffstats])
+    return arrays
+
+
+def _parse_suffstats(arrays):
+    """Invert _state_suffstats, returning dict{col:dict{k:suffstats}}."""
+    columns = dict()
+    for key in arrays.files:
+        col, stat = key.split('/')
+        columns.setdefault(int(col), dict())[stat] = arrays[key]
+    suffstats = dict()
+    for col, stats in columns.iteritems():
+        clusters = stats.pop('clusters').tolist()
+        suffstats[col] = {
+            k: {stat: values[i].tolist() for stat, values in stats.iteritems()}
+            for i, k in enumerate(clusters)
+        }
+    return suffstats
+
+
+def _state_metadata(state):
+    """Return the python metadata of `state` which is saved to metadata.pkl,
+    and which checkpoint deltas update."""
+    metadata = dict()
+    metadata['outputs'] = list(state.outputs)
+    metadata['cctypes'] = state.cctypes()
+    metadata['distargs'] = state.distargs()
+    metadata['hypers'] = [dict(dim.hypers) for dim in state.dims()]
+    metadata['alpha'] = state.alpha()
+    metadata['views'] = state.views.keys()
+    metadata['view_alphas'] = [
+        (v, view.alpha()) for v, view in state.views.iteritems()]
+    metadata['Cd'] = state.Cd
+    metadata['Ci'] = state.Ci
+    metadata['diagnostics'] = dict(state.diagnostics)
+    metadata['hooked_cgpms'] = {
+        token: cgpm.to_metadata()
+        for token, cgpm in state.hooked_cgpms.iteritems()
+    }
+    metadata['loom_path'] = state._loom_path
+    metadata['compact'] = state.compact
+    metadata['max_checkpoints'] = state.max_checkpoints
+    metadata['thin_checkpoints'] = state.thin_checkpoints
+    return metadata
+
+
+def _state_partitions(state):
+    """Return OrderedDict of the row partition of each view of `state`, as
+    int arrays indexed by rowid."""
+    rowids = xrange(state.n_rows())
+    return OrderedDict(
+        (v, np.fromiter((view.Zr(r) for r in rowids), dtype=int))
+        for v, view in state.views.iteritems()
+    )
+
+
+def save_state(state, path, dataset=True):
+    """Save `state` to the directory `path`, omitting X.npy if not dataset,
+    and discarding any checkpoint deltas. Returns the generation of the saved
+    State, which is one more than that of the State it replaces, so that
+    load_state ignores deltas left behind by an interrupted save. The arrays
+    are written under the new generation, and metadata.pkl is renamed into
+    place last, so the generation only advances once the arrays are on disk;
+    the arrays of the previous generation are then removed."""
+    if not os.path.exists(path):
+        os.makedirs(path)
+    try:
+        previous = _read_pickle(os.path.join(path, METADATA))
+        generation = previous.get('generation', 0) + 1
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+        previous = None
+        generation = 0
+    metadata = _state_metadata(state)
+    metadata['generation'] = generation
+    metadata['format'] = FORMAT_VERSION
+    metadata['factory'] = ('cgpm.crosscat.state', 'State')
+    if dataset:
+        _write_array(
+            _state_dataset(state), _array_path(path, X_ARRAY, generation))
+    _write_array(
+        np.asarray([state.Zv(c) for c in state.outputs], dtype=int),
+        _array_path(path, ZV_ARRAY, generation))
+    Zr = _state_partitions(state)
+    _write_array(
+        np.asarray(Zr.values(), dtype=int).reshape(
+            (len(Zr), state.n_rows())),
+        _array_path(path, ZR_ARRAY, generation))
+    suffstats = _state_suffstats(state)
+    _write_atomic(
+        _array_path(path, SUFFSTATS_ARRAY, generation),
+        lambda f: np.savez(f, **suffstats))
+    _write_pickle(metadata, os.path.join(path, METADATA))
+    if os.path.exists(os.path.join(path, DELTAS)):
+        os.remove(os.path.join(path, DELTAS))
+    if previous is not None:
+        for name in [X_ARRAY, ZV_ARRAY, ZR_ARRAY, SUFFSTATS_ARRAY]:
+            stale = _array_path(path, name, previous.get('generation', 0))
+            if os.path.exists(stale):
+                os.remove(stale)
+    return generation
+
+
+def load_state(path, X=None, rng=None, mmap=False):
+    """Load a State saved to `path` with its checkpoint deltas, reading the
+    dataset from its X array if saved, else from the (n_cols, n_rows) array X.
+    If mmap, the State is read-only, see `State.__init__`."""
+    if rng is None:
+        rng = gu.gen_rng(0)
+    mmap_mode = 'r' if mmap else None
+    metadata, base = _read_checkpoint(path, mmap_mode=mmap_mode)
+    generation = metadata['generation']
+    if os.path.exists(_array_path(path, X_ARRAY, generation)):
+        X = np.load(
+            _array_path(path, X_ARRAY, generation), mmap_mode=mmap_mode)
+    elif X is None:
+        raise ValueError('Binary path holds no dataset: %s.' % (path,))
+    arrays = np.load(_array_path(path, SUFFSTATS_ARRAY, generation))
+    try:
+        suffstats = _parse_suffstats(arrays)
+    finally:
+        arrays.close()
+    # The sufficient statistics of a column are only restored if deltas did
+    # not change the row partition of its view.
+    outputs = metadata['outputs']
+    Zv = dict(zip(outputs, metadata['Zv']))
+    Zrv = metadata['Zr']
+    suffstats = {
+        c: stats for c, stats in suffstats.iteritems()
+        if Zrv[Zv[c]] is base[c]
+    }
+    state = State(
+        X.T,
+        outputs=outputs,
+        cctypes=metadata['cctypes'],
+        distargs=metadata['distargs'],
+        alpha=metadata['alpha'],
+        Zv=Zv,
+        Zrv={v: Zr if mmap else Zr.tolist() for v, Zr in Zrv.iteritems()},
+        view_alphas=dict(metadata['view_alphas']),
+        hypers=metadata['hypers'],
+        Cd=metadata['Cd'],
+        Ci=metadata['Ci'],
+        diagnostics=metadata['diagnostics'],
+        loom_path=metadata['loom_path'],
+        compact=metadata['compact'],
+        max_checkpoints=metadata.get('max_checkpoints', None),
+        thin_checkpoints=metadata.get('thin_checkpoints', False),
+        suffstats=suffstats,
+        readonly=mmap,
+        rng=rng,
+    )
+    for token, cgpm_metadata in metadata['hooked_cgpms'].iteritems():
+        builder = getattr(
+            importlib.import_module(cgpm_metadata['factory'][0]),
+            cgpm_metadata['factory'][1])
+        cgpm = builder.from_metadata(cgpm_metadata, rng=rng)
+        state.compose_cgpm(cgpm)
+    return state
+
+
+def _read_checkpoint(path, mmap_mode=None):
+    """Return the metadata of the State saved to `path` with its checkpoint
+    deltas applied, with keys `Zv` (list) and `Zr` (dict of arrays by view),
+    and the dict of the base row partition of each column."""
+    metadata = _read_pickle(os.path.join(path, METADATA))
+    _validate_format(metadata, ('cgpm.crosscat.state', 'State'))
+    metadata.setdefault('generation', 0)
+    generation = metadata['generation']
+    metadata['Zv'] = np.load(_array_path(path, ZV_ARRAY, generation)).tolist()
+    Zr = np.load(
+        _array_path(path, ZR_ARRAY, generation), mmap_mode=mmap_mode)
+    metadata['Zr'] = dict(zip(metadata['views'], Zr))
+    base = {
+        c: metadata['Zr'][v]
+        for c, v in zip(metadata['outputs'], metadata['Zv'])
+    }
+    for delta in _read_deltas(path)[0]:
+        # Deltas of another generation precede a later compaction.
+        if delta['generation'] == metadata['generation']:
+            _apply_delta(metadata, delta)
+    return metadata, base
+
+
+def _read_deltas(path):
+    """Return the list of checkpoint deltas appended to `path`, and the size
+    of the file up to the last complete delta, ignoring a truncated delta
+    from an interrupted write."""
+    deltas = []
+    end = 0
+    if not os.path.exists(os.path.join(path, DELTAS)):
+        return deltas, end
+    with open(os.path.join(path, DELTAS), 'rb') as f:
+        while True:
+            try:
+                deltas.append(pickle.load(f))
+            # A truncated pickle raises one of several errors.
+            except Exception:
+                return deltas, end
+            end = f.tell()
+
+
+def _apply_delta(metadata, delta):
+    for key in ['Zv', 'alpha', 'views', 'view_alphas', 'hooked_cgpms']:
+        if key in delta:
+            metadata[key] = delta[key]
+    metadata['Zr'] = {
+        v: delta['Zr'][v] if v in delta['Zr'] else metadata['Zr'][v]
+        for v in metadata['views']
+    }
+    for c, hypers in delta['hypers'].iteritems():
+        metadata['hypers'][metadata['outputs'].index(c)] = hypers
+    for key, (operation, value) in delta['diagnostics'].iteritems():
+        if operation == 'extend':
+            metadata['diagnostics'][key] = \
+                list(metadata['diagnostics'][key]) + value
+        elif operation == 'record':
+            metadata['diagnostics'][key].record(*value)
+        else:
+            metadata['diagnostics'][key] = value
+
+
+def _equal(a, b):
+    """True if the nested metadata a and b, which may hold arrays, are
+    equal."""
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.array_equal(a, b)
+    if isinstance(a, dict) and isinstance(b, dict):
+        return set(a) == set(b) and all(_equal(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return type(a) == type(b) and len(a) == len(b) \
+            and all(_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _diagnostics_summary(diagnostics):
+    """Return the length of each list of diagnostics, the position of the
+    values retained by each Trace, and a copy of others, for computing the
+    diagnostics to append at the next checkpoint."""
+    def summary(value):
+        if isinstance(value, list):
+            return len(value)
+        if isinstance(value, Trace):
+            return (value.count, value.stride, value.first)
+        return copy.deepcopy(value)
+    return {key: summary(value) for key, value in diagnostics.iteritems()}
+
+
+class Checkpointer(object):
+    """Incremental checkpoints of a State to the directory `path`.
+
+    The directory holds a State saved by save_state, to which each call of
+    write appends only the changes since the previous checkpoint: the column
+    partition, the row partitions of changed views, changed hyperparameters,
+    the alphas, and new diagnostics. These deltas are pickled to deltas.pkl,
+    which is only ever appended, and which load_state applies in order.
+
+    Compaction rewrites the saved State and discards the deltas, and runs
+    every max_deltas checkpoints (if given), or whenever the dataset or the
+    columns of the State change, which deltas do not record. An existing
+    checkpoint of the same dataset and columns at `path` is continued.
+    """
+
+    def __init__(self, state, path, max_deltas=None):
+        self.state = state
+        self.path = path
+        self.max_deltas = max_deltas
+        try:
+            metadata, _base = _read_checkpoint(path)
+            X = np.load(_array_path(path, X_ARRAY, metadata['generation']))
+        except (IOError, OSError, ValueError, KeyError):
+            self.compact()
+            return
+        if self._signature(metadata) != self._signature(_state_metadata(state))\
+                or X.shape != (state.n_cols(), state.n_rows()) \
+                or not np.allclose(X, _state_dataset(state), equal_nan=True):
+            self.compact()
+            return
+        self.generation = metadata['generation']
+        deltas, end = _read_deltas(path)
+        self.deltas = sum(
+            delta['generation'] == self.generation for delta in deltas)
+        # Drop a truncated delta, which would hide the deltas appended to it.
+        if os.path.exists(os.path.join(path, DELTAS)):
+            with open(os.path.join(path, DELTAS), 'ab') as f:
+                f.truncate(end)
+        self.snapshot = metadata
+        self.snapshot['diagnostics'] = \
+            _diagnostics_summary(metadata['diagnostics'])
+        self.snapshot['n_rows'] = state.n_rows()
+
+    def write(self):
+        """Append the changes since the previous checkpoint."""
+        metadata = _state_metadata(self.state)
+        if self._signature(metadata) != self._signature(self.snapshot) \
+                or self.state.n_rows() != self.snapshot['n_rows']:
+            self.compact()
+            return
+        delta = self._delta(metadata, _state_partitions(self.state))
+        with open(os.path.join(self.path, DELTAS), 'ab') as f:
+            pickle.dump(delta, f, pickle.HIGHEST_PROTOCOL)
+        _apply_delta(self.snapshot, dict(delta, diagnostics={}))
+        self.snapshot['hooked_cgpms'] = copy.deepcopy(metadata['hooked_cgpms'])
+        self.snapshot['diagnostics'] = \
+            _diagnostics_summary(self.state.diagnostics)
+        self.deltas += 1
+        if self.max_deltas is not None and self.deltas >= self.max_deltas:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the saved State and discard the deltas."""
+        self.generation = save_state(self.state, self.path)
+        self.deltas = 0
+        self.snapshot = _state_metadata(self.state)
+        # The metadata of a hooked cgpm may share its mutable data.
+        self.snapshot['hooked_cgpms'] = \
+            copy.deepcopy(self.snapshot['hooked_cgpms'])
+        self.snapshot['Zv'] = [self.state.Zv(c) for c in self.state.outputs]
+        self.snapshot['Zr'] = dict(_state_partitions(self.state))
+        self.snapshot['diagnostics'] = \
+            _diagnostics_summary(self.state.diagnostics)
+        self.snapshot['n_rows'] = self.state.n_rows()
+
+    def _delta(self, metadata, partitions):
+        snapshot = self.snapshot
+        delta = {
+            'generation': self.generation,
+            'alpha': metadata['alpha'],
+            'views': metadata['views'],
+            'view_alphas': metadata['view_alphas'],
+        }
+        Zv = [self.state.Zv(c) for c in metadata['outputs']]
+        if Zv != snapshot['Zv']:
+            delta['Zv'] = Zv
+        delta['Zr'] = {
+            v: Zr for v, Zr in partitions.iteritems()
+            if v not in snapshot['Zr']
+                or not np.array_equal(Zr, snapshot['Zr'][v])
+        }
+        delta['hypers'] = {
+            c: hypers for c, hypers, previous in
+                zip(metadata['outputs'], metadata['hypers'], snapshot['hypers'])
+            if hypers != previous
+        }
+        if not _equal(metadata['hooked_cgpms'], snapshot['hooked_cgpms']):
+            delta['hooked_cgpms'] = metadata['hooked_cgpms']
+        delta['diagnostics'] = dict()
+        for key, value in metadata['diagnostics'].iteritems():
+            previous = snapshot['diagnostics'].get(key, None)
+            if isinstance(value, list):
+                if isinstance(previous, int) and previous <= len(value):
+                    if previous < len(value):
+                        delta['diagnostics'][key] = \
+                            ('extend', list(value[previous:]))
+                else:
+                    delta['diagnostics'][key] = ('set', list(value))
+            elif isinstance(value, Trace):
+                # Unless values were dropped, record those of new checkpoints.
+                if isinstance(previous, tuple) \
+                        and previous[1:] == (value.stride, value.first):
+                    if previous[0] != value.count:
+                        delta['diagnostics'][key] = ('record',
+                            (value.since(previous[0]), value.count))
+                else:
+                    delta['diagnostics'][key] = ('set', copy.deepcopy(value))
+            elif value != previous:
+                delta['diagnostics'][key] = ('set', copy.deepcopy(value))
+        return delta
+
+    @staticmethod
+    def _signature(metadata):
+        """Return the parts of State metadata which deltas do not record."""
+        return [
+            metadata.get(key, None)
+            for key in ['outputs', 'cctypes', 'distargs', 'Cd', 'Ci',
+                'loom_path', 'compact', 'max_checkpoints', 'thin_checkpoints']
+        ]
+
+
+def save_engine_metadata(engine, path):
+    """Save the metadata of `engine` to the directory `path`, whose states
+    are saved to the subdirectories returned by state_path."""
+    if not os.path.exists(path):
+        os.makedirs(path)
+    metadata = dict()
+    metadata['num_states'] = engine.num_states()
+    metadata['format'] = FORMAT_VERSION
+    metadata['factory'] = ('cgpm.crosscat.engine', 'Engine')
+    _write_pickle(metadata, os.path.join(path, METADATA))
+
+
+def state_path(path, stateno):
+    """Return the directory of state `stateno` of the Engine at `path`."""
+    return os.path.join(path, STATES_DIR, str(stateno))
+
+
+def save_engine(engine, path):
+    """Save `engine` to the directory `path`, sharing one copy of X.npy."""
+    save_engine_metadata(engine, path)
+    _write_array(
+        _state_dataset(engine.states[0]), os.path.join(path, X_ARRAY))
+    for stateno, state in enumerate(engine.states):
+        save_state(state, state_path(path, stateno), dataset=False)
+
+
+def load_engine(path, rng=None, mmap=False):
+    """Load an Engine saved to `path`, whose states share one memory map of
+    the dataset if mmap."""
+    if rng is None:
+        rng = gu.gen_rng(0)
+    mmap_mode = 'r' if mmap else None
+    metadata = _read_pickle(os.path.join(path, METADATA))
+    _validate_format(metadata, ('cgpm.crosscat.engine', 'Engine'))
+    # States checkpointed by Engine.transition hold their own dataset.
+    X = None
+    if os.path.exists(os.path.join(path, X_ARRAY)):
+        X = np.load(os.path.join(path, X_ARRAY), mmap_mode=mmap_mode)
+    engine = Engine([], num_states=0, rng=rng, multiprocess=0)
+    seeds = engine._get_seeds(metadata['num_states'])
+    paths = [state_path(path, s) for s in xrange(metadata['num_states'])]
+    engine.states = [
+        load_state(
+            directory,
+            X=X,
+            rng=gu.gen_rng(seed), mmap=mmap)
+        for directory, seed in zip(paths, seeds)
+    ]
+    return engine
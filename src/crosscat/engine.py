@@ -17,8 +17,11 @@
 import importlib
 import itertools
 import pickle
+import time
 
+from collections import OrderedDict
 from collections import namedtuple
+from multiprocessing import cpu_count
 
 import numpy as np
 
@@ -27,6 +30,9 @@ from cgpm.utils import general as gu
 from cgpm.utils.parallel_map import parallel_map
 
 
+# Shortest slice of a timesliced transition in forked processes, in seconds.
+MIN_TIMESLICE = 1.
+
 # Wrapper for a simple cgpm for optimized dependence_probability.
 DummyCgpm = namedtuple('DummyCgpm', ['outputs', 'inputs'])
 
@@ -41,6 +47,14 @@ def _modify((method, state, args)):
     getattr(state, method)(*args)
     return state
 
+def _modify_kwargs((method, state, kwargs)):
+    getattr(state, method)(**kwargs)
+    return state
+
+def _transition_slice((state, kwargs)):
+    iters = state.transition(**kwargs)
+    return state, iters
+
 def _alter((funcs, state)):
     for func in funcs:
         state = func(state)
@@ -58,6 +72,97 @@ def _evaluate((method, state, args)):
     return getattr(state, method)(*args)
 
 
+class LazyStates(object):
+    """List of states, each of which is built from its metadata on first
+    access.
+
+    At most max_states states are held at once (all if None), evicting the
+    least recently used. A state assigned to the list is converted back to
+    metadata on eviction, whereas a state built from metadata is dropped, so
+    that modifications to such states must be assigned back to persist.
+    Engine methods which modify every state replace the list with the
+    modified states. An evicted state leaves a new seed drawn from its rng,
+    so that a rebuilt state does not replay the random draws of the last.
+    """
+
+    def __init__(self, metadata, seeds, max_states=None):
+        if max_states is not None and max_states < 1:
+            raise ValueError('LazyStates requires max_states >= 1.')
+        self.metadata = list(metadata)
+        self.seeds = list(seeds)
+        self.max_states = max_states
+        # Built states in order of access, and the ones which were assigned.
+        self.cache = OrderedDict()
+        self.assigned = set()
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        index = self._index(index)
+        if index in self.cache:
+            state = self.cache.pop(index)
+        else:
+            state = State.from_metadata(
+                self.metadata[index], rng=gu.gen_rng(self.seeds[index]))
+        self.cache[index] = state
+        self._evict()
+        return state
+
+    def seed(self, seeds):
+        """Seed the rng of each state, without building the states which
+        are not held."""
+        for index, seed in enumerate(seeds):
+            if index in self.cache:
+                self.cache[index].rng.seed(seed)
+            else:
+                self.seeds[index] = seed
+
+    def __setitem__(self, index, state):
+        index = self._index(index)
+        self.cache.pop(index, None)
+        self.cache[index] = state
+        self.assigned.add(index)
+        self._evict()
+
+    def __delitem__(self, index):
+        index = self._index(index)
+        del self.metadata[index]
+        del self.seeds[index]
+        shift = lambda i: i if i < index else i - 1
+        self.cache = OrderedDict(
+            (shift(i), state) for i, state in self.cache.iteritems()
+            if i != index)
+        self.assigned = set(shift(i) for i in self.assigned if i != index)
+
+    def append(self, state):
+        self.metadata.append(None)
+        self.seeds.append(None)
+        self[len(self) - 1] = state
+
+    def extend(self, states):
+        for state in states:
+            self.append(state)
+
+    def _index(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError('State index out of range: %d.' % (index,))
+        return index % len(self)
+
+    def _evict(self):
+        while self.max_states is not None \
+                and len(self.cache) > self.max_states:
+            index, state = self.cache.popitem(last=False)
+            if index in self.assigned:
+                self.metadata[index] = state.to_metadata()
+                self.assigned.remove(index)
+            self.seeds[index] = state.rng.randint(low=1, high=2**32-1)
+
+
 class Engine(object):
     """Multiprocessing engine for a stochastic ensemble of parallel States."""
 
@@ -74,16 +179,152 @@ class Engine(object):
     def transition(
             self, N=None, S=None, kernels=None, rowids=None, cols=None,
             views=None, progress=True, checkpoint=None, statenos=None,
-            multiprocess=1):
-        mapper = parallel_map if multiprocess else map
+            multiprocess=1, tolerance=None, rhat=None, timeslice=None,
+            checkpoint_path=None):
+        """Run State.transition on each state.
+
+        With rhat, the states transition in rounds of checkpoint iterations,
+        until the split R-hat of the logscores recorded across states in this
+        transition is at most rhat, or (with tolerance) every state reaches a
+        logscore plateau. Without rhat, each state stops on its own plateau.
+        N and S bound the total number of iterations and seconds.
+
+        With timeslice, S is a wall-clock budget for the whole ensemble,
+        rather than for each state: the states transition round-robin in
+        slices of at most timeslice seconds (at least MIN_TIMESLICE with
+        multiprocess), sharing the processes equally, and all stop at the
+        deadline (see _transition_timesliced).
+
+        With checkpoint_path, each state writes incremental checkpoints to its
+        own directory of an Engine saved in the binary format at that path,
+        see State.transition and Engine.from_binary.
+        """
         statenos = statenos or xrange(self.num_states())
-        args = [('transition', self.states[s],
-                (N, S, kernels, rowids, cols, views, progress, checkpoint))
-                for s in statenos]
-        states = mapper(_modify, args)
+        kwargs = {
+            'kernels': kernels, 'rowids': rowids, 'cols': cols,
+            'views': views, 'progress': progress, 'checkpoint': checkpoint,
+        }
+        if checkpoint_path is not None:
+            from cgpm.crosscat import binary
+            binary.save_engine_metadata(self, checkpoint_path)
+            kwargs['checkpoint_path'] = checkpoint_path
+        if timeslice is not None:
+            if S is None:
+                raise ValueError('Time slicing requires S.')
+            if tolerance is not None or rhat is not None:
+                raise ValueError(
+                    'Time slicing does not support convergence diagnostics.')
+            self._transition_timesliced(
+                statenos, multiprocess, N, S, timeslice, **kwargs)
+            return
+        if rhat is None:
+            self._transition_states(
+                statenos, multiprocess, N=N, S=S, tolerance=tolerance,
+                **kwargs)
+            return
+        if not checkpoint:
+            raise ValueError('Convergence diagnostic requires checkpoint.')
+        if N is None and S is None:
+            N = 1
+        starts = [
+            self.states[s].diagnostics['logscore'].count for s in statenos]
+        iters = 0
+        start = time.time()
+        while (N is None or iters < N) and (S is None or time.time()-start < S):
+            N_round = checkpoint if N is None else min(checkpoint, N - iters)
+            S_round = None if S is None else S - (time.time() - start)
+            self._transition_states(
+                statenos, multiprocess, N=N_round, S=S_round, **kwargs)
+            iters += N_round
+            logscores = [
+                self.states[s].diagnostics['logscore'].since(i)
+                for s, i in zip(statenos, starts)
+            ]
+            if gu.split_rhat(logscores) <= rhat:
+                break
+            if tolerance is not None and all(
+                    self.states[s]._logscore_converged(i, tolerance)
+                    for s, i in zip(statenos, starts)):
+                break
+
+    def _transition_timesliced(
+            self, statenos, multiprocess, N, S, timeslice, **kwargs):
+        """Transition the states round-robin, until each state completes N
+        iterations or S seconds elapse. Every round gives each unfinished
+        state one slice of equal length, at most timeslice seconds, and short
+        enough for the round to end by the deadline given the number of states
+        which share each process. Slices run in forked processes last at least
+        MIN_TIMESLICE seconds, so that pickling the states to and from the
+        processes stays a small part of each slice; when the remaining time
+        does not allow such a slice for every state, the round only slices as
+        many states as the processes can run by the deadline, starting with
+        the states sliced least recently. Checkpoints count the iterations of
+        a state across its slices."""
+        deadline = time.time() + S
+        processes = cpu_count() if multiprocess else 1
+        max_states = getattr(self.states, 'max_states', None)
+        remaining = {s: N for s in statenos}
+        queue = list(statenos)
+        completed = {s: 0 for s in statenos}
+
+        def transition_slice(chunk, mapper, S_slice):
+            args = [
+                (self.states[s], gu.merged(
+                    self._state_kwargs(s, kwargs),
+                    {'N': remaining[s], 'S': S_slice,
+                        'checkpoint_offset': completed[s]}))
+                for s in chunk
+            ]
+            results = mapper(_transition_slice, args)
+            for s, (state, iters) in zip(chunk, results):
+                self.states[s] = state
+                completed[s] += iters
+                if remaining[s] is not None:
+                    remaining[s] -= iters
+
+        while True:
+            active = [s for s in queue if remaining[s] is None
+                or 0 < remaining[s]]
+            seconds = deadline - time.time()
+            if not active or seconds <= 0:
+                break
+            parallelism = min(processes, len(active), max_states or processes)
+            rounds = -(-len(active) // parallelism)
+            S_slice = min(timeslice, seconds / rounds)
+            if parallelism > 1 and S_slice < MIN_TIMESLICE:
+                S_slice = min(seconds, MIN_TIMESLICE)
+                waves = max(int(seconds // MIN_TIMESLICE), 1)
+                active = active[:waves * parallelism]
+                queue = [s for s in queue if s not in active] + active
+            mapper = map if parallelism == 1 else \
+                lambda f, l: parallel_map(f, l, parallelism=parallelism)
+            for chunk in self._chunks(active):
+                transition_slice(chunk, mapper, S_slice)
+
+    def _transition_states(self, statenos, multiprocess, **kwargs):
+        mapper = parallel_map if multiprocess else map
+        for chunk in self._chunks(statenos):
+            self._transition_chunk(chunk, mapper, kwargs)
+
+    def _transition_chunk(self, statenos, mapper, kwargs):
+        args = [
+            ('transition', self.states[s], self._state_kwargs(s, kwargs))
+            for s in statenos
+        ]
+        states = mapper(_modify_kwargs, args)
         for s, state in zip(statenos, states):
             self.states[s] = state
 
+    def _chunks(self, statenos):
+        """Split statenos into chunks of at most the max_states of lazy
+        states, so that a transition holds at most max_states at once; each
+        chunk is transitioned by a separate call, which releases its states
+        before the next chunk is built."""
+        statenos = list(statenos)
+        size = getattr(self.states, 'max_states', None) or len(statenos)
+        return [
+            statenos[i:i+size] for i in xrange(0, len(statenos), max(size, 1))]
+
     def transition_lovecat(
             self, N=None, S=None, kernels=None, rowids=None,
             cols=None, progress=None, checkpoint=None, statenos=None,
@@ -310,6 +551,50 @@ class Engine(object):
         probs = mapper(_evaluate, args)
         return probs
 
+    def timings(self, statenos=None):
+        """Total wall time and calls of each kernel across states.
+
+        Returns a dict with 'seconds' and 'calls' of each kernel, the
+        'column_seconds' of each kernel on each column, and the
+        'cctype_seconds' of each kernel on the columns of each cctype.
+        """
+        statenos = statenos or xrange(self.num_states())
+        timings = {
+            'seconds': {}, 'calls': {},
+            'column_seconds': {}, 'cctype_seconds': {},
+        }
+        def add(totals, key, value):
+            totals[key] = totals.get(key, 0) + value
+        for s in statenos:
+            state = self.states[s]
+            for key in ['seconds', 'calls']:
+                for kernel, value in state.diagnostics[key].iteritems():
+                    add(timings[key], kernel, value)
+            column_seconds = state.diagnostics['column_seconds']
+            for kernel, seconds in column_seconds.iteritems():
+                totals_col = timings['column_seconds'].setdefault(kernel, {})
+                totals_cctype = timings['cctype_seconds'].setdefault(kernel, {})
+                for c, value in seconds.iteritems():
+                    add(totals_col, c, value)
+                    if c in state.outputs:
+                        add(totals_cctype, state.dim_for(c).cctype, value)
+        return timings
+
+    def memory_usage(self, statenos=None):
+        """Approximate bytes held by states, by component.
+
+        Returns a dict with the 'total' bytes of each component across
+        states, and the list of bytes of each component in each of the
+        'states' (see State.memory_usage).
+        """
+        statenos = statenos or xrange(self.num_states())
+        states = [self.states[s].memory_usage() for s in statenos]
+        total = {}
+        for usage in states:
+            for key, value in usage.iteritems():
+                total[key] = total.get(key, 0) + value
+        return {'total': total, 'states': states}
+
     def alter(self, funcs, statenos=None, multiprocess=1):
         """Apply generic funcs on states in parallel."""
         mapper = parallel_map if multiprocess else map
@@ -351,9 +636,21 @@ class Engine(object):
 
     def _seed_states(self):
         seeds = self._get_seeds()
+        if isinstance(self.states, LazyStates):
+            self.states.seed(seeds)
+            return
         for seed, state in zip(seeds, self.states):
             state.rng.seed(seed)
 
+    def _state_kwargs(self, stateno, kwargs):
+        """Return the kwargs of State.transition for stateno, which writes
+        checkpoints to its own directory under checkpoint_path."""
+        if kwargs.get('checkpoint_path', None) is None:
+            return kwargs
+        from cgpm.crosscat import binary
+        return gu.merged(kwargs, {'checkpoint_path':
+            binary.state_path(kwargs['checkpoint_path'], stateno)})
+
     def _get_seeds(self, N=None):
         num_draws = N if N is not None else self.num_states()
         return self.rng.randint(low=1, high=2**32-1, size=num_draws)
@@ -401,7 +698,12 @@ class Engine(object):
         return metadata
 
     @classmethod
-    def from_metadata(cls, metadata, rng=None, multiprocess=1):
+    def from_metadata(
+            cls, metadata, rng=None, multiprocess=1, lazy=False,
+            max_states=None):
+        """Build an Engine from metadata. If lazy, each state is built from its
+        metadata on first access, holding at most max_states states at once,
+        see LazyStates."""
         if rng is None:
             rng = gu.gen_rng(0)
         engine = cls(
@@ -413,6 +715,11 @@ class Engine(object):
         for m in metadata['states']:
             m['X'] = metadata['X']
         num_states = len(metadata['states'])
+        if lazy:
+            engine.states = LazyStates(
+                metadata['states'], engine._get_seeds(num_states),
+                max_states=max_states)
+            return engine
         def retrieve_state((state, seed)):
             return State.from_metadata(state, rng=gu.gen_rng(seed))
         mapper = parallel_map if multiprocess else map
@@ -426,10 +733,20 @@ class Engine(object):
         pickle.dump(metadata, fileptr)
 
     @classmethod
-    def from_pickle(cls, fileptr, rng=None):
+    def from_pickle(cls, fileptr, rng=None, lazy=False, max_states=None):
         if isinstance(fileptr, str):
             with open(fileptr, 'r') as f:
                 metadata = pickle.load(f)
         else:
             metadata = pickle.load(fileptr)
-        return cls.from_metadata(metadata, rng=rng)
+        return cls.from_metadata(
+            metadata, rng=rng, lazy=lazy, max_states=max_states)
+
+    def to_binary(self, path):
+        from cgpm.crosscat import binary
+        binary.save_engine(self, path)
+
+    @classmethod
+    def from_binary(cls, path, rng=None, mmap=False):
+        from cgpm.crosscat import binary
+        return binary.load_engine(path, rng=rng, mmap=mmap)
@@ -172,6 +172,7 @@ def _update_state(state, path, sample):
             state.X,
             outputs=[state.crp_id_view + index],
             Zr=Zvr_new[v],
+            compact=state.compact,
             rng=state.rng
         )
         new_views.append(view)
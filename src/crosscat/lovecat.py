@@ -260,6 +260,7 @@ def _update_state(state, M_c, X_L, X_D):
             outputs=[state.crp_id_view + index],
             Zr=X_D[v],
             alpha=alpha,
+            compact=state.compact,
             rng=state.rng
         )
         new_views.append(view)
@@ -303,10 +304,7 @@ def _update_diagnostics(state, diagnostics):
 
     # Update column_partition.
     def convert_column_partition(assignments):
-        return [
-            (col, int(assgn))
-            for col, assgn in zip(state.outputs, assignments)
-        ]
+        return [int(assgn) for assgn in assignments]
     new_column_partition = diagnostics.get('column_partition_assignments', [])
     if len(new_column_partition) > 0:
         assert len(new_column_partition) == len(state.outputs)
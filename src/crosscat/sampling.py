@@ -26,6 +26,7 @@ import numpy as np
 
 from cgpm.primitives.crp import Crp
 
+from cgpm.utils import timer as tu
 from cgpm.utils.general import log_normalize
 from cgpm.utils.general import log_pflip
 from cgpm.utils.general import logsumexp
@@ -37,33 +38,35 @@ from cgpm.utils.validation import partition_query_evidence
 def state_logpdf(state, rowid, targets, constraints=None):
     targets_lookup, constraints_lookup = partition_query_evidence(
         state.Zv(), targets, constraints)
-    logps = (
-        view_logpdf(
-            view=state.views[v],
-            rowid=rowid,
-            targets=targets_lookup[v],
-            constraints=constraints_lookup.get(v, {})
-        )
-        for v in targets_lookup
-    )
-    return sum(logps)
+    def logpdf(v):
+        view = state.views[v]
+        with tu.profiled(lambda: tu.cgpm_stage(view, 'logpdf')):
+            return view_logpdf(
+                view=view,
+                rowid=rowid,
+                targets=targets_lookup[v],
+                constraints=constraints_lookup.get(v, {})
+            )
+    return sum(logpdf(v) for v in targets_lookup)
 
 
 def state_simulate(state, rowid, targets, constraints=None, N=None):
     targets_lookup, constraints_lookup = partition_query_evidence(
         state.Zv(), targets, constraints)
     N_sim = N if N is not None else 1
-    draws = (
-        view_simulate(
-            view=state.views[v],
-            rowid=rowid,
-            targets=targets_lookup[v],
-            constraints=constraints_lookup.get(v, {}),
-            N=N_sim
-        )
-        for v in targets_lookup
-    )
-    samples = [merged(*l) for l in zip(*draws)]
+    def simulate(v):
+        view = state.views[v]
+        with tu.profiled(lambda: tu.cgpm_stage(view, 'simulate')):
+            return list(view_simulate(
+                view=view,
+                rowid=rowid,
+                targets=targets_lookup[v],
+                constraints=constraints_lookup.get(v, {}),
+                N=N_sim
+            ))
+    draws = [simulate(v) for v in targets_lookup]
+    with tu.profiled('State.assemble'):
+        samples = [merged(*l) for l in zip(*draws)]
     return samples if N is not None else samples[0]
 
 
@@ -16,6 +16,7 @@
 
 import cPickle as pickle
 import copy
+import functools
 import importlib
 import itertools
 import sys
@@ -24,6 +25,7 @@ import time
 from collections import OrderedDict
 from collections import defaultdict
 from math import isnan
+from multiprocessing import cpu_count
 
 import numpy as np
 
@@ -31,14 +33,30 @@ from cgpm.cgpm import CGpm
 from cgpm.crosscat import sampling
 from cgpm.mixtures.dim import Dim
 from cgpm.mixtures.view import View
-from cgpm.network.helpers import retrieve_ancestors
-from cgpm.network.helpers import retrieve_variable_to_cgpm
-from cgpm.network.helpers import retrieve_weakly_connected_components
+from cgpm.network.helpers import CompiledGraph
 from cgpm.network.importance import ImportanceNetwork
+from cgpm.primitives.crp import Crp
 from cgpm.utils import config as cu
 from cgpm.utils import general as gu
 from cgpm.utils import timer as tu
 from cgpm.utils import validation as vu
+from cgpm.utils.parallel_map import parallel_map
+from cgpm.utils.trace import Trace
+
+
+class LazyViews(OrderedDict):
+    """OrderedDict of views, where a value given as a functools.partial is
+    called to construct the view on first access."""
+
+    def __getitem__(self, v):
+        view = OrderedDict.__getitem__(self, v)
+        if isinstance(view, functools.partial):
+            view = view()
+            OrderedDict.__setitem__(self, v, view)
+        return view
+
+    def get(self, v, default=None):
+        return self[v] if v in self else default
 
 
 class State(CGpm):
@@ -48,7 +66,8 @@ class State(CGpm):
             self, X, outputs=None, inputs=None, cctypes=None,
             distargs=None, Zv=None, Zrv=None, alpha=None, view_alphas=None,
             hypers=None, Cd=None, Ci=None, Rd=None, Ri=None, diagnostics=None,
-            loom_path=None, rng=None):
+            loom_path=None, compact=False, suffstats=None, readonly=False,
+            max_checkpoints=None, thin_checkpoints=False, rng=None):
         # -- Seed --------------------------------------------------------------
         self.rng = gu.gen_rng() if rng is None else rng
 
@@ -67,7 +86,11 @@ class State(CGpm):
         self.set_outputs(outputs)
         self.X = OrderedDict()
         for i, c in enumerate(self.outputs):
-            self.X[c] = X[:,i].tolist()
+            # A read-only dataset keeps slices of X, which may be memory-mapped,
+            # rather than copying each column to a list.
+            self.X[c] = X[:,i] if readonly else X[:,i].tolist()
+        self.compact = compact
+        self.readonly = readonly
 
         # -- Column CRP --------------------------------------------------------
         # Retrieve the dependence constraints.
@@ -109,18 +132,16 @@ class State(CGpm):
                     # the exchangeable version of the constrained crp.
                     Zv = gu.simulate_crp_constrained_dependent(
                         self.n_cols(), self.alpha(), self.Cd, self.rng)
-                # Incorporate hte the data.
-                for c, z in zip(self.outputs, Zv):
-                    self.crp.incorporate(c, {self.crp_id: z}, {-1:0})
             # Otherwise simulate an unconstrained CRP.
             else:
-                for c in self.outputs:
-                    z = self.crp.simulate(c, [self.crp_id], None, {-1:0})
-                    self.crp.incorporate(c, z, {-1:0})
-        # Load the provided Zv without simulation.
-        else:
-            for c, z in Zv.iteritems():
-                self.crp.incorporate(c, {self.crp_id: z}, {-1:0})
+                Zv = gu.simulate_crp_fast(
+                    self.n_cols(), self.alpha(), rng=self.rng)
+            # Incorporate the simulated partition.
+            Zv = dict(zip(self.outputs, Zv))
+        # Load the partition.
+        self.crp.incorporate_bulk(
+            list(self.outputs), [Zv[c] for c in self.outputs],
+            [0]*self.n_cols())
 
         assert len(self.Zv()) == len(self.outputs)
 
@@ -129,6 +150,7 @@ class State(CGpm):
         distargs = distargs or [None] * len(self.outputs)
         hypers = hypers or [None] * len(self.outputs)
         view_alphas = view_alphas or {}
+        suffstats = suffstats or {}
 
         # If the user specifies Zrv, then the keys of Zrv must match the views
         # which are values in Zv.
@@ -136,16 +158,23 @@ class State(CGpm):
             Zrv = {}
         else:
             assert set(Zrv.keys()) == set(self.Zv().values())
+        # Sufficient statistics of clusters are only meaningful given the row
+        # partitions they summarize.
+        if suffstats and not Zrv:
+            raise ValueError('State requires Zrv to restore suffstats.')
 
         # -- Views -------------------------------------------------------------
-        self.views = OrderedDict()
+        # Views of a read-only state are constructed on first access.
+        self.views = LazyViews() if self.readonly else OrderedDict()
         self.crp_id_view = 10**7
         for v in set(self.Zv().values()):
             v_outputs = [o for o in self.outputs if self.Zv(o) == v]
             v_cctypes = [cctypes[self.outputs.index(c)] for c in v_outputs]
             v_distargs = [distargs[self.outputs.index(c)] for c in v_outputs]
             v_hypers = [hypers[self.outputs.index(c)] for c in v_outputs]
-            view = View(
+            v_suffstats = [suffstats.get(c, None) for c in v_outputs]
+            view = functools.partial(
+                View,
                 self.X,
                 outputs=[self.crp_id_view+v] + v_outputs,
                 inputs=None,
@@ -154,26 +183,58 @@ class State(CGpm):
                 cctypes=v_cctypes,
                 distargs=v_distargs,
                 hypers=v_hypers,
+                compact=self.compact,
+                suffstats=v_suffstats,
                 rng=self.rng
             )
-            self.views[v] = view
+            self.views[v] = view if self.readonly else view()
 
         # -- Foreign CGpms -----------------------------------------------------
         self.token_generator = itertools.count(start=57481)
         self.hooked_cgpms = dict()
 
+        # -- Compiled network of views and foreign CGpms -----------------------
+        self._graph = None
+        self._graph_signature = None
+
         # -- Diagnostic Checkpoints---------------------------------------------
         if diagnostics is None:
             self.diagnostics = defaultdict(list)
             self.diagnostics['iterations'] = dict()
         else:
             self.diagnostics = defaultdict(list, diagnostics)
+        # Timings of kernels, and of kernels on each column (whose keys become
+        # strings in JSON metadata).
+        self.diagnostics.setdefault('seconds', dict())
+        self.diagnostics.setdefault('calls', dict())
+        self.diagnostics['column_seconds'] = {
+            kernel: {int(c): seconds for c, seconds in timings.iteritems()}
+            for kernel, timings in
+                self.diagnostics.get('column_seconds', {}).iteritems()
+        }
+        # Values at each checkpoint, in bounded typed traces. The column
+        # partition at a checkpoint lists the view of each output.
+        self.max_checkpoints = max_checkpoints
+        self.thin_checkpoints = thin_checkpoints
+        traces = self.diagnostics.pop('traces', {})
+        for key, dtype, ragged in self._TRACES:
+            values = self.diagnostics.get(key, [])
+            if isinstance(values, Trace):
+                continue
+            if ragged:
+                values = [self._column_partition(z) for z in values]
+            self.diagnostics[key] = Trace.from_values(
+                values, dtype=dtype, ragged=ragged, capacity=max_checkpoints,
+                thin=thin_checkpoints, **traces.get(key, {}))
 
         # -- Loom project ------------------------------------------------------
         self._loom_path = loom_path
 
         # -- Validate ----------------------------------------------------------
-        self._check_partitions()
+        # Validating the views of a read-only state would construct them all;
+        # each view validates its own partitions once constructed.
+        if not self.readonly:
+            self._check_partitions()
 
         # -- Composite ---------------------------------------------------------
         # Does the state have any conditional GPMs? Conditional GPMs come from
@@ -214,7 +275,9 @@ class State(CGpm):
         if v_add in self.views:
             view = self.views[v_add]
         else:
-            view = View(self.X, outputs=[self.crp_id_view + v_add], rng=self.rng)
+            view = View(
+                self.X, outputs=[self.crp_id_view + v_add],
+                compact=self.compact, rng=self.rng)
             self._append_view(view, v_add)
         # Create the dimension.
         # XXX Does not handle conditional models; consider moving to view?
@@ -260,6 +323,8 @@ class State(CGpm):
         self._check_partitions()
 
     def incorporate(self, rowid, observation, inputs=None):
+        if self.readonly:
+            raise ValueError('Cannot incorporate into read-only dataset.')
         # XXX Only allow new rows for now.
         if rowid != self.n_rows():
             raise ValueError('Only contiguous rowids supported: %d' % (rowid,))
@@ -289,6 +354,8 @@ class State(CGpm):
         self._check_partitions()
 
     def unincorporate(self, rowid):
+        if self.readonly:
+            raise ValueError('Cannot unincorporate from read-only dataset.')
         # XXX WHATTA HACK. Only permit unincorporate the last rowid, which means
         # we can pop the last entry of each list in self.X without affecting any
         # existing rowids.
@@ -296,17 +363,19 @@ class State(CGpm):
             raise ValueError('Only last rowid may be unincorporated.')
         if self.n_rows() == 1:
             raise ValueError('Cannot unincorporate last rowid.')
-        # Remove the observation from the dataset.
-        for c in self.outputs:
-            self.X[c].pop()
-        # Tell the views.
+        # Tell the views, before removing the observation from the dataset
+        # which compact clusters read it from.
         for v in self.views:
             self.views[v].unincorporate(rowid)
+        for c in self.outputs:
+            self.X[c].pop()
         # Validate.
         self._check_partitions()
 
     # XXX Major hack to force values of NaN cells in incorporated rowids.
     def force_cell(self, rowid, observation):
+        if self.readonly:
+            raise ValueError('Cannot force cells of read-only dataset.')
         if not 0 <= rowid < self.n_rows():
             raise ValueError('Force observation requires existing rowid.')
         if not all(np.isnan(self.X[c][rowid]) for c in observation):
@@ -389,43 +458,67 @@ class State(CGpm):
     # --------------------------------------------------------------------------
     # logpdf
 
+    @tu.profiled_method('State.logpdf')
     def logpdf(self, rowid, targets, constraints=None, inputs=None,
-            accuracy=None):
+            accuracy=None, parallelism=None):
         assert isinstance(targets, dict)
         assert constraints is None or isinstance(constraints, dict)
-        self._validate_cgpm_query(rowid, targets, constraints)
+        with tu.profiled('State._validate_cgpm_query'):
+            self._validate_cgpm_query(rowid, targets, constraints)
         if not self._composite:
             assert not inputs
             return sampling.state_logpdf(self, rowid, targets, constraints)
-        constraints = self._populate_constraints(rowid, targets, constraints)
-        network = self.build_network(accuracy=accuracy)
+        with tu.profiled('State._populate_constraints'):
+            constraints = self._populate_constraints(
+                rowid, targets, constraints)
+        with tu.profiled('State.build_network'):
+            network = self.build_network(
+                accuracy=accuracy, parallelism=parallelism)
         return network.logpdf(rowid, targets, constraints, inputs)
 
     # --------------------------------------------------------------------------
     # Simulate
 
+    @tu.profiled_method('State.simulate')
     def simulate(self, rowid, targets, constraints=None, inputs=None,
-            N=None, accuracy=None):
+            N=None, accuracy=None, parallelism=None):
         assert isinstance(targets, (list, tuple))
         assert inputs is None or isinstance(inputs, dict)
-        self._validate_cgpm_query(rowid, targets, constraints)
+        with tu.profiled('State._validate_cgpm_query'):
+            self._validate_cgpm_query(rowid, targets, constraints)
         if not self._composite:
             assert not inputs
             return sampling.state_simulate(self, rowid, targets, constraints, N)
-        constraints = self._populate_constraints(rowid, targets, constraints)
-        network = self.build_network(accuracy=accuracy)
+        with tu.profiled('State._populate_constraints'):
+            constraints = self._populate_constraints(
+                rowid, targets, constraints)
+        with tu.profiled('State.build_network'):
+            network = self.build_network(
+                accuracy=accuracy, parallelism=parallelism)
         return network.simulate(rowid, targets, constraints, inputs, N)
 
     # --------------------------------------------------------------------------
     # simulate/logpdf helpers
 
-    def build_network(self, accuracy=None):
+    def build_network(self, accuracy=None, parallelism=None):
         if accuracy is None: accuracy=1
-        return ImportanceNetwork(self.build_cgpms(), accuracy, rng=self.rng)
+        graph = self.build_graph()
+        return ImportanceNetwork(graph.cgpms, accuracy, rng=self.rng,
+            graph=graph, parallelism=parallelism)
 
     def build_cgpms(self):
         return [self.views[v] for v in self.views] + self.hooked_cgpms.values()
 
+    def build_graph(self):
+        """Return the CompiledGraph of build_cgpms(), reused until the
+        outputs or inputs of any view or foreign cgpm change."""
+        cgpms = self.build_cgpms()
+        signature = [(id(c), tuple(c.outputs), tuple(c.inputs)) for c in cgpms]
+        if self._graph is None or signature != self._graph_signature:
+            self._graph = CompiledGraph(cgpms)
+            self._graph_signature = signature
+        return self._graph
+
     def _populate_constraints(self, rowid, targets, constraints):
         """Loads constraints from the dataset."""
         constraints = constraints or dict()
@@ -540,8 +633,8 @@ class State(CGpm):
         if self.has_output(col0) and self.has_output(col1):
             return float(self.Zv(col0) == self.Zv(col1))
         Zv = {i: self.Zv(i) for i in self.outputs}
-        cgpms = self.build_cgpms()
-        return State._dependence_probability_composite(cgpms, Zv, col0, col1)
+        graph = self.build_graph()
+        return State._dependence_probability_composite(graph, Zv, col0, col1)
 
     def dependence_probability_pairwise(self, colnos=None):
         if colnos is None:
@@ -554,14 +647,14 @@ class State(CGpm):
         return D
 
     @staticmethod
-    def _dependence_probability_composite(cgpms, Zv, col0, col1):
+    def _dependence_probability_composite(graph, Zv, col0, col1):
         # XXX Conservatively assume all outputs of a particular are dependent.
-        if any(col0 in c.outputs and col1 in c.outputs for c in cgpms):
+        if graph.v_to_c.get(col0, -1) == graph.v_to_c.get(col1, -2):
             return 1.
         # Use the BayesBall algorithm on the cgpm network.
-        ancestors0 = retrieve_ancestors(cgpms, col0) if col0 not in Zv\
+        ancestors0 = graph.ancestors(col0) if col0 not in Zv\
             else [c for c in Zv if Zv[c]==Zv[col0]]
-        ancestors1 = retrieve_ancestors(cgpms, col1) if col1 not in Zv\
+        ancestors1 = graph.ancestors(col1) if col1 not in Zv\
             else [c for c in Zv if Zv[c]==Zv[col1]]
         # Direct common ancestor implies dependent.
         if set.intersection(set(ancestors0), set(ancestors1)):
@@ -623,9 +716,9 @@ class State(CGpm):
         ) if rowid_all else 0
         # Unincorporate hypothetical rows.
         for rowid in reversed(rowid_hypothetical):
+            view.unincorporate(rowid)
             for d in view.dims:
                 self.X[d].pop()
-            view.unincorporate(rowid)
         return int(relevance)
 
     # --------------------------------------------------------------------------
@@ -706,18 +799,16 @@ class State(CGpm):
         return -np.sum(PX) / N
 
     def _partition_mutual_information_query(self, col0, col1, constraints):
-        cgpms = self.build_cgpms()
-        var_to_cgpm = retrieve_variable_to_cgpm(cgpms)
-        connected_components = retrieve_weakly_connected_components(cgpms)
+        graph = self.build_graph()
         blocks = defaultdict(lambda: ([], [], {}))
         for variable in col0:
-            component = connected_components[var_to_cgpm[variable]]
+            component = graph.component(variable)
             blocks[component][0].append(variable)
         for variable in col1:
-            component = connected_components[var_to_cgpm[variable]]
+            component = graph.component(variable)
             blocks[component][1].append(variable)
         for variable in constraints:
-            component = connected_components[var_to_cgpm[variable]]
+            component = graph.component(variable)
             blocks[component][2][variable] = constraints[variable]
         return blocks.values()
 
@@ -726,7 +817,10 @@ class State(CGpm):
 
     def transition(
             self, N=None, S=None, kernels=None, rowids=None,
-            cols=None, views=None, progress=True, checkpoint=None):
+            cols=None, views=None, progress=True, checkpoint=None,
+            multiprocess=0, row_fraction=None, column_fraction=None,
+            column_exact=False, tolerance=None, checkpoint_path=None,
+            checkpoint_offset=0):
         # XXX Many combinations of the above kwargs will cause havoc.
 
         # Check columns exist, silently ignore non-existent columns.
@@ -742,23 +836,61 @@ class State(CGpm):
             ('column_params',
                 lambda : self.transition_dim_params(cols=cols)),
             ('column_hypers',
-                lambda : self.transition_dim_hypers(cols=cols)),
+                lambda : self.transition_dim_hypers(
+                    cols=cols, multiprocess=multiprocess)),
             ('rows',
                 lambda : self.transition_view_rows(
-                    views=views, cols=cols, rows=rowids)),
+                    views=views, cols=cols, rows=rowids,
+                    multiprocess=multiprocess, fraction=row_fraction)),
+            ('rows_parallel',
+                lambda : self.transition_view_rows_parallel(
+                    views=views, cols=cols, rows=rowids,
+                    multiprocess=multiprocess, fraction=row_fraction)),
+            ('rows_split_merge',
+                lambda : self.transition_view_rows_split_merge(
+                    views=views, cols=cols)),
             ('columns' ,
-                lambda : self.transition_dims(cols=cols)),
+                lambda : self.transition_dims(
+                    cols=cols, fraction=column_fraction,
+                    exact=column_exact)),
+            ('columns_pooled' ,
+                lambda : self.transition_dims_pooled(
+                    cols=cols, multiprocess=multiprocess)),
+            ('columns_split_merge' ,
+                lambda : self.transition_dims_split_merge()),
         ])
 
-        # Run all kernels by default.
+        # Run all kernels by default, except the alternative kernels.
         if kernels is None:
-            kernels = _kernel_lookup.keys()
+            kernels = [k for k in _kernel_lookup if k not in [
+                'rows_parallel', 'rows_split_merge',
+                'columns_pooled', 'columns_split_merge',
+            ]]
 
-        kernel_funcs = [_kernel_lookup[k] for k in kernels]
+        kernel_funcs = [self._get_timed_kernel(k, _kernel_lookup[k])
+            for k in kernels]
         assert kernel_funcs
 
-        self._transition_generic(
-            kernel_funcs, N=N, S=S, progress=progress, checkpoint=checkpoint)
+        # Stop once the logscore recorded at checkpoints reaches a plateau.
+        converged = None
+        if tolerance is not None:
+            if not checkpoint:
+                raise ValueError('Convergence tolerance requires checkpoint.')
+            start = self.diagnostics['logscore'].count
+            converged = lambda: self._logscore_converged(start, tolerance)
+
+        # Write the changes since the previous checkpoint to disk.
+        checkpointer = None
+        if checkpoint_path is not None:
+            if not checkpoint:
+                raise ValueError('Checkpoint path requires checkpoint.')
+            from cgpm.crosscat import binary
+            checkpointer = binary.Checkpointer(self, checkpoint_path)
+
+        return self._transition_generic(
+            kernel_funcs, N=N, S=S, progress=progress, checkpoint=checkpoint,
+            converged=converged, checkpointer=checkpointer,
+            checkpoint_offset=checkpoint_offset)
 
     def transition_crp_alpha(self):
         self.crp.transition_hypers()
@@ -775,16 +907,52 @@ class State(CGpm):
         if cols is None:
             cols = self.outputs
         for c in cols:
+            start = time.time()
             self.dim_for(c).transition_params()
+            self._increment_column_seconds(
+                'column_params', c, time.time() - start)
         self._increment_iterations('column_params')
 
-    def transition_dim_hypers(self, cols=None):
+    def transition_dim_hypers(self, cols=None, multiprocess=0):
         if cols is None:
             cols = self.outputs
-        for c in cols:
-            self.dim_for(c).transition_hypers()
+        if multiprocess:
+            self._transition_dim_hypers_multiprocess(cols, multiprocess)
+        else:
+            for c in cols:
+                start = time.time()
+                self.dim_for(c).transition_hypers()
+                self._increment_column_seconds(
+                    'column_hypers', c, time.time() - start)
         self._increment_iterations('column_hypers')
 
+    def _transition_dim_hypers_multiprocess(self, cols, multiprocess):
+        """Transition the hypers of cols in processes which each own a shard
+        of the views, returning only the new hypers of each column."""
+        views = sorted(set(self.Zv(c) for c in cols))
+        seeds = self.rng.randint(low=1, high=2**32-1, size=len(views))
+        view_cols = [[c for c in cols if self.Zv(c) == v] for v in views]
+        def transition_hypers(shard):
+            hypers = {}
+            for seed, cols_v in shard:
+                rng = gu.gen_rng(seed)
+                for c in cols_v:
+                    start = time.time()
+                    dim = self.dim_for(c)
+                    dim.rng = rng
+                    dim.transition_hypers()
+                    hypers[c] = (dim.hypers, time.time() - start)
+            return hypers
+        shards = self._get_shards(zip(seeds, view_cols), multiprocess)
+        mapper = self._get_mapper(multiprocess, len(shards))
+        for hypers in mapper(transition_hypers, shards):
+            for c in hypers:
+                dim = self.dim_for(c)
+                dim.rng = self.rng
+                dim.set_hypers(hypers[c][0])
+                dim.aux_model = dim.create_aux_model()
+                self._increment_column_seconds('column_hypers', c, hypers[c][1])
+
     def transition_dim_grids(self, cols=None):
         if cols is None:
             cols = self.outputs
@@ -792,23 +960,135 @@ class State(CGpm):
             self.dim_for(c).transition_hyper_grids(self.X[c])
         self._increment_iterations('column_grids')
 
-    def transition_view_rows(self, views=None, rows=None, cols=None):
+    def transition_view_rows(
+            self, views=None, rows=None, cols=None, multiprocess=0,
+            fraction=None):
         if self.n_rows() == 1:
             return
         if views is None:
             views = set(self.Zv(col) for col in cols) if cols else self.views
-        for v in views:
-            self.views[v].transition_rows(rows=rows)
+        if fraction is not None:
+            rows = self._get_row_subsample(rows, fraction)
+        if multiprocess:
+            self._transition_view_rows_multiprocess(views, rows, multiprocess)
+        else:
+            for v in views:
+                self.views[v].transition_rows(rows=rows)
         self._increment_iterations('rows')
 
-    def transition_dims(self, cols=None, m=1):
+    def _transition_view_rows_multiprocess(self, views, rows, multiprocess):
+        """Transition the rows of each view in a separate process, using at
+        most `multiprocess` processes (all cpus if multiprocess is 1).
+
+        Every view draws from its own rng, seeded from self.rng, so the result
+        does not depend on the number of processes. Each process returns only
+        the row partition and the clusters of dims which cannot be rebuilt
+        from the partition.
+        """
+        views = sorted(views)
+        seeds = self.rng.randint(low=1, high=2**32-1, size=len(views))
+        def transition_rows((v, seed)):
+            view = self.views[v]
+            view._set_rng(gu.gen_rng(seed))
+            view.transition_rows(rows=rows)
+            return view._get_rows_state()
+        mapper = self._get_mapper(multiprocess, len(views))
+        rows_states = mapper(transition_rows, zip(views, seeds))
+        for v, rows_state in zip(views, rows_states):
+            self.views[v]._set_rows_state(rows_state)
+            self.views[v]._set_rng(self.rng)
+
+    def transition_view_rows_parallel(
+            self, views=None, rows=None, cols=None, multiprocess=0,
+            fraction=None):
+        """Approximate Gibbs on the rows of each view, with the rows of the
+        view split across parallel processes which sweep against a snapshot
+        of the other processes (see View.transition_rows_parallel)."""
+        if self.n_rows() == 1:
+            return
+        if views is None:
+            views = set(self.Zv(col) for col in cols) if cols else self.views
+        if fraction is not None:
+            rows = self._get_row_subsample(rows, fraction)
+        processes = self._get_processes(multiprocess or 1)
+        for v in sorted(views):
+            self.views[v].transition_rows_parallel(rows=rows, shards=processes)
+        self._increment_iterations('rows')
+
+    def transition_view_rows_split_merge(self, views=None, cols=None, N=1):
+        """Split-merge moves on the rows of each view (see
+        View.transition_rows_split_merge)."""
+        if views is None:
+            views = set(self.Zv(col) for col in cols) if cols else self.views
+        for v in sorted(views):
+            self.views[v].transition_rows_split_merge(N=N)
+        self._increment_iterations('rows_split_merge')
+
+    def transition_dims(self, cols=None, m=1, fraction=None, exact=False):
+        """Gibbs on column assignments to views. With fraction, collapsed
+        columns are scored on a random subsample of the rows, drawn once per
+        sweep (see _gibbs_transition_dim_subsample)."""
         if cols is None:
             cols = self.outputs
         cols = self.rng.permutation(cols)
+        if fraction is not None:
+            rows = self._get_row_subsample(None, fraction)
+            for c in cols:
+                self._gibbs_transition_dim_subsample(c, m, rows, exact)
+        else:
+            for c in cols:
+                self._gibbs_transition_dim(c, m)
+        self._increment_iterations('columns')
+
+    def transition_dims_pooled(self, cols=None, m=1, multiprocess=0):
+        """Gibbs on column assignments to views, scoring each column against
+        the view partitions without incorporating it, and with a pool of m
+        auxiliary view partitions shared by all columns in the sweep. An
+        auxiliary partition is replaced by a fresh one whenever a column
+        moves into it. Uncollapsed columns use the standard kernel.
+
+        With multiprocess, the scores of all columns under all views and
+        auxiliary partitions are first computed by processes which each own
+        a shard of the views. Column moves do not change row partitions, so
+        the scores stay exact for the whole sweep.
+        """
+        if cols is None:
+            cols = self.outputs
+        cols = self.rng.permutation(cols)
+        pool = [self._simulate_aux_partition() for _i in xrange(m)]
+        scores = self._dim_get_partition_logps(cols, pool, multiprocess) \
+            if multiprocess else {}
         for c in cols:
-            self._gibbs_transition_dim(c, m)
+            self._gibbs_transition_dim_pooled(c, m, pool, scores)
         self._increment_iterations('columns')
 
+    def transition_dims_split_merge(self, N=1):
+        """Metropolis-Hastings split-merge moves on the column partition,
+        using sequentially allocated proposals (Dahl, 2003).
+
+        Each move picks two columns at random. If they share a view then the
+        view is split in two, by allocating its other columns one at a time to
+        the view or to a new view whose row partition is drawn from the prior.
+        Otherwise the view of the second column is merged into the view of the
+        first. Only available if all dims are collapsed and have no input
+        variables.
+
+        Parameters
+        ----------
+        N : int, optional
+            Number of split-merge moves, default 1.
+        """
+        if any(not d.is_collapsed() or len(d.inputs) > 1 for d in self.dims()):
+            raise ValueError('Split-merge requires collapsed dims.')
+        if self.Cd:
+            raise ValueError(
+                'Cannot transition columns with dependence constraint, '
+                'use State.transition_lovecat.')
+        if len(self.outputs) > 1:
+            for _i in xrange(N):
+                self._split_merge_dims()
+        self._increment_iterations('columns_split_merge')
+
     def transition_lovecat(
             self, N=None, S=None, kernels=None, rowids=None, cols=None,
             progress=None, checkpoint=None):
@@ -855,7 +1135,7 @@ class State(CGpm):
             def kernel():
                 self.hooked_cgpms[token].transition()
                 self._increment_iterations('foreign-%s' % (token,))
-            return kernel
+            return self._get_timed_kernel('foreign-%s' % (token,), kernel)
         kernels= [
             build_transition(token)
             for token in self.hooked_cgpms
@@ -864,7 +1144,8 @@ class State(CGpm):
         self._transition_generic(kernels, N=N, S=S, progress=progress)
 
     def _transition_generic(
-            self, kernels, N=None, S=None, progress=None, checkpoint=None):
+            self, kernels, N=None, S=None, progress=None, checkpoint=None,
+            converged=None, checkpointer=None, checkpoint_offset=0):
 
         def _proportion_done(N, S, iters, start):
             if S is None:
@@ -884,6 +1165,8 @@ class State(CGpm):
 
         iters = 0
         start = time.time()
+        # Whether kernels ran since the checkpointer last wrote.
+        unwritten = False
 
         while True and kernels:
             for kernel in kernels:
@@ -893,25 +1176,87 @@ class State(CGpm):
                 if p >= 1.:
                     break
                 kernel()
+                unwritten = True
             else:
                 iters += 1
-                if checkpoint and (iters % checkpoint == 0):
+                if checkpoint and (checkpoint_offset + iters) % checkpoint == 0:
                     self._increment_diagnostics()
+                    if checkpointer is not None:
+                        checkpointer.write()
+                        unwritten = False
+                    if converged is not None and converged():
+                        break
                 continue
             break
 
+        # Write the iterations after the last checkpoint, so that the state on
+        # disk matches the returned state.
+        if checkpointer is not None and unwritten:
+            checkpointer.write()
+
         if progress:
             print '\rCompleted: %d iterations in %f seconds.' % \
                 (iters, time.time()-start)
 
+        return iters
+
+    def _logscore_converged(self, start, tolerance, window=6):
+        """True if the logscore has reached a plateau over the last window
+        checkpoints retained from checkpoint number start, i.e. the mean
+        logscore of the later half of the window differs from that of the
+        earlier half by at most tolerance, relative to its magnitude."""
+        logscores = self.diagnostics['logscore'].since(start)[-window:]
+        if len(logscores) < window:
+            return False
+        early = np.mean(logscores[:window//2])
+        late = np.mean(logscores[window//2:])
+        return abs(late - early) <= tolerance * abs(np.mean(logscores))
+
     def _increment_iterations(self, kernel, N=1):
         previous = self.diagnostics['iterations'].get(kernel, 0)
         self.diagnostics['iterations'][kernel] = previous + N
 
+    def _increment_timings(self, kernel, seconds):
+        previous = self.diagnostics['seconds'].get(kernel, 0)
+        self.diagnostics['seconds'][kernel] = previous + seconds
+        previous = self.diagnostics['calls'].get(kernel, 0)
+        self.diagnostics['calls'][kernel] = previous + 1
+
+    def _increment_column_seconds(self, kernel, col, seconds):
+        timings = self.diagnostics['column_seconds'].setdefault(kernel, dict())
+        timings[col] = timings.get(col, 0) + seconds
+
+    def _get_timed_kernel(self, name, kernel):
+        """Return kernel, recording its wall time and calls under name."""
+        def timed_kernel():
+            start = time.time()
+            kernel()
+            self._increment_timings(name, time.time() - start)
+        return timed_kernel
+
+    _TRACES = [
+        ('logscore', float, False),
+        ('column_crp_alpha', float, False),
+        ('column_partition', int, True),
+    ]
+
     def _increment_diagnostics(self):
-        self.diagnostics['logscore'].append(self.logpdf_score())
-        self.diagnostics['column_crp_alpha'].append(self.alpha())
-        self.diagnostics['column_partition'].append(self.Zv().items())
+        # Thinned traces skip checkpoints, whose values are not computed.
+        values = {
+            'logscore': self.logpdf_score,
+            'column_crp_alpha': self.alpha,
+            'column_partition': lambda: [self.Zv(c) for c in self.outputs],
+        }
+        for key, value in values.iteritems():
+            trace = self.diagnostics[key]
+            trace.append(value() if trace.records() else None)
+
+    def _column_partition(self, Zv):
+        # Column partitions were formerly recorded as Zv().items().
+        if np.ndim(Zv) == 2:
+            Zv = dict(Zv)
+            return [Zv.get(c, -1) for c in self.outputs]
+        return Zv
 
     def _progress(self, percentage):
         tu.progress(percentage, sys.stdout)
@@ -940,6 +1285,37 @@ class State(CGpm):
         """DistributionGpm distargs of each Dim."""
         return [d.get_distargs() for d in self.dims()]
 
+    def memory_usage(self):
+        """Approximate bytes held by the state, by component.
+
+        Returns a dict with the bytes of the dataset 'X'; the 'data' dicts of
+        the clusters of each Dim; the 'assignments' of rows to clusters and
+        of columns to views; the remaining 'clusters' objects, sufficient
+        statistics and hyperparameters of each Dim and CRP; the
+        'diagnostics'; the 'hooked_cgpms'; everything 'other' in the state;
+        and the 'total'. Objects shared across components (for instance the
+        observations in X, which the cluster data dicts reference) are
+        counted once, in the first component listed above.
+        """
+        seen = set()
+        crps = [self.crp] + [view.crp for view in self.views.itervalues()]
+        dims = self.dims()
+        usage = OrderedDict()
+        usage['X'] = gu.sizeof(self.X, seen)
+        usage['data'] = sum(
+            gu.sizeof(cluster.data, seen)
+            for dim in dims for cluster in dim.clusters.itervalues())
+        usage['assignments'] = sum(
+            gu.sizeof(crp.clusters[0].data, seen) for crp in crps) \
+            + sum(gu.sizeof(dim.Zr, seen) + gu.sizeof(dim.Zi, seen)
+                for dim in dims)
+        usage['clusters'] = sum(gu.sizeof(dim, seen) for dim in dims + crps)
+        usage['diagnostics'] = gu.sizeof(self.diagnostics, seen)
+        usage['hooked_cgpms'] = gu.sizeof(self.hooked_cgpms, seen)
+        usage['other'] = gu.sizeof(self, seen)
+        usage['total'] = sum(usage.values())
+        return usage
+
     # --------------------------------------------------------------------------
     # Helpers for the outputs
 
@@ -1039,6 +1415,76 @@ class State(CGpm):
         view.unincorporate_dim(dim)
         return logp
 
+    def _dim_get_partition_logp(self, view, dim):
+        """Compute logp of the dim data under the view partition, without
+        incorporating dim into view."""
+        Zr = view.Zr()
+        X = self.X[dim.index]
+        return dim.logpdf_score_partition([X[r] for r in Zr], Zr.values())
+
+    def _dim_get_partition_logps(self, cols, pool, multiprocess):
+        """Compute logp of each collapsed column in cols under every view and
+        auxiliary partition in pool, in processes which each own a shard of
+        the partitions. Returns a dict keyed by (col, view) and (col, ('aux',
+        i)) for pool[i]."""
+        cols = [c for c in cols if self.dim_for(c).is_collapsed()]
+        keys = sorted(self.views) + [('aux', i) for i in xrange(len(pool))]
+        def compute_logps(shard):
+            logps = {}
+            for key in shard:
+                if key in self.views:
+                    Zr = self.views[key].Zr()
+                    rowids, clusters = Zr.keys(), Zr.values()
+                else:
+                    clusters = pool[key[1]][1]
+                    rowids = range(len(clusters))
+                for c in cols:
+                    X = self.X[c]
+                    logps[(c, key)] = self.dim_for(c).logpdf_score_partition(
+                        [X[r] for r in rowids], clusters)
+            return logps
+        shards = self._get_shards(keys, multiprocess)
+        mapper = self._get_mapper(multiprocess, len(shards))
+        scores = {}
+        for logps in mapper(compute_logps, shards):
+            scores.update(logps)
+        return scores
+
+    def _get_shards(self, items, multiprocess):
+        """Split items round-robin into one shard per process."""
+        shards = min(len(items), self._get_processes(multiprocess))
+        return [items[i::shards] for i in xrange(shards)]
+
+    def _get_row_subsample(self, rows, fraction):
+        """Return a random subset of rows (all rows if None) with the given
+        fraction of the rows, at least one."""
+        if not 0 < fraction <= 1:
+            raise ValueError('Row fraction must be in (0, 1]: %s' % (fraction,))
+        if rows is None:
+            rows = range(self.n_rows())
+        size = int(np.ceil(fraction * len(rows)))
+        return sorted(self.rng.choice(rows, size=size, replace=False))
+
+    def _get_mapper(self, multiprocess, n_tasks):
+        """Return a map function running n_tasks in parallel processes."""
+        parallelism = min(n_tasks, self._get_processes(multiprocess))
+        if 1 < parallelism:
+            return lambda f, l: parallel_map(f, l, parallelism=parallelism)
+        return map
+
+    def _get_processes(self, multiprocess):
+        """Number of processes for multiprocess (1 means one per cpu)."""
+        if multiprocess is True or multiprocess == 1:
+            return cpu_count()
+        return int(multiprocess)
+
+    def _simulate_aux_partition(self):
+        """Simulate the alpha and row partition of an auxiliary view."""
+        n_rows = self.n_rows()
+        grid = self.crp.model.construct_hyper_grids([1]*n_rows)['alpha']
+        alpha = self.rng.choice(grid)
+        return alpha, gu.simulate_crp_fast(n_rows, alpha, rng=self.rng)
+
     def _dim_get_proposal(self, view, dim):
         """Get a dim object propose to the view."""
         # If collapsed dim, reuse the dim object. Otherwise uncollapsed dim,
@@ -1076,7 +1522,9 @@ class State(CGpm):
         t_aux = tables[len(self.views):]
         dims_proposal_aux = [self._dim_get_proposal(None, dim) for _t in t_aux]
         views_proposal_aux = [
-            View(self.X, outputs=[self.crp_id_view + t], rng=self.rng)
+            View(
+                self.X, outputs=[self.crp_id_view + t],
+                compact=self.compact, rng=self.rng)
             for t in t_aux
         ]
         logp_data_aux = [
@@ -1088,22 +1536,8 @@ class State(CGpm):
         dims_proposal.extend(dims_proposal_aux)
         logp_data.extend(logp_data_aux)
 
-        # Compute the CRP probabilities of each view.
-        logp_crp = self.crp.clusters[0].gibbs_logps(col, m=m)
-        assert len(logp_data) == len(logp_crp)
-
-        # Overall view probabilities.
-        logp_views = np.add(logp_data, logp_crp)
-
-        # Enforce independence constraints.
-        avoid = [a for p in self.Ci if col in p for a in p if a != col]
-        for a in avoid:
-            index = self.views.keys().index(self.Zv(a))
-            logp_views[index] = float('-inf')
-
         # Draw a new view.
-        assert len(tables) == len(logp_views)
-        draw = gu.log_pflip(logp_views, rng=self.rng)
+        draw = self._dim_sample_view(col, m, tables, logp_data)
         v_sampled = tables[draw]
         v_current = self.Zv(col)
 
@@ -1122,6 +1556,208 @@ class State(CGpm):
 
         self._check_partitions()
 
+    def _gibbs_transition_dim_pooled(self, col, m, pool, scores):
+        """Gibbs on col assignment to Views, with auxiliary partitions from
+        pool and precomputed scores (see transition_dims_pooled)."""
+        if any(d.is_conditional() for d in self.dims()):
+            raise ValueError(
+                'Cannot transition columns with conditional dims.')
+        if self.Cd:
+            raise ValueError(
+                'Cannot transition columns with dependence constraint, '
+                'use State.transition_lovecat.')
+
+        dim = self.dim_for(col)
+        if not dim.is_collapsed():
+            return self._gibbs_transition_dim(col, m)
+
+        # Compute logp of the dim under existing and auxiliary partitions.
+        logp_data = [
+            scores[(col, view)] if (col, view) in scores else
+                self._dim_get_partition_logp(self.views[view], dim)
+            for view in self.views
+        ]
+        tables = self.crp.clusters[0].gibbs_tables(col, m=m)
+        t_aux = tables[len(self.views):]
+        logp_data.extend([
+            scores[(col, ('aux', i))] if (col, ('aux', i)) in scores else
+                dim.logpdf_score_partition(self.X[col], Zr)
+            for i, (_alpha, Zr) in enumerate(pool[:len(t_aux)])
+        ])
+
+        # Draw a new view.
+        draw = self._dim_sample_view(col, m, tables, logp_data)
+        v_sampled = tables[draw]
+        v_current = self.Zv(col)
+
+        # Migrate dimension to a new view if necessary, replacing a used
+        # auxiliary partition in the pool.
+        if v_current != v_sampled:
+            if v_sampled > max(self.views):
+                index = draw - len(self.views)
+                alpha, Zr = pool[index]
+                view_aux = View(
+                    self.X, outputs=[self.crp_id_view + v_sampled],
+                    alpha=alpha, Zr=Zr, compact=self.compact, rng=self.rng)
+                self._append_view(view_aux, v_sampled)
+                pool[index] = self._simulate_aux_partition()
+                # Scores under the auxiliary partition now belong to the view.
+                for c, key in scores.keys():
+                    if key == ('aux', index):
+                        scores[(c, v_sampled)] = scores.pop((c, key))
+            self._migrate_dim(v_current, v_sampled, dim)
+
+        self._check_partitions()
+
+    def _gibbs_transition_dim_subsample(self, col, m, rows, exact):
+        """Gibbs on col assignment to Views, scoring the dim on the subsample
+        rows only, scaled up to the number of rows in the state. Uncollapsed
+        columns use the standard kernel.
+
+        If exact, the draw is instead an independence Metropolis-Hastings
+        proposal, which is accepted or rejected against the scores of the
+        current and proposed views on all rows, so the kernel leaves the
+        posterior invariant.
+        """
+        if any(d.is_conditional() for d in self.dims()):
+            raise ValueError(
+                'Cannot transition columns with conditional dims.')
+        if self.Cd:
+            raise ValueError(
+                'Cannot transition columns with dependence constraint, '
+                'use State.transition_lovecat.')
+
+        dim = self.dim_for(col)
+        if not dim.is_collapsed():
+            return self._gibbs_transition_dim(col, m)
+
+        # Row partitions of the existing and auxiliary views.
+        tables = self.crp.clusters[0].gibbs_tables(col, m=m)
+        aux = [self._simulate_aux_partition()
+            for _t in tables[len(self.views):]]
+        partitions = [self.views[v].Zr() for v in self.views]
+        partitions.extend(Zr for _alpha, Zr in aux)
+
+        def get_logp_data(rowids, index):
+            values = [self.X[col][r] for r in rowids]
+            clusters = [partitions[index][r] for r in rowids]
+            return dim.logpdf_score_partition(values, clusters)
+
+        # Draw a new view using the scores on the subsample.
+        scale = float(self.n_rows()) / len(rows)
+        logp_data = [
+            scale * get_logp_data(rows, i) for i in xrange(len(partitions))
+        ]
+        draw = self._dim_sample_view(col, m, tables, logp_data)
+        v_current = self.Zv(col)
+
+        # Accept or reject the draw using the scores on all rows.
+        if exact and tables[draw] != v_current:
+            current = tables.index(v_current)
+            rowids = range(self.n_rows())
+            logp_accept = \
+                get_logp_data(rowids, draw) - logp_data[draw] \
+                - get_logp_data(rowids, current) + logp_data[current]
+            if np.log(self.rng.uniform()) >= logp_accept:
+                draw = current
+        v_sampled = tables[draw]
+
+        # Migrate dimension to a new view if necessary.
+        if v_current != v_sampled:
+            if v_sampled > max(self.views):
+                alpha, Zr = aux[draw - len(self.views)]
+                view_aux = View(
+                    self.X, outputs=[self.crp_id_view + v_sampled],
+                    alpha=alpha, Zr=Zr, compact=self.compact, rng=self.rng)
+                self._append_view(view_aux, v_sampled)
+            self._migrate_dim(v_current, v_sampled, dim)
+
+        self._check_partitions()
+
+    def _split_merge_dims(self):
+        i, j = self.rng.choice(self.outputs, size=2, replace=False)
+        v_i, v_j = self.Zv(i), self.Zv(j)
+        split = v_i == v_j
+        cols = [c for c in self.outputs
+            if self.Zv(c) in [v_i, v_j] and c not in [i, j]]
+        cols = self.rng.permutation(cols)
+
+        # The columns of i keep the view of i, and the columns of j get a new
+        # row partition from the prior in a split, or the view of j in a merge.
+        if split:
+            alpha, Zr_j = self._simulate_aux_partition()
+        else:
+            Zr = self.views[v_j].Zr()
+            Zr_j = [Zr[r] for r in xrange(self.n_rows())]
+        Zr = self.views[v_i].Zr()
+        partitions = ([Zr[r] for r in xrange(self.n_rows())], Zr_j)
+        logp_data = {
+            c: [self.dim_for(c).logpdf_score_partition(self.X[c], Zr)
+                for Zr in partitions]
+            for c in [i, j] + list(cols)
+        }
+
+        # Allocate the columns to the views of i and j, starting from i and j
+        # alone. A split draws each allocation, a merge scores the allocation
+        # which recovers the two current views.
+        groups = ([i], [j])
+        logp_proposal = 0
+        for c in cols:
+            logps = [
+                np.log(len(group)) + logp_data[c][g]
+                for g, group in enumerate(groups)
+            ]
+            g = gu.log_pflip(logps, rng=self.rng) if split \
+                else int(self.Zv(c) == v_j)
+            logp_proposal += logps[g] - gu.logsumexp(logps)
+            groups[g].append(c)
+
+        # Compare the scores of the split and merged views. Independence
+        # constraints forbid merging the views.
+        n_i, n_j = len(groups[0]), len(groups[1])
+        logp_split = \
+            Crp.calc_logpdf_marginal(n_i+n_j, {0: n_i, 1: n_j}, self.alpha()) \
+            + sum(logp_data[c][1] - logp_data[c][0] for c in groups[1])
+        logp_merged = \
+            Crp.calc_logpdf_marginal(n_i+n_j, {0: n_i+n_j}, self.alpha())
+        if any(set(p) & set(groups[0]) and set(p) & set(groups[1])
+                for p in self.Ci):
+            logp_merged = float('-inf')
+        logp_accept = logp_split - logp_merged - logp_proposal if split \
+            else logp_merged - logp_split + logp_proposal
+
+        # Move the columns of j to a new view, or to the view of i.
+        if np.log(self.rng.uniform()) < logp_accept:
+            if split:
+                v_new = max(self.views) + 1
+                view = View(
+                    self.X, outputs=[self.crp_id_view + v_new],
+                    alpha=alpha, Zr=Zr_j, compact=self.compact, rng=self.rng)
+                self._append_view(view, v_new)
+            for c in groups[1]:
+                self._migrate_dim(v_j, v_new if split else v_i, self.dim_for(c))
+        self._check_partitions()
+
+    def _dim_sample_view(self, col, m, tables, logp_data):
+        """Sample the index in tables of a new view for col, given the logp of
+        its data under each table."""
+        # Compute the CRP probabilities of each view.
+        logp_crp = self.crp.clusters[0].gibbs_logps(col, m=m)
+        assert len(logp_data) == len(logp_crp)
+
+        # Overall view probabilities.
+        logp_views = np.add(logp_data, logp_crp)
+
+        # Enforce independence constraints.
+        avoid = [a for p in self.Ci if col in p for a in p if a != col]
+        for a in avoid:
+            index = self.views.keys().index(self.Zv(a))
+            logp_views[index] = float('-inf')
+
+        # Draw a new view.
+        assert len(tables) == len(logp_views)
+        return gu.log_pflip(logp_views, rng=self.rng)
+
     def _migrate_dim(self, v_a, v_b, dim, reassign=None):
         # If `reassign`, then the row partition in `dim` will be force
         # reassigned; if False, then dim.clusters is expected to already match
@@ -1222,7 +1858,14 @@ class State(CGpm):
             metadata['view_alphas'].append((v, view.alpha()))
 
         # Diagnostic data.
-        metadata['diagnostics'] = self.diagnostics
+        metadata['diagnostics'] = dict(self.diagnostics)
+        metadata['diagnostics']['traces'] = dict()
+        for key, _dtype, _ragged in self._TRACES:
+            trace = self.diagnostics[key]
+            metadata['diagnostics'][key] = trace.tolist()
+            metadata['diagnostics']['traces'][key] = trace.to_metadata()
+        metadata['max_checkpoints'] = self.max_checkpoints
+        metadata['thin_checkpoints'] = self.thin_checkpoints
 
         # Hooked CGPMs.
         metadata['hooked_cgpms'] = dict()
@@ -1232,6 +1875,9 @@ class State(CGpm):
         # Path of a Loom project.
         metadata['loom_path'] = self._loom_path
 
+        # Compact mode.
+        metadata['compact'] = self.compact
+
         # Factory data.
         metadata['factory'] = ('cgpm.crosscat.state', 'State')
 
@@ -1261,6 +1907,9 @@ class State(CGpm):
             Ci=metadata.get('Ci', None),
             diagnostics=metadata.get('diagnostics', None),
             loom_path=metadata.get('loom_path', None),
+            compact=metadata.get('compact', False),
+            max_checkpoints=metadata.get('max_checkpoints', None),
+            thin_checkpoints=metadata.get('thin_checkpoints', False),
             rng=rng,
         )
         # Hook up the composed CGPMs.
@@ -1281,6 +1930,21 @@ class State(CGpm):
             metadata = pickle.load(fileptr)
         return cls.from_metadata(metadata, rng=rng)
 
+    def to_binary(self, path):
+        from cgpm.crosscat import binary
+        binary.save_state(self, path)
+
+    def to_checkpoint(self, path, max_deltas=None):
+        """Append the changes since the last checkpoint at path, which
+        from_binary loads, see binary.Checkpointer."""
+        from cgpm.crosscat import binary
+        binary.Checkpointer(self, path, max_deltas=max_deltas).write()
+
+    @classmethod
+    def from_binary(cls, path, rng=None, mmap=False):
+        from cgpm.crosscat import binary
+        return binary.load_state(path, rng=rng, mmap=mmap)
+
 
 from cgpm.crosscat import statedoc
 statedoc.load_docstrings(sys.modules[__name__])
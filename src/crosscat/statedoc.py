@@ -61,6 +61,31 @@ def load_docstrings(module):
             Metadata holding the number of iters each kernel has been run.
         loom_path: str, optional
             Path to a loom project compatible with this State.
+        compact : bool, optional
+            If True, the clusters of collapsed columns keep only sufficient
+            statistics and the rowids of their members, and read observations
+            back from the dataset, which otherwise every cluster duplicates.
+            Collapsed columns also read the cluster of each row from the row
+            partition of their view, keeping only a bitmap of missing values.
+        suffstats : dict(int:dict(int:dict)), optional
+            Sufficient statistics of the clusters of collapsed columns without
+            inputs, keyed by column and then by cluster, which are restored
+            instead of recomputed from the dataset. Requires `Zrv`, see
+            `State.from_binary`.
+        readonly : bool, optional
+            If True, the columns of the dataset are kept as slices of X, which
+            may be a memory-mapped array, and the dataset cannot be modified.
+            Views are constructed on first access, so that queries only pay
+            for the views of the columns they touch.
+        max_checkpoints : int, optional
+            Maximum number of checkpoints whose logscore, column CRP alpha and
+            column partition are retained in `diagnostics`. Once reached, the
+            oldest checkpoint is dropped, unless `thin_checkpoints`. Defaults
+            to retaining every checkpoint.
+        thin_checkpoints : bool, optional
+            If True, once `max_checkpoints` is reached, every other checkpoint
+            is dropped and only every other subsequent checkpoint is recorded,
+            so the retained checkpoints span the whole run.
         rng : np.random.RandomState, optional.
             Source of entropy.
         """
@@ -204,8 +229,18 @@ def load_docstrings(module):
         S : float, optional
             Number of seconds to transition. If both N and S set then min used.
         kernels : list<{'alpha', 'view_alphas', 'column_params', 'column_hypers'
-            'rows', 'columns'}>, optional
-            List of inference kernels to run in this transition. Default all.
+            'rows', 'rows_parallel', 'rows_split_merge', 'columns',
+            'columns_pooled', 'columns_split_merge'}>, optional
+            List of inference kernels to run in this transition. Default all
+            except the alternative kernels: 'rows_parallel', an approximate
+            version of 'rows' which splits the rows of each view across
+            processes that sweep against a stale snapshot of one another,
+            'columns_pooled', an alternative to 'columns' which scores
+            columns from sufficient statistics and shares auxiliary views
+            across the columns of a sweep, and 'rows_split_merge' and
+            'columns_split_merge', which split or merge whole clusters of
+            rows in each view and whole views, and require collapsed
+            columns.
         views, rows, cols : list<int>, optional
             View, row and column numbers to apply the kernels. Default all.
         checkpoint : int, optional
@@ -214,4 +249,58 @@ def load_docstrings(module):
             Defaults to no checkpointing.
         progress : boolean, optional
             Show a progress bar for number of target iterations or elapsed time.
+        multiprocess : int, optional
+            Shard the views across parallel processes, with one rng per view
+            seeded from the state. The 'rows' and 'column_hypers' kernels run
+            within each shard, and 'columns_pooled' exchanges only the scores
+            of each column under each view. The 'rows_parallel' kernel instead
+            splits the rows of each view across the processes, and uses one
+            process per cpu if multiprocess is 0. Use 1 for one process per
+            cpu, or a larger number for the maximum number of processes.
+            Defaults to 0, which runs all kernels serially.
+        row_fraction : float, optional
+            Fraction of the rows, drawn at random in every iteration, which
+            the 'rows' and 'rows_parallel' kernels transition. Defaults to all
+            the rows.
+        column_fraction : float, optional
+            Fraction of the rows, drawn at random in every iteration, on which
+            the 'columns' kernel scores collapsed columns under each view. The
+            scores are scaled up to all rows, so the kernel is approximate
+            unless column_exact is set. Defaults to all the rows.
+        column_exact : boolean, optional
+            Accept or reject each column move proposed from the subsampled
+            scores using the scores on all rows (Metropolis-Hastings), so the
+            'columns' kernel stays exact with column_fraction. Defaults to
+            False.
+        tolerance : float, optional
+            Stop early once the logscore recorded at checkpoints reaches a
+            plateau: over the last six checkpoints of this transition, the
+            mean logscore of the last three differs from that of the first
+            three by at most tolerance, relative to the magnitude of the
+            logscore. Requires checkpoint. N and S still bound the
+            transition. Defaults to no early stopping.
+        checkpoint_path : str, optional
+            Directory to which each checkpoint also writes the changes to the
+            latent state since the previous checkpoint, as deltas appended to
+            a State saved in the binary format (see `State.from_binary` and
+            `binary.Checkpointer`). The end of the transition writes the
+            changes after the last checkpoint too. Requires checkpoint. An
+            existing checkpoint of the same dataset at the path is continued.
+        checkpoint_offset : int, optional
+            Number of iterations already completed by earlier calls which make
+            up one transition, e.g. the slices of `Engine.transition` with
+            timeslice, so that checkpoints continue to fall every checkpoint
+            iterations across the calls. Defaults to 0.
+
+        Returns
+        -------
+        iterations : int
+            Number of completed iterations of all the kernels.
+
+        Notes
+        -----
+        The cumulative wall time and number of calls of each kernel are
+        recorded in `diagnostics['seconds']` and `diagnostics['calls']`, and
+        the wall time of 'column_params' and 'column_hypers' on each column
+        in `diagnostics['column_seconds']`.
         """
@@ -14,6 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
+import bisect
 import math
 
 import numpy as np
@@ -23,6 +25,211 @@ from cgpm.utils import config as cu
 from cgpm.utils import general as gu
 
 
+class CompactData(object):
+    """Observations of a cluster in compact mode.
+
+    A dict-like mapping of rowid to observation, which stores only a sorted
+    array of the rowids of the members, and reads their values from a column
+    of the dataset shared by all clusters, where `column[rowid]` is the value
+    of rowid. Assigned values are ignored, so they must equal the values in
+    column.
+    """
+
+    # Without an instance dict, a cluster with few members stays smaller than
+    # the dict it replaces.
+    __slots__ = ('column', 'rowids')
+
+    def __init__(self, column):
+        self.column = column
+        self.rowids = array.array('l')
+
+    def __getstate__(self):
+        return (self.column, self.rowids)
+
+    def __setstate__(self, state):
+        self.column, self.rowids = state
+
+    def _index(self, rowid):
+        """Return the position of rowid in rowids, or None if absent."""
+        i = bisect.bisect_left(self.rowids, rowid)
+        if i < len(self.rowids) and self.rowids[i] == rowid:
+            return i
+        return None
+
+    def __contains__(self, rowid):
+        return self._index(rowid) is not None
+
+    def __len__(self):
+        return len(self.rowids)
+
+    def __iter__(self):
+        return iter(self.rowids)
+
+    def __getitem__(self, rowid):
+        if rowid not in self:
+            raise KeyError(rowid)
+        return self.column[rowid]
+
+    def __setitem__(self, rowid, value):
+        if rowid not in self:
+            self.rowids.insert(bisect.bisect_left(self.rowids, rowid), rowid)
+
+    def __delitem__(self, rowid):
+        i = self._index(rowid)
+        if i is None:
+            raise KeyError(rowid)
+        self.rowids.pop(i)
+
+    def get(self, rowid, default=None):
+        return self[rowid] if rowid in self else default
+
+    def pop(self, rowid):
+        value = self[rowid]
+        del self[rowid]
+        return value
+
+    def update(self, items):
+        rowids = set(rowid for rowid, _value in items)
+        rowids.update(self.rowids)
+        self.rowids = array.array('l', sorted(rowids))
+
+    def keys(self):
+        return self.rowids.tolist()
+
+    def values(self):
+        return [self.column[rowid] for rowid in self.rowids]
+
+    def items(self):
+        return [(rowid, self.column[rowid]) for rowid in self.rowids]
+
+    def iterkeys(self):
+        return iter(self.rowids)
+
+    def itervalues(self):
+        return (self.column[rowid] for rowid in self.rowids)
+
+    def iteritems(self):
+        return ((rowid, self.column[rowid]) for rowid in self.rowids)
+
+
+class CompactAssignments(object):
+    """Assignments of the rows of a dim to clusters in compact mode.
+
+    The cluster of each row is read from the row partition of the View, a
+    Crp whose data maps rowid to cluster and is shared by all dims of the
+    view, so the dim keeps only an array of codes for its rowids: ABSENT,
+    OBSERVED or MISSING (a missing-value bitmap of the column). The dict-like
+    `observed` and `missing` mappings replace Dim.Zr and Dim.Zi. The number
+    of rowids with each code is kept up to date, so their lengths are O(1),
+    while listing their keys scans the codes in O(N).
+    """
+
+    ABSENT, OBSERVED, MISSING = 0, 1, 2
+
+    def __init__(self, partition):
+        self.partition = partition
+        self.codes = np.zeros(0, dtype=np.int8)
+        # Number of rowids with each code, where the ABSENT entry is unused.
+        self.counts = [0, 0, 0]
+        self.observed = CompactAssignmentsView(self, self.OBSERVED)
+        self.missing = CompactAssignmentsView(self, self.MISSING)
+
+    def code(self, rowid):
+        if 0 <= rowid < len(self.codes):
+            return self.codes[rowid]
+        return self.ABSENT
+
+    def set_codes(self, rowids, code):
+        if len(rowids) == 0:
+            return
+        n = max(rowids) + 1
+        if len(self.codes) < n:
+            codes = np.zeros(max(n, 2*len(self.codes)), dtype=np.int8)
+            codes[:len(self.codes)] = self.codes
+            self.codes = codes
+        if len(rowids) == 1:
+            self.counts[self.codes[rowids[0]]] -= 1
+            self.counts[code] += 1
+        else:
+            rowids = np.unique(rowids)
+            previous = np.bincount(self.codes[rowids], minlength=3)
+            for c, count in enumerate(previous):
+                self.counts[c] -= int(count)
+            self.counts[code] += len(rowids)
+        self.codes[rowids] = code
+
+
+class CompactAssignmentsView(object):
+    """Dict-like mapping of the rowids with a given code in assignments to
+    their clusters in the partition. Assigned clusters are ignored, so they
+    must equal the clusters in the partition."""
+
+    def __init__(self, assignments, code):
+        self.assignments = assignments
+        self.code = code
+
+    def __contains__(self, rowid):
+        return self.assignments.code(rowid) == self.code
+
+    def __len__(self):
+        return self.assignments.counts[self.code]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __eq__(self, other):
+        return dict(self.iteritems()) == dict(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getitem__(self, rowid):
+        if rowid not in self:
+            raise KeyError(rowid)
+        return self.assignments.partition.data[rowid]
+
+    def __setitem__(self, rowid, k):
+        self.assignments.set_codes([rowid], self.code)
+
+    def __delitem__(self, rowid):
+        if rowid not in self:
+            raise KeyError(rowid)
+        self.assignments.set_codes([rowid], self.assignments.ABSENT)
+
+    def get(self, rowid, default=None):
+        return self[rowid] if rowid in self else default
+
+    def pop(self, rowid):
+        k = self[rowid]
+        del self[rowid]
+        return k
+
+    def update(self, items):
+        self.assignments.set_codes(
+            [rowid for rowid, _k in items], self.code)
+
+    def keys(self):
+        """Return the sorted rowids, scanning all the codes in O(N)."""
+        return np.flatnonzero(self.assignments.codes == self.code).tolist()
+
+    def values(self):
+        data = self.assignments.partition.data
+        return [data[rowid] for rowid in self.keys()]
+
+    def items(self):
+        data = self.assignments.partition.data
+        return [(rowid, data[rowid]) for rowid in self.keys()]
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+
 class Dim(CGpm):
     """CGpm representing a homogeneous mixture of univariate CGpm.
 
@@ -86,6 +293,13 @@ class Dim(CGpm):
         self.Zr = {}        # Mapping of non-nan rowids to cluster k.
         self.Zi = {}        # Mapping of nan rowids to cluster k.
 
+        # -- Compact mode ------------------------------------------------------
+        # Column of the dataset and row partition (a Crp) shared with the
+        # View, if collapsed clusters should keep only their sufficient
+        # statistics (see create_aux_model and create_assignments).
+        self.column = None
+        self.partition = None
+
         # -- Auxiliary Singleton ---- ------------------------------------------
         self.aux_model = self.create_aux_model()
 
@@ -105,6 +319,58 @@ class Dim(CGpm):
         else:
             self.Zi[rowid] = k
 
+    def incorporate_bulk(self, rowids, values, clusters, suffstats=None):
+        """Incorporate observation `values[i]` of `rowids[i]` into cluster
+        `clusters[i]`, equivalent to calling incorporate for each row.
+
+        Only available for dims without input variables besides the cluster
+        identity, whose rows can be handed to each cluster as one batch.
+
+        If `suffstats` is given, a dict mapping each cluster to its sufficient
+        statistics (see `DistributionGpm.get_suffstats`), the clusters adopt
+        those statistics and only record their rows, rather than accumulating
+        the statistics from the observations.
+        """
+        if len(self.inputs) > 1:
+            raise ValueError('Dim with inputs requires incorporate per row.')
+        if suffstats is not None and not self.is_collapsed():
+            raise ValueError('Only collapsed dims restore suffstats.')
+        if suffstats is not None and set(suffstats) != set(clusters):
+            raise ValueError('Dim suffstats must match clusters.')
+        if not len(rowids) == len(values) == len(clusters):
+            raise ValueError('Dim bulk incorporate requires equal lengths.')
+        for rowid in rowids:
+            if rowid in self.Zr or rowid in self.Zi:
+                raise ValueError('rowid already incorporated: %d.' % rowid)
+        rowids = np.asarray(rowids)
+        values = np.asarray(values)
+        clusters = np.asarray(clusters)
+        valid = ~np.isnan(values.astype(float))
+        # Group the rows by cluster with a stable sort, and visit the clusters
+        # in order of their first row so that new clusters take the auxiliary
+        # models in the same order as in incorporate.
+        unique, first, index = np.unique(
+            clusters, return_index=True, return_inverse=True)
+        order = np.argsort(index, kind='mergesort')
+        groups = np.split(order, np.cumsum(np.bincount(index))[:-1])
+        for i in np.argsort(first):
+            k = unique[i].item()
+            if k not in self.clusters:
+                self.clusters[k] = self.aux_model
+                self.aux_model = self.create_aux_model()
+            rows = groups[i][valid[groups[i]]]
+            rowids_k = rowids[rows].tolist()
+            if suffstats is None:
+                self.clusters[k].incorporate_bulk(
+                    rowids_k, values[rows].tolist())
+            else:
+                self.clusters[k].set_suffstats(suffstats[k])
+                self.clusters[k].data.update(
+                    zip(rowids_k, values[rows].tolist()))
+            self.Zr.update((rowid, k) for rowid in rowids_k)
+            rows_nan = groups[i][~valid[groups[i]]]
+            self.Zi.update((rowid, k) for rowid in rowids[rows_nan].tolist())
+
     def unincorporate(self, rowid):
         if rowid in self.Zi:
             del self.Zi[rowid]
@@ -121,6 +387,32 @@ class Dim(CGpm):
     def logpdf_score(self):
         return sum(self.clusters[k].logpdf_score() for k in self.clusters)
 
+    def logpdf_score_partition(self, values, clusters):
+        """Return the logpdf_score the dim would have if observation
+        `values[i]` were assigned to cluster `clusters[i]`.
+
+        The dim is not modified; each cluster is scored from the sufficient
+        statistics of a fresh model under the current hypers. Only available
+        for collapsed dims without input variables besides the cluster.
+        """
+        if len(self.inputs) > 1 or not self.is_collapsed():
+            raise ValueError('Dim partition score requires collapsed dim.')
+        values = np.asarray(values, dtype=float)
+        clusters = np.asarray(clusters)
+        valid = ~np.isnan(values)
+        values, clusters = values[valid], clusters[valid]
+        if len(values) == 0:
+            return 0
+        _unique, index = np.unique(clusters, return_inverse=True)
+        order = np.argsort(index, kind='mergesort')
+        groups = np.split(values[order], np.cumsum(np.bincount(index))[:-1])
+        score = 0
+        for group in groups:
+            model = self.create_aux_model()
+            model.incorporate_bulk(range(len(group)), group)
+            score += model.logpdf_score()
+        return score
+
     # --------------------------------------------------------------------------
     # logpdf
 
@@ -192,6 +484,10 @@ class Dim(CGpm):
     def is_collapsed(self):
         return self.model.is_collapsed()
 
+    def is_compact(self):
+        return self.column is not None and self.partition is not None \
+            and self.is_collapsed() and len(self.inputs) == 1
+
     def is_conditional(self):
         return self.model.is_conditional()
 
@@ -225,9 +521,22 @@ class Dim(CGpm):
     # Internal
 
     def create_aux_model(self):
-        return self.model(
+        model = self.model(
             outputs=[self.index], inputs=self.inputs[1:], hypers=self.hypers,
             distargs=self.distargs, rng=self.rng)
+        # In compact mode, collapsed clusters without inputs read their
+        # observations from the shared column instead of keeping a copy.
+        if self.is_compact():
+            model.data = CompactData(self.column)
+        return model
+
+    def create_assignments(self):
+        """Return empty (Zr, Zi), which in compact mode read the clusters of
+        rows from the shared partition."""
+        if self.is_compact():
+            assignments = CompactAssignments(self.partition)
+            return assignments.observed, assignments.missing
+        return {}, {}
 
     def preprocess(self, targets, constraints, inputs):
         inputs2 = inputs.copy()
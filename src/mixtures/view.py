@@ -16,17 +16,22 @@
 
 import itertools
 
+from collections import OrderedDict
 from math import isnan
+from multiprocessing import cpu_count
 
 import numpy as np
 
 from cgpm.cgpm import CGpm
 from cgpm.mixtures.dim import Dim
 from cgpm.network.importance import ImportanceNetwork
+from cgpm.primitives.crp import Crp
 from cgpm.utils import config as cu
 from cgpm.utils import general as gu
+from cgpm.utils import timer as tu
 from cgpm.utils.config import cctype_class
 from cgpm.utils.general import merged
+from cgpm.utils.parallel_map import parallel_map
 
 
 class View(CGpm):
@@ -34,7 +39,8 @@ class View(CGpm):
 
     def __init__(
             self, X, outputs=None, inputs=None, alpha=None,
-            cctypes=None, distargs=None, hypers=None, Zr=None, rng=None):
+            cctypes=None, distargs=None, hypers=None, Zr=None, compact=False,
+            suffstats=None, rng=None):
         """View constructor provides a convenience method for bulk incorporate
         and unincorporate by specifying the data and optional row partition.
 
@@ -60,6 +66,15 @@ class View(CGpm):
             A `len(outputs[1:])` list of hyperparameters.
         Zr : list<int>, optional.
             Row partition, where `Zr[rowid]` is the cluster identity of rowid.
+        compact : bool, optional.
+            If True, the clusters of collapsed dims keep only their sufficient
+            statistics and members, and read observations from X, and the
+            dims read the clusters of rows from the row partition.
+        suffstats : list<dict>, optional.
+            A `len(outputs[1:])` list, whose entry for a collapsed dim without
+            inputs may map each cluster in Zr to its sufficient statistics,
+            which are restored instead of recomputed from X. Entries of None
+            are incorporated from X.
         rng : np.random.RandomState, optional.
             Source of entropy.
         """
@@ -73,6 +88,7 @@ class View(CGpm):
 
         # -- Dataset -----------------------------------------------------------
         self.X = X
+        self.compact = compact
 
         # -- Outputs -----------------------------------------------------------
         if len(outputs) < 1:
@@ -82,9 +98,12 @@ class View(CGpm):
                 distargs = [None] * len(cctypes)
             if not hypers:
                 hypers = [None] * len(cctypes)
+            if not suffstats:
+                suffstats = [None] * len(cctypes)
             assert len(outputs[1:])==len(cctypes)
             assert len(distargs) == len(cctypes)
             assert len(hypers) == len(cctypes)
+            assert len(suffstats) == len(cctypes)
         self.outputs = list(outputs)
 
         # -- Row CRP -----------------------------------------------------------
@@ -97,13 +116,10 @@ class View(CGpm):
         )
         n_rows = len(self.X[self.X.keys()[0]])
         self.crp.transition_hyper_grids([1]*n_rows)
-        if Zr is None:
-            for i in xrange(n_rows):
-                s = self.crp.simulate(i, [self.outputs[0]], None, {-1:0})
-                self.crp.incorporate(i, s, {-1:0})
-        else:
-            for i, z in enumerate(Zr):
-                self.crp.incorporate(i, {self.outputs[0]: z}, {-1:0})
+        if Zr is None and n_rows > 0:
+            Zr = gu.simulate_crp_fast(n_rows, self.alpha(), rng=self.rng)
+        if Zr is not None:
+            self.crp.incorporate_bulk(range(len(Zr)), Zr, [0]*len(Zr))
 
         # -- Dimensions --------------------------------------------------------
         self.dims = dict()
@@ -123,7 +139,7 @@ class View(CGpm):
                 rng=self.rng
             )
             dim.transition_hyper_grids(self.X[c])
-            self.incorporate_dim(dim)
+            self.incorporate_dim(dim, suffstats=suffstats[i])
 
         # -- Validation --------------------------------------------------------
         self._check_partitions()
@@ -131,11 +147,16 @@ class View(CGpm):
     # --------------------------------------------------------------------------
     # Observe
 
-    def incorporate_dim(self, dim, reassign=True):
-        """Incorporate dim into View. If not reassign, partition should match."""
+    def incorporate_dim(self, dim, reassign=True, suffstats=None):
+        """Incorporate dim into View. If not reassign, partition should match.
+        Optional suffstats of the clusters are restored, see View.__init__."""
         dim.inputs[0] = self.outputs[0]
-        if reassign:
-            self._bulk_incorporate(dim)
+        dim.column = self.X[dim.index] if self.compact else None
+        dim.partition = self.crp.clusters[0] if self.compact else None
+        # Compact dims read their assignments from the partition of the view
+        # they belong to, so are always reassigned.
+        if reassign or dim.is_compact():
+            self._bulk_incorporate(dim, suffstats=suffstats)
         self.dims[dim.index] = dim
         self.outputs = self.outputs[:1] + self.dims.keys()
         return dim.logpdf_score()
@@ -251,6 +272,94 @@ class View(CGpm):
         for rowid in rows:
             self._gibbs_transition_row(rowid)
 
+    def transition_rows_parallel(self, rows=None, shards=None):
+        """Approximate Gibbs sweep over rows, with the rows split across
+        parallel processes (as in AD-LDA).
+
+        Each process sweeps its shard of rows against a snapshot of the other
+        shards, and the partitions of all shards are then merged: clusters
+        opened by different shards stay distinct, and the statistics of every
+        dim are rebuilt from the merged partition. Falls back to the exact
+        sequential sweep if any dim is uncollapsed or has input variables,
+        since their clusters cannot be rebuilt from the partition alone.
+
+        Parameters
+        ----------
+        rows : list<int>, optional
+            Rows to transition, defaults to all rows.
+        shards : int, optional
+            Number of parallel processes, defaults to the number of cpus.
+        """
+        if rows is None:
+            rows = self.Zr().keys()
+        if shards is None:
+            shards = cpu_count()
+        shards = min(shards, len(rows))
+        if shards <= 1 or any(not dim.is_collapsed() or len(dim.inputs) > 1
+                for dim in self.dims.itervalues()):
+            return self.transition_rows(rows=rows)
+
+        rows = self.rng.permutation(rows)
+        rows_shards = [rows[i::shards] for i in xrange(shards)]
+        seeds = self.rng.randint(low=1, high=2**32-1, size=shards)
+        tables = set(self.Nk())
+
+        def sweep((rows_shard, seed)):
+            # Runs in a child process, against a copy of the view.
+            self._set_rng(gu.gen_rng(seed))
+            emptied = set()
+            for rowid in rows_shard:
+                k = self.Zr(rowid)
+                self._gibbs_transition_row(rowid)
+                if k in tables and k not in self.Nk():
+                    emptied.add(k)
+            # A table emptied and then reopened in this shard is new.
+            fresh = set(k for k in self.Nk() if k not in tables or k in emptied)
+            return [self.Zr(rowid) for rowid in rows_shard], fresh
+
+        results = parallel_map(
+            sweep, zip(rows_shards, seeds), parallelism=shards)
+
+        # Merge the shards, giving new tables of each shard a global label.
+        Zr = OrderedDict(self.Zr())
+        labels = itertools.count(max(tables) + 1)
+        for rows_shard, (assignments, fresh) in zip(rows_shards, results):
+            relabel = {k: next(labels) for k in sorted(fresh)}
+            for rowid, k in zip(rows_shard, assignments):
+                Zr[rowid] = relabel.get(k, k)
+
+        # Rebuild the row crp and the dims from the merged partition.
+        crp = self.crp.clusters[0]
+        crp.data = OrderedDict()
+        crp.counts = OrderedDict()
+        crp.N = 0
+        crp.incorporate_bulk(Zr.keys(), Zr.values())
+        for dim in self.dims.itervalues():
+            self._bulk_incorporate(dim)
+        self._check_partitions()
+
+    def transition_rows_split_merge(self, N=1):
+        """Metropolis-Hastings split-merge moves on the row partition, using
+        sequentially allocated proposals (Dahl, 2003).
+
+        Each move picks two rows at random. If they share a cluster then the
+        cluster is split in two by allocating its other rows one at a time,
+        otherwise the clusters of the two rows are merged. Only available if
+        all dims are collapsed and have no input variables.
+
+        Parameters
+        ----------
+        N : int, optional
+            Number of split-merge moves, default 1.
+        """
+        if any(not dim.is_collapsed() or len(dim.inputs) > 1
+                for dim in self.dims.itervalues()):
+            raise ValueError('Split-merge requires collapsed dims.')
+        if self.n_rows() < 2:
+            return
+        for _i in xrange(N):
+            self._split_merge_rows()
+
     # --------------------------------------------------------------------------
     # logscore.
 
@@ -272,6 +381,7 @@ class View(CGpm):
     # --------------------------------------------------------------------------
     # logpdf
 
+    @tu.profiled_method('View.logpdf')
     def logpdf(self, rowid, targets, constraints=None, inputs=None):
         # As discussed in https://github.com/probcomp/cgpm/issues/116 for an
         # observed rowid, we synthetize a new hypothetical row which is
@@ -282,11 +392,14 @@ class View(CGpm):
         # either (i) use another rowid, since overriding existing values in the
         # observed rowid no longer specifies that rowid, or (ii) use some
         # sequence of incorporate/unicorporate depending on their query.
-        constraints = self._populate_constraints(rowid, targets, constraints)
+        with tu.profiled('View._populate_constraints'):
+            constraints = self._populate_constraints(
+                rowid, targets, constraints)
         if not self.hypothetical(rowid):
             rowid = None
         # Prepare the importance network.
-        network = self.build_network()
+        with tu.profiled('View.build_network'):
+            network = self.build_network()
         if self.outputs[0] in constraints:
             # Condition on the cluster assignment.
             # p(xT|xC,z=k)                      computed directly by network.
@@ -331,12 +444,16 @@ class View(CGpm):
     # --------------------------------------------------------------------------
     # simulate
 
+    @tu.profiled_method('View.simulate')
     def simulate(self, rowid, targets, constraints=None, inputs=None, N=None):
         # Refer to comment in logpdf.
-        constraints = self._populate_constraints(rowid, targets, constraints)
+        with tu.profiled('View._populate_constraints'):
+            constraints = self._populate_constraints(
+                rowid, targets, constraints)
         if not self.hypothetical(rowid):
             rowid = None
-        network = self.build_network()
+        with tu.profiled('View.build_network'):
+            network = self.build_network()
         # Condition on the cluster assignment.
         if self.outputs[0] in constraints:
             return network.simulate(rowid, targets, constraints, inputs, N)
@@ -428,6 +545,106 @@ class View(CGpm):
             {self.outputs[0]: k})
         self.incorporate(rowid, observation)
 
+    def _split_merge_rows(self):
+        Zr = self.Zr()
+        i, j = self.rng.choice(Zr.keys(), size=2, replace=False)
+        k_i, k_j = Zr[i], Zr[j]
+        split = k_i == k_j
+        rows = [r for r in Zr if Zr[r] in [k_i, k_j] and r not in [i, j]]
+        rows = self.rng.permutation(rows)
+
+        # Allocate the rows to the clusters of i and j, starting from i and j
+        # alone. A split draws each allocation, a merge scores the allocation
+        # which recovers the two current clusters.
+        groups = ([i], [j])
+        models = (self._get_split_merge_models([i]),
+            self._get_split_merge_models([j]))
+        logp_proposal = 0
+        for rowid in rows:
+            logps = [
+                np.log(len(group)) + sum(
+                    model.logpdf(rowid, {c: self.X[c][rowid]})
+                    for c, model in model_group.iteritems()
+                    if not isnan(self.X[c][rowid]))
+                for group, model_group in zip(groups, models)
+            ]
+            g = gu.log_pflip(logps, rng=self.rng) if split \
+                else int(Zr[rowid] == k_j)
+            logp_proposal += logps[g] - gu.logsumexp(logps)
+            groups[g].append(rowid)
+            for c, model in models[g].iteritems():
+                if not isnan(self.X[c][rowid]):
+                    model.incorporate(rowid, {c: self.X[c][rowid]})
+
+        # Compare the scores of the split and merged clusters.
+        n_i, n_j = len(groups[0]), len(groups[1])
+        model_merged = self._get_split_merge_models(groups[0] + groups[1])
+        logp_split = \
+            Crp.calc_logpdf_marginal(n_i+n_j, {0: n_i, 1: n_j}, self.alpha()) \
+            + sum(m.logpdf_score() for g in models for m in g.itervalues())
+        logp_merged = \
+            Crp.calc_logpdf_marginal(n_i+n_j, {0: n_i+n_j}, self.alpha()) \
+            + sum(m.logpdf_score() for m in model_merged.itervalues())
+        logp_accept = logp_split - logp_merged - logp_proposal if split \
+            else logp_merged - logp_split + logp_proposal
+
+        # Move the rows of j to a new cluster, or to the cluster of i.
+        if np.log(self.rng.uniform()) < logp_accept:
+            k = max(self.Nk()) + 1 if split else k_i
+            for rowid in groups[1]:
+                self._migrate_row(rowid, k)
+        self._check_partitions()
+
+    def _get_split_merge_models(self, rowids):
+        """Return fresh models of each dim, incorporating rowids."""
+        models = {c: dim.create_aux_model() for c, dim in self.dims.iteritems()}
+        for c, model in models.iteritems():
+            for rowid in rowids:
+                if not isnan(self.X[c][rowid]):
+                    model.incorporate(rowid, {c: self.X[c][rowid]})
+        return models
+
+    # --------------------------------------------------------------------------
+    # Internal row transition across processes.
+
+    def _get_rows_state(self):
+        """Return the state changed by transition_rows, for reconstruction in
+        another process with _set_rows_state."""
+        crp = self.crp.clusters[0]
+        # Collapsed dims without inputs are rebuilt from the row partition, so
+        # only the remaining dims ship their clusters.
+        dims = {
+            c: (dim.clusters, dim.Zr, dim.Zi, dim.aux_model)
+            for c, dim in self.dims.iteritems()
+            if not (dim.is_collapsed() and len(dim.inputs) == 1)
+        }
+        return {
+            'Zr': crp.data.items(),
+            'counts': crp.counts.items(),
+            'dims': dims,
+        }
+
+    def _set_rows_state(self, rows_state):
+        crp = self.crp.clusters[0]
+        crp.data = OrderedDict(rows_state['Zr'])
+        crp.counts = OrderedDict(rows_state['counts'])
+        for c, dim in self.dims.iteritems():
+            if c in rows_state['dims']:
+                dim.clusters, dim.Zr, dim.Zi, dim.aux_model = \
+                    rows_state['dims'][c]
+            else:
+                self._bulk_incorporate(dim)
+        self._check_partitions()
+
+    def _set_rng(self, rng):
+        """Use rng as the source of entropy for the view and its cgpms."""
+        self.rng = rng
+        for dim in [self.crp] + self.dims.values():
+            dim.rng = rng
+            dim.aux_model.rng = rng
+            for cluster in dim.clusters.itervalues():
+                cluster.rng = rng
+
     # --------------------------------------------------------------------------
     # Internal crp utils.
 
@@ -480,17 +697,31 @@ class View(CGpm):
         cluster = {self.outputs[0]: k}
         return merged(inputs, cluster)
 
-    def _bulk_incorporate(self, dim):
+    def _bulk_incorporate(self, dim, suffstats=None):
         # XXX Major hack! We should really be creating new Dim objects.
         dim.clusters = {}   # Mapping of cluster k to the object.
-        dim.Zr = {}         # Mapping of non-nan rowids to cluster k.
-        dim.Zi = {}         # Mapping of nan rowids to cluster k.
+        dim.Zr, dim.Zi = dim.create_assignments()
         dim.aux_model = dim.create_aux_model()
-        for rowid, k in self.Zr().iteritems():
-            observation = {dim.index: self.X[dim.index][rowid]}
-            inputs = self._get_input_values(rowid, dim, k)
-            dim.incorporate(rowid, observation, inputs)
-        assert merged(dim.Zr, dim.Zi) == self.Zr()
+        if len(dim.inputs) == 1:
+            # Without input variables, each cluster incorporates its rows
+            # in one batch.
+            rowids = self.Zr().keys()
+            X = self.X[dim.index]
+            dim.incorporate_bulk(
+                rowids, [X[rowid] for rowid in rowids], self.Zr().values(),
+                suffstats=suffstats)
+        elif suffstats is not None:
+            raise ValueError('Dim with inputs cannot restore suffstats.')
+        else:
+            for rowid, k in self.Zr().iteritems():
+                observation = {dim.index: self.X[dim.index][rowid]}
+                inputs = self._get_input_values(rowid, dim, k)
+                dim.incorporate(rowid, observation, inputs)
+        if dim.is_compact():
+            # Clusters are read from the partition, so only count the rows.
+            assert len(dim.Zr) + len(dim.Zi) == len(self.Zr())
+        else:
+            assert merged(dim.Zr, dim.Zi) == self.Zr()
         dim.transition_params()
 
     def _validate_cgpm_query(self, rowid, targets, constraints):
@@ -573,6 +804,7 @@ class View(CGpm):
         rowids = sorted(self.Zr().keys())
         metadata['Zr'] = [self.Zr(i) for i in rowids]
         metadata['alpha'] = self.alpha()
+        metadata['compact'] = self.compact
 
         # Column data.
         metadata['cctypes'] = []
@@ -601,4 +833,5 @@ class View(CGpm):
             distargs=metadata.get('distargs', None),
             hypers=metadata.get('hypers', None),
             Zr=metadata.get('Zr', None),
+            compact=metadata.get('compact', False),
             rng=rng)
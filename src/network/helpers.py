@@ -16,8 +16,9 @@
 
 import itertools as it
 
+from collections import deque
+
 import numpy as np
-from scipy.sparse.csgraph import connected_components
 
 
 def validate_cgpms(cgpms):
@@ -41,6 +42,14 @@ def retrieve_adjacency_list(cgpms, v_to_c):
         for i, c in enumerate(cgpms)
     }
 
+def retrieve_children_list(adjacency_list):
+    """Return map of cgpm index to list of indexes of its child cgpms."""
+    children = {i: [] for i in adjacency_list}
+    for i in adjacency_list:
+        for p in adjacency_list[i]:
+            children[p].append(i)
+    return children
+
 def retrieve_adjacency_matrix(cgpms, v_to_c):
     """Return a directed adjacency matrix of cgpms."""
     adjacency_list = retrieve_adjacency_list(cgpms, v_to_c)
@@ -81,16 +90,49 @@ def retrieve_descendents(cgpms, q):
 
 def retrieve_weakly_connected_components(cgpms):
     v_to_c = retrieve_variable_to_cgpm(cgpms)
-    adjacency = retrieve_adjacency_matrix(cgpms, v_to_c)
-    n_components, labels = connected_components(
-        adjacency, directed=True, connection='weak', return_labels=True)
+    parents = retrieve_adjacency_list(cgpms, v_to_c)
+    children = retrieve_children_list(parents)
+    return retrieve_components(parents, children)
+
+
+def retrieve_components(parents, children):
+    """Return labels of weakly connected components, numbered in order of the
+    smallest cgpm index in each component."""
+    labels = -np.ones(len(parents), dtype=int)
+    component = 0
+    for root in sorted(parents):
+        if labels[root] != -1:
+            continue
+        labels[root] = component
+        frontier = deque([root])
+        while frontier:
+            node = frontier.popleft()
+            for neighbor in it.chain(parents[node], children[node]):
+                if labels[neighbor] == -1:
+                    labels[neighbor] = component
+                    frontier.append(neighbor)
+        component += 1
     return labels
 
 
+def retrieve_levels(parents, topo):
+    """Return list of lists of nodes at each depth, given a topological order."""
+    depth = {}
+    levels = []
+    for node in topo:
+        depth[node] = 1 + max([depth[p] for p in parents[node]] or [-1])
+        if depth[node] == len(levels):
+            levels.append([])
+        levels[depth[node]].append(node)
+    return levels
+
+
 def topological_sort(graph):
     """Topologically sort a directed graph represented as an adjacency list.
 
     Assumes that edges are incoming, ie (10: [8,7]) means 8->10 and 7->10.
+    Edges from nodes which are not in the graph are ignored. Uses Kahn's
+    algorithm, which runs in time linear in the number of nodes and edges.
 
     Parameters
     ----------
@@ -104,20 +146,81 @@ def topological_sort(graph):
     graph_sorted : list
         An adjacency list, where order of nodes is in topological order.
     """
-    graph_sorted = []
     graph = dict(graph)
-    while graph:
-        cyclic = True
-        for node, edges in graph.items():
-            if all(e not in graph for e in edges):
-                cyclic = False
-                del graph[node]
-                graph_sorted.append(node)
-        if cyclic:
-            raise ValueError('Cyclic dependency occurred in topological_sort.')
+    indegree = {node: 0 for node in graph}
+    children = {node: [] for node in graph}
+    for node, edges in graph.iteritems():
+        for e in edges:
+            if e in graph:
+                indegree[node] += 1
+                children[e].append(node)
+    frontier = deque(node for node in graph if indegree[node] == 0)
+    graph_sorted = []
+    while frontier:
+        node = frontier.popleft()
+        graph_sorted.append(node)
+        for child in children[node]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                frontier.append(child)
+    if len(graph_sorted) != len(graph):
+        raise ValueError('Cyclic dependency occurred in topological_sort.')
     return graph_sorted
 
 
+class CompiledGraph(object):
+    """Dependency structure of a list of cgpms, computed once and shared.
+
+    Attributes
+    ----------
+    cgpms : list<CGpm>
+        The validated list of cgpms.
+    v_to_c : dict{int:int}
+        Map of each output variable to the index of the cgpm producing it.
+    parents, children : dict{int:list<int>}
+        Map of each cgpm index to the indexes of its parent/child cgpms.
+    extraneous : list<int>
+        Input variables which are not the output of any cgpm.
+    topo : list<int>
+        Indexes of the cgpms in topological order.
+    levels : list<list<int>>
+        Indexes of the cgpms grouped by depth in the graph, so that the
+        parents of every cgpm in levels[i] are in levels[:i].
+    components : np.ndarray
+        Label of the weakly connected component of each cgpm.
+    """
+
+    def __init__(self, cgpms):
+        self.cgpms = validate_cgpms(cgpms)
+        self.v_to_c = retrieve_variable_to_cgpm(self.cgpms)
+        self.parents = retrieve_adjacency_list(self.cgpms, self.v_to_c)
+        self.children = retrieve_children_list(self.parents)
+        self.extraneous = retrieve_extraneous_inputs(self.cgpms, self.v_to_c)
+        self.topo = topological_sort(self.parents)
+        self.levels = retrieve_levels(self.parents, self.topo)
+        self.components = retrieve_components(self.parents, self.children)
+
+    def ancestors(self, q):
+        """Return set of all variables that are ancestors of q."""
+        if q not in self.v_to_c:
+            raise ValueError('Invalid node: %s, %s' % (q, self.v_to_c))
+        ancestors = set()
+        visited = set([self.v_to_c[q]])
+        frontier = deque(visited)
+        while frontier:
+            node = frontier.popleft()
+            ancestors.update(self.cgpms[node].inputs)
+            for parent in self.parents[node]:
+                if parent not in visited:
+                    visited.add(parent)
+                    frontier.append(parent)
+        return ancestors
+
+    def component(self, v):
+        """Return label of the weakly connected component of variable v."""
+        return self.components[self.v_to_c[v]]
+
+
 def retrieve_required_inputs(cgpms, topo, targets, constraints, extraneous):
     """Return list of input addresses required to answer query."""
     required = set(targets)
@@ -14,27 +14,87 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 import itertools
+import os
+import threading
 
+from collections import OrderedDict
 from math import isinf
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
 
 from cgpm.network import helpers as hu
 from cgpm.utils import general as gu
+from cgpm.utils import timer as tu
+
+
+# Thread pools shared by all networks, keyed by process and size. Keying on the
+# process id prevents a forked child from using threads of its parent, whose
+# pools the child drops. The pools of a process are closed at exit.
+_THREAD_POOLS = {}
+_THREAD_POOLS_LOCK = threading.Lock()
+
+def _get_thread_pool(parallelism):
+    pid = os.getpid()
+    with _THREAD_POOLS_LOCK:
+        for key in [k for k in _THREAD_POOLS if k[0] != pid]:
+            del _THREAD_POOLS[key]
+        if (pid, parallelism) not in _THREAD_POOLS:
+            _THREAD_POOLS[(pid, parallelism)] = ThreadPool(parallelism)
+        return _THREAD_POOLS[(pid, parallelism)]
+
+def _close_thread_pools():
+    pid = os.getpid()
+    with _THREAD_POOLS_LOCK:
+        for (owner, _parallelism), pool in _THREAD_POOLS.iteritems():
+            if owner == pid:
+                pool.close()
+                pool.join()
+        _THREAD_POOLS.clear()
+
+atexit.register(_close_thread_pools)
 
 
 class ImportanceNetwork(object):
     """Querier for a Composite CGpm."""
 
-    def __init__(self, cgpms, accuracy=None, rng=None):
+    def __init__(self, cgpms, accuracy=None, rng=None, graph=None,
+            parallelism=None):
+        """Create an ImportanceNetwork.
+
+        Parameters
+        ----------
+        cgpms : list<CGpm>
+            The cgpms which comprise the network.
+        accuracy : int, optional
+            Number of weighted particles used by each query.
+        rng : np.random.RandomState, optional.
+            Source of entropy.
+        graph : network.helpers.CompiledGraph, optional
+            Precompiled graph of `cgpms`.
+        parallelism : int, optional
+            Number of threads used to evaluate cgpms which do not depend on
+            one another (those in the same level of the graph) concurrently.
+            Defaults to evaluating all cgpms serially in topological order.
+            Concurrent evaluation is worthwhile for cgpms whose queries
+            release the GIL or wait on external processes; samples are not
+            reproducible under a fixed seed when cgpms share an rng.
+        """
         if accuracy is None:
             accuracy = 1
+        if graph is None:
+            graph = hu.CompiledGraph(cgpms)
         self.rng = rng if rng else gu.gen_rng(1)
-        self.cgpms = hu.validate_cgpms(cgpms)
+        self.graph = graph
+        self.cgpms = graph.cgpms
         self.accuracy = accuracy
-        self.v_to_c = hu.retrieve_variable_to_cgpm(self.cgpms)
-        self.adjacency = hu.retrieve_adjacency_list(self.cgpms, self.v_to_c)
-        self.extraneous = hu.retrieve_extraneous_inputs(self.cgpms, self.v_to_c)
-        self.topo = hu.topological_sort(self.adjacency)
+        self.v_to_c = graph.v_to_c
+        self.adjacency = graph.parents
+        self.extraneous = graph.extraneous
+        self.topo = graph.topo
+        self.parallelism = parallelism
 
     @gu.simulate_many
     def simulate(self, rowid, targets, constraints=None, inputs=None, N=None):
@@ -42,16 +102,15 @@ class ImportanceNetwork(object):
             constraints = {}
         if inputs is None:
             inputs = {}
-        samples, weights = zip(*[
-            self.weighted_sample(rowid, targets, constraints, inputs)
-            for _i in xrange(self.accuracy)
-        ])
+        samples, weights = self.weighted_samples(
+            rowid, targets, constraints, inputs)
         if all(isinf(l) for l in weights):
             raise ValueError('Zero density constraints: %s' % (constraints,))
-        # Skip an expensive random choice if there is only one option.
-        index = 0 if self.accuracy == 1 else \
-            gu.log_pflip(weights, rng=self.rng)
-        return {q: samples[index][q] for q in targets}
+        with tu.profiled('ImportanceNetwork.assemble'):
+            # Skip an expensive random choice if there is only one option.
+            index = 0 if self.accuracy == 1 else \
+                gu.log_pflip(weights, rng=self.rng)
+            return {q: samples[index][q] for q in targets}
 
     def logpdf(self, rowid, targets, constraints=None, inputs=None):
         if constraints is None:
@@ -59,33 +118,42 @@ class ImportanceNetwork(object):
         if inputs is None:
             inputs = {}
         # Compute joint probability.
-        samples_joint, weights_joint = zip(*[
-            self.weighted_sample(
-                rowid, [], gu.merged(targets, constraints), inputs)
-            for _i in xrange(self.accuracy)
-        ])
-        logp_joint = gu.logmeanexp(weights_joint)
+        samples_joint, weights_joint = self.weighted_samples(
+            rowid, [], gu.merged(targets, constraints), inputs)
         # Compute marginal probability.
-        samples_marginal, weights_marginal = zip(*[
-            self.weighted_sample(rowid, [], constraints, inputs)
-            for _i in xrange(self.accuracy)
-        ]) if constraints else ({}, [0.])
+        samples_marginal, weights_marginal = self.weighted_samples(
+            rowid, [], constraints, inputs) if constraints else ({}, [0.])
         if all(isinf(l) for l in weights_marginal):
             raise ValueError('Zero density constraints: %s' % (constraints,))
-        logp_constraints = gu.logmeanexp(weights_marginal)
-        # Return log ratio.
-        return logp_joint - logp_constraints
+        with tu.profiled('ImportanceNetwork.assemble'):
+            logp_joint = gu.logmeanexp(weights_joint)
+            logp_constraints = gu.logmeanexp(weights_marginal)
+            # Return log ratio.
+            return logp_joint - logp_constraints
+
+    def weighted_samples(self, rowid, targets, constraints, inputs):
+        """Return `self.accuracy` weighted samples, as a list of samples and a
+        list of log weights."""
+        if self.accuracy == 1:
+            sample, weight = self.weighted_sample(
+                rowid, targets, constraints, inputs)
+            return [sample], [weight]
+        return self.weighted_sample_batch(
+            rowid, targets, constraints, inputs, self.accuracy)
 
     def weighted_sample(self, rowid, targets, constraints, inputs):
         targets_required = self.retrieve_required_inputs(targets, constraints)
         targets_all = targets + targets_required
         sample = dict(constraints)
         weight = 0
-        for l in self.topo:
-            sl, wl = self.invoke_cgpm(
-                rowid, self.cgpms[l], targets_all, sample, inputs)
-            sample.update(sl)
-            weight += wl
+        for level in self.schedule():
+            results = self.map_level(
+                lambda l: self.invoke_cgpm(
+                    rowid, self.cgpms[l], targets_all, sample, inputs),
+                level)
+            for sl, wl in results:
+                sample.update(sl)
+                weight += wl
         assert set(sample) == set.union(set(constraints), set(targets_all))
         return sample, weight
 
@@ -103,19 +171,150 @@ class ImportanceNetwork(object):
         cgpm_targets = [q for q in targets if q in cgpm.outputs]
         if cgpm_constraints or cgpm_targets:
             assert all(i in cgpm_inputs for i in cgpm.inputs)
-        weight = cgpm.logpdf(
-            rowid,
-            targets=cgpm_constraints,
-            constraints=None,
-            inputs=cgpm_inputs) if cgpm_constraints else 0
-        sample = cgpm.simulate(
-            rowid,
-            targets=cgpm_targets,
-            constraints=cgpm_constraints,
-            inputs=cgpm_inputs
-            ) if cgpm_targets else {}
+        weight, sample = 0, {}
+        if cgpm_constraints:
+            with tu.profiled(lambda: tu.cgpm_stage(cgpm, 'logpdf')):
+                weight = cgpm.logpdf(
+                    rowid,
+                    targets=cgpm_constraints,
+                    constraints=None,
+                    inputs=cgpm_inputs)
+        if cgpm_targets:
+            with tu.profiled(lambda: tu.cgpm_stage(cgpm, 'simulate')):
+                sample = cgpm.simulate(
+                    rowid,
+                    targets=cgpm_targets,
+                    constraints=cgpm_constraints,
+                    inputs=cgpm_inputs)
         return sample, weight
 
+    def weighted_sample_batch(self, rowid, targets, constraints, inputs, N):
+        """Return N weighted samples, by propagating all N particles through
+        each cgpm in topological order at once.
+
+        Particles which agree on the inputs of a cgpm are served by a single
+        call to its simulate (with N) and logpdf, so a cgpm whose inputs are
+        all fixed by `inputs` or `constraints` is invoked once for all N.
+        Particles with distinct inputs, such as samples of continuous parents,
+        are served by a single call to logpdf_batch and simulate_batch (see
+        invoke_cgpm_batch).
+        """
+        targets_required = self.retrieve_required_inputs(targets, constraints)
+        targets_all = targets + targets_required
+        samples = [dict(constraints) for _i in xrange(N)]
+        weights = np.zeros(N)
+        for level in self.schedule():
+            results = self.map_level(
+                lambda l: self.invoke_cgpm_batch(
+                    rowid, self.cgpms[l], targets_all, samples, inputs),
+                level)
+            for draws, weights_l in results:
+                for sample, draw in zip(samples, draws):
+                    sample.update(draw)
+                weights += weights_l
+        return samples, weights
+
+    def invoke_cgpm_batch(self, rowid, cgpm, targets, samples, inputs):
+        """Return the draws of the targets of cgpm for each particle in
+        samples, and the log density of the constraints of cgpm.
+
+        Particles with distinct inputs are evaluated by one call of the
+        CGpm.logpdf_batch and CGpm.simulate_batch of cgpm, which a cgpm may
+        override to share the work across inputs.
+        """
+        N = len(samples)
+        draws = [{} for _i in xrange(N)]
+        weights = np.zeros(N)
+        # The constraints on outputs of cgpm are the same for every particle,
+        # since the outputs of a cgpm are never sampled by another cgpm.
+        cgpm_constraints = {
+            e:x for e, x in samples[0].iteritems()
+            if e in cgpm.outputs
+        }
+        cgpm_targets = [q for q in targets if q in cgpm.outputs]
+        if not (cgpm_constraints or cgpm_targets):
+            return draws, weights
+        # Group the particles by the values of the inputs to cgpm.
+        groups = OrderedDict()
+        for i, sample in enumerate(samples):
+            cgpm_inputs = {
+                e : x for e, x in
+                    itertools.chain(inputs.iteritems(), sample.iteritems())
+                if e in cgpm.inputs
+            }
+            assert all(e in cgpm_inputs for e in cgpm.inputs)
+            key = tuple(cgpm_inputs[e] for e in cgpm.inputs)
+            if key not in groups:
+                groups[key] = (cgpm_inputs, [])
+            groups[key][1].append(i)
+        if 1 < len(groups):
+            return self.invoke_cgpm_vector(
+                rowid, cgpm, cgpm_targets, cgpm_constraints, groups.values(),
+                draws, weights)
+        # All the particles share the inputs of cgpm.
+        (cgpm_inputs, indexes), = groups.values()
+        if cgpm_constraints:
+            with tu.profiled(lambda: tu.cgpm_stage(cgpm, 'logpdf')):
+                weights[indexes] = cgpm.logpdf(
+                    rowid,
+                    targets=cgpm_constraints,
+                    constraints=None,
+                    inputs=cgpm_inputs)
+        if cgpm_targets:
+            with tu.profiled(lambda: tu.cgpm_stage(cgpm, 'simulate')):
+                samples_group = cgpm.simulate(
+                    rowid,
+                    targets=cgpm_targets,
+                    constraints=cgpm_constraints,
+                    inputs=cgpm_inputs,
+                    N=len(indexes))
+            for i, draw in zip(indexes, samples_group):
+                draws[i] = draw
+        return draws, weights
+
+    def invoke_cgpm_vector(
+            self, rowid, cgpm, targets, constraints, groups, draws, weights):
+        """As invoke_cgpm_batch, for the (inputs, indexes) of each group of
+        particles, in one call of logpdf_batch and of simulate_batch."""
+        inputs_list = [cgpm_inputs for cgpm_inputs, _indexes in groups]
+        if constraints:
+            with tu.profiled(lambda: tu.cgpm_stage(cgpm, 'logpdf_batch')):
+                logps = cgpm.logpdf_batch(
+                    rowid,
+                    targets=constraints,
+                    constraints=None,
+                    inputs_list=inputs_list)
+            for logp, (_inputs, indexes) in zip(logps, groups):
+                weights[indexes] = logp
+        if targets:
+            particles = [
+                (i, cgpm_inputs)
+                for cgpm_inputs, indexes in groups for i in indexes
+            ]
+            with tu.profiled(lambda: tu.cgpm_stage(cgpm, 'simulate_batch')):
+                samples = cgpm.simulate_batch(
+                    rowid,
+                    targets=targets,
+                    constraints=constraints,
+                    inputs_list=[cgpm_inputs for _i, cgpm_inputs in particles])
+            for (i, _inputs), draw in zip(particles, samples):
+                draws[i] = draw
+        return draws, weights
+
+    def schedule(self):
+        """Return the groups of cgpm indexes to evaluate, in order."""
+        if self.parallelism is None or self.parallelism <= 1:
+            return [[l] for l in self.topo]
+        return self.graph.levels
+
+    def map_level(self, function, level):
+        """Apply function to each cgpm index in level, concurrently if the
+        network has parallelism and the level has several cgpms."""
+        if len(level) == 1:
+            return [function(level[0])]
+        return _get_thread_pool(self.parallelism).map(
+            tu.in_query(function), level)
+
     def retrieve_required_inputs(self, targets, constraints):
         """Return list of inputs required to answer query."""
         def retrieve_required_inputs(cgpm, targets):
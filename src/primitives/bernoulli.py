@@ -16,6 +16,8 @@
 
 from math import log
 
+import numpy as np
+
 from scipy.special import betaln
 
 from cgpm.primitives.distribution import DistributionGpm
@@ -52,6 +54,15 @@ class Bernoulli(DistributionGpm):
         self.x_sum += x
         self.data[rowid] = x
 
+    def incorporate_bulk(self, rowids, values):
+        x = self._bulk_observations(rowids, values)
+        invalid = (x != 0) & (x != 1)
+        if np.any(invalid):
+            raise ValueError('Invalid Bernoulli: %s' % str(x[invalid][0]))
+        self.N += len(x)
+        self.x_sum += np.sum(x)
+        self.data.update(zip(rowids, values))
+
     def unincorporate(self, rowid):
         x = self.data.pop(rowid)
         self.N -= 1
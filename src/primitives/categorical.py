@@ -60,8 +60,19 @@ class Categorical(DistributionGpm):
         self.counts[x] += 1
         self.data[rowid] = x
 
+    def incorporate_bulk(self, rowids, values):
+        x = self._bulk_observations(rowids, values)
+        invalid = ~((x % 1 == 0) & (0 <= x) & (x < self.k))
+        if np.any(invalid):
+            raise ValueError(
+                'Invalid Categorical(%d): %s' % (self.k, x[invalid][0]))
+        x = x.astype(int)
+        self.N += len(x)
+        self.counts += np.bincount(x, minlength=self.k)
+        self.data.update(zip(rowids, x.tolist()))
+
     def unincorporate(self, rowid):
-        x = self.data.pop(rowid)
+        x = int(self.data.pop(rowid))
         self.N -= 1
         self.counts[x] -= 1
 
@@ -77,7 +88,7 @@ class Categorical(DistributionGpm):
     def simulate(self, rowid, targets, constraints=None, inputs=None, N=None):
         DistributionGpm.simulate(self, rowid, targets, constraints, inputs, N)
         if rowid in self.data:
-            return {self.outputs[0]: self.data[rowid]}
+            return {self.outputs[0]: int(self.data[rowid])}
         x = gu.pflip(self.counts + self.alpha, rng=self.rng)
         return {self.outputs[0]: x}
 
@@ -104,6 +115,10 @@ class Categorical(DistributionGpm):
     def get_suffstats(self):
         return {'N' : self.N, 'counts' : list(self.counts)}
 
+    def set_suffstats(self, suffstats):
+        self.N = suffstats['N']
+        self.counts = np.array(suffstats['counts'], dtype=float)
+
     def get_distargs(self):
         return {'k': self.k}
 
@@ -17,6 +17,8 @@
 from collections import OrderedDict
 from math import log
 
+import numpy as np
+
 from scipy.special import gammaln
 
 from cgpm.primitives.distribution import DistributionGpm
@@ -51,6 +53,27 @@ class Crp(DistributionGpm):
         self.counts[x] += 1
         self.data[rowid] = x
 
+    def incorporate_bulk(self, rowids, values):
+        # Overrides DistributionGpm.incorporate_bulk to count tables at once.
+        rowids = list(rowids)
+        if len(rowids) != len(values):
+            raise ValueError('Crp requires one table per rowid.')
+        if len(set(rowids)) != len(rowids) \
+                or any(rowid in self.data for rowid in rowids):
+            raise ValueError('Crp rowids already incorporated.')
+        tables = np.asarray(values, dtype=int)
+        if len(tables) == 0:
+            return
+        # Tables are added to counts in order of their first customer, the same
+        # order produced by a sequence of incorporate calls.
+        unique, first, counts = np.unique(
+            tables, return_index=True, return_counts=True)
+        for i in np.argsort(first):
+            x = int(unique[i])
+            self.counts[x] = self.counts.get(x, 0) + int(counts[i])
+        self.data.update(zip(rowids, tables.tolist()))
+        self.N += len(rowids)
+
     def unincorporate(self, rowid):
         x = self.data.pop(rowid)
         self.N -= 1
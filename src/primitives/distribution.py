@@ -14,6 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import numpy as np
+
 from cgpm.cgpm import CGpm
 from cgpm.mixtures.dim import Dim
 from cgpm.utils import general as gu
@@ -52,6 +54,20 @@ class DistributionGpm(CGpm):
         assert not inputs
         assert observation.keys() == self.outputs
 
+    def incorporate_bulk(self, rowids, values):
+        """Incorporate the observations `values[i]` of the output at
+        `rowids[i]`, equivalent to calling incorporate for each pair."""
+        for rowid, x in zip(rowids, values):
+            self.incorporate(rowid, {self.outputs[0]: x})
+
+    def _bulk_observations(self, rowids, values):
+        """Validate arguments of incorporate_bulk, returning values as a np
+        array for subclasses which reduce their sufficient statistics."""
+        assert len(rowids) == len(values)
+        assert len(set(rowids)) == len(rowids)
+        assert not any(rowid in self.data for rowid in rowids)
+        return np.asarray(values, dtype=float)
+
     def logpdf(self, rowid, targets, constraints=None, inputs=None):
         assert rowid not in self.data
         assert not inputs
@@ -101,6 +117,13 @@ class DistributionGpm(CGpm):
         """Return a dictionary of sufficient statistics."""
         raise NotImplementedError
 
+    def set_suffstats(self, suffstats):
+        """Force the sufficient statistics to new values, given as a
+        dictionary with the keys of get_suffstats. Incorporated data is not
+        modified."""
+        for stat, value in suffstats.iteritems():
+            setattr(self, stat, value)
+
     def get_distargs(self):
         """Return a dictionary of distribution arguments."""
         raise NotImplementedError
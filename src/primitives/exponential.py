@@ -16,6 +16,8 @@
 
 from math import log
 
+import numpy as np
+
 from scipy.special import gammaln
 
 from cgpm.primitives.distribution import DistributionGpm
@@ -52,6 +54,14 @@ class Exponential(DistributionGpm):
         self.sum_x += x
         self.data[rowid] = x
 
+    def incorporate_bulk(self, rowids, values):
+        x = self._bulk_observations(rowids, values)
+        if np.any(x < 0):
+            raise ValueError('Invalid Exponential: %s' % str(x[x < 0][0]))
+        self.N += len(x)
+        self.sum_x += np.sum(x)
+        self.data.update(zip(rowids, values))
+
     def unincorporate(self, rowid):
         x = self.data.pop(rowid)
         self.N -= 1
@@ -14,6 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import numpy as np
+
 from scipy.special import betaln
 
 from cgpm.primitives.distribution import DistributionGpm
@@ -53,6 +55,15 @@ class Geometric(DistributionGpm):
         self.sum_x += x
         self.data[rowid] = x
 
+    def incorporate_bulk(self, rowids, values):
+        x = self._bulk_observations(rowids, values)
+        invalid = ~((x % 1 == 0) & (x >= 0))
+        if np.any(invalid):
+            raise ValueError('Invalid Geometric: %s' % str(x[invalid][0]))
+        self.N += len(x)
+        self.sum_x += np.sum(x)
+        self.data.update(zip(rowids, values))
+
     def unincorporate(self, rowid):
         x = self.data.pop(rowid)
         self.N -= 1
@@ -60,6 +60,16 @@ class Lognormal(DistributionGpm):
         self.sum_log_x_sq += log(x) * log(x)
         self.data[rowid] = x
 
+    def incorporate_bulk(self, rowids, values):
+        x = self._bulk_observations(rowids, values)
+        if np.any(x <= 0):
+            raise ValueError('Invalid Lognormal: %s' % str(x[x <= 0][0]))
+        log_x = np.log(x)
+        self.N += len(x)
+        self.sum_log_x += np.sum(log_x)
+        self.sum_log_x_sq += np.sum(log_x * log_x)
+        self.data.update(zip(rowids, values))
+
     def unincorporate(self, rowid):
         x = self.data.pop(rowid)
         self.N -= 1
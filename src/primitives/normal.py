@@ -68,6 +68,13 @@ class Normal(DistributionGpm):
         self.sum_x_sq += x*x
         self.data[rowid] = x
 
+    def incorporate_bulk(self, rowids, values):
+        x = self._bulk_observations(rowids, values)
+        self.N += len(x)
+        self.sum_x += np.sum(x)
+        self.sum_x_sq += np.sum(x*x)
+        self.data.update(zip(rowids, values))
+
     def unincorporate(self, rowid):
         x = self.data.pop(rowid)
         self.N -= 1
@@ -66,6 +66,17 @@ class NormalTrunc(DistributionGpm):
         self.sum_x_sq += x*x
         self.data[rowid] = x
 
+    def incorporate_bulk(self, rowids, values):
+        x = self._bulk_observations(rowids, values)
+        invalid = ~((self.l <= x) & (x <= self.h))
+        if np.any(invalid):
+            raise ValueError('Invalid NormalTrunc(%f,%f): %s'
+                % (self.l, self.h, str(x[invalid][0])))
+        self.N += len(x)
+        self.sum_x += np.sum(x)
+        self.sum_x_sq += np.sum(x*x)
+        self.data.update(zip(rowids, values))
+
     def unincorporate(self, rowid):
         x = self.data.pop(rowid)
         self.N -= 1
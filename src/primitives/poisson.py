@@ -56,6 +56,16 @@ class Poisson(DistributionGpm):
         self.sum_log_fact_x += gammaln(x+1)
         self.data[rowid] = x
 
+    def incorporate_bulk(self, rowids, values):
+        x = self._bulk_observations(rowids, values)
+        invalid = ~((x % 1 == 0) & (x >= 0))
+        if np.any(invalid):
+            raise ValueError('Invalid Poisson: %s' % str(x[invalid][0]))
+        self.N += len(x)
+        self.sum_x += np.sum(x)
+        self.sum_log_fact_x += np.sum(gammaln(x+1))
+        self.data.update(zip(rowids, values))
+
     def unincorporate(self, rowid):
         x = self.data.pop(rowid)
         self.N -= 1
@@ -67,6 +67,16 @@ class Vonmises(DistributionGpm):
         self.sum_cos_x += cos(x)
         self.data[rowid] = x
 
+    def incorporate_bulk(self, rowids, values):
+        x = self._bulk_observations(rowids, values)
+        invalid = ~((0 <= x) & (x <= 2*pi))
+        if np.any(invalid):
+            raise ValueError('Invalid Vonmises: %s' % str(x[invalid][0]))
+        self.N += len(x)
+        self.sum_sin_x += np.sum(np.sin(x))
+        self.sum_cos_x += np.sum(np.cos(x))
+        self.data.update(zip(rowids, values))
+
     def unincorporate(self, rowid):
         x = self.data.pop(rowid)
         self.N -= 1
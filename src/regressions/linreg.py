@@ -26,6 +26,7 @@ import numpy as np
 from numpy.linalg import det
 
 from scipy.special import gammaln
+from scipy.stats import t
 
 from cgpm.cgpm import CGpm
 from cgpm.mixtures.dim import Dim
@@ -128,6 +129,42 @@ class LinearRegression(CGpm):
         x = self.rng.normal(np.dot(yt, b), np.sqrt(sigma2))
         return {self.outputs[0]: x}
 
+    def logpdf_batch(self, rowid, targets, constraints=None, inputs_list=None):
+        """Return the array of the logpdf of targets given each inputs in
+        inputs_list, from the Student-t posterior predictive computed once
+        for all of them."""
+        assert rowid not in self.data.x
+        assert not constraints
+        xt = self.preprocess(targets, inputs_list[0])[0]
+        yts = np.asarray(
+            [self.preprocess(targets, inputs)[1] for inputs in inputs_list])
+        an, bn, mun, Vn_inv = LinearRegression.posterior_hypers(
+            self.N, self.data.Y.values(), self.data.x.values(), self.a,
+            self.b, self.mu, self.V)
+        Vn = np.linalg.inv(Vn_inv)
+        scale2 = bn / an * (1 + np.sum(np.dot(yts, Vn) * yts, axis=1))
+        return t.logpdf(
+            xt, 2*an, loc=np.dot(yts, mun), scale=np.sqrt(scale2))
+
+    def simulate_batch(self, rowid, targets, constraints=None,
+            inputs_list=None):
+        """Return one sample of targets given each inputs in inputs_list,
+        drawing the regression parameters of every sample at once."""
+        assert targets == self.outputs
+        assert not constraints
+        if rowid in self.data.x:
+            return [{self.outputs[0]: self.data.x[rowid]} for _i in inputs_list]
+        yts = np.asarray(
+            [self.preprocess(None, inputs)[1] for inputs in inputs_list])
+        an, bn, mun, Vn_inv = LinearRegression.posterior_hypers(
+            self.N, self.data.Y.values(), self.data.x.values(), self.a,
+            self.b, self.mu, self.V)
+        sigma2 = 1. / self.rng.gamma(an, scale=1./bn, size=len(yts))
+        b = mun + np.sqrt(sigma2)[:,np.newaxis] * self.rng.multivariate_normal(
+            np.zeros(self.p), np.linalg.inv(Vn_inv), size=len(yts))
+        x = self.rng.normal(np.sum(yts * b, axis=1), np.sqrt(sigma2))
+        return [{self.outputs[0]: xi} for xi in x.tolist()]
+
     def logpdf_score(self):
         return LinearRegression.calc_logpdf_marginal(
             self.N, self.data.Y.values(), self.data.x.values(),
@@ -0,0 +1,501 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks of the inference and query hot paths.
+
+Each benchmark times a function over a number of repeats, on a synthetic
+table from cgpm.utils.test.gen_data_table. The results are a JSON document
+which records the parameters of the run and the git commit, so that runs
+on different commits may be compared:
+
+    $ python -m cgpm.utils.benchmark --rows 500 --cols 10 --output old.json
+    $ git checkout ...
+    $ python -m cgpm.utils.benchmark --rows 500 --cols 10 --output new.json
+    $ python -m cgpm.utils.benchmark --compare old.json new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from StringIO import StringIO
+
+import numpy as np
+
+from cgpm.cgpm import CGpm
+from cgpm.crosscat.engine import Engine
+from cgpm.crosscat.state import State
+from cgpm.kde.mvkde import MultivariateKde
+from cgpm.knn.mvknn import MultivariateKnn
+from cgpm.regressions.forest import RandomForest
+from cgpm.regressions.linreg import LinearRegression
+from cgpm.utils import config as cu
+from cgpm.utils import general as gu
+from cgpm.utils import test as tu
+
+
+# Kernels of State.transition timed by default, one benchmark each.
+KERNELS = [
+    'alpha', 'view_alphas', 'column_params', 'column_hypers', 'rows',
+    'columns',
+]
+
+# Groups of benchmarks, in the order they are run.
+GROUPS = ['state', 'view', 'dim', 'query', 'engine', 'serialize', 'cgpm']
+
+# Default cctypes, cycled over the columns of the table.
+CCTYPES = ['normal', 'categorical(k=4)', 'poisson', 'bernoulli']
+
+
+def benchmark(func, repeat=3, setup=None):
+    """Time func over repeat calls.
+
+    Parameters
+    ----------
+    func : callable
+        Function to time. If setup is given, func is called with the value
+        returned by setup, else with no arguments.
+    repeat : int, optional
+        Number of timed calls.
+    setup : callable, optional
+        Untimed function called before each timed call of func.
+
+    Returns
+    -------
+    result : dict
+        The 'seconds' of each call, and their 'min', 'median' and 'mean'.
+    """
+    seconds = []
+    for _i in xrange(repeat):
+        args = (setup(),) if setup is not None else ()
+        start = time.time()
+        func(*args)
+        seconds.append(time.time() - start)
+    return {
+        'seconds': seconds,
+        'min': min(seconds),
+        'median': float(np.median(seconds)),
+        'mean': float(np.mean(seconds)),
+    }
+
+
+def gen_table(rows, cols, cctypes=None, views=2, clusters=3, seed=0):
+    """Return (D, cctypes, distargs) of a synthetic table for benchmarks.
+
+    D has shape (rows, cols), and the cctypes are cycled over the columns.
+    """
+    if cctypes is None:
+        cctypes = CCTYPES
+    cctypes, distargs = cu.parse_distargs(
+        [cctypes[i % len(cctypes)] for i in xrange(cols)])
+    view_weights = [1./views] * views
+    cluster_weights = [[1./clusters] * clusters] * views
+    T, _Zv, _Zc = tu.gen_data_table(
+        rows, view_weights, cluster_weights, cctypes, distargs,
+        [.8] * cols, rng=gu.gen_rng(seed))
+    return np.transpose(T), cctypes, distargs
+
+
+def gen_queries(D, queries, rng):
+    """Return (rowids, targets_list, constraints_list) of random queries.
+
+    Each query targets two cells and constrains a third, in a fresh row,
+    with values copied from a random row of D.
+    """
+    rowids = [-1] * queries
+    targets_list = []
+    constraints_list = []
+    for _i in xrange(queries):
+        row = D[rng.randint(len(D))]
+        cols = rng.choice(D.shape[1], size=min(3, D.shape[1]), replace=False)
+        targets_list.append({c: row[c] for c in cols[:2]})
+        constraints_list.append({c: row[c] for c in cols[2:]})
+    return rowids, targets_list, constraints_list
+
+
+def benchmark_state(state, kernels, repeat):
+    """Time one iteration of each kernel of State.transition."""
+    return {
+        'state.transition.%s' % (kernel,): benchmark(
+            lambda: state.transition(
+                N=1, kernels=[kernel], progress=False, multiprocess=0),
+            repeat=repeat)
+        for kernel in kernels
+    }
+
+
+def benchmark_view(state, repeat):
+    """Time a sweep of View._gibbs_transition_row over the rows of a view."""
+    view = state.views[min(state.views)]
+    def sweep():
+        for rowid in xrange(state.n_rows()):
+            view._gibbs_transition_row(rowid)
+    return {'view.gibbs_transition_row': benchmark(sweep, repeat=repeat)}
+
+
+def benchmark_dim(state, repeat):
+    """Time Dim.transition_hypers of the columns of each cctype."""
+    cctypes = sorted(set(state.cctypes()))
+    def transition_hypers(cctype):
+        for dim in state.dims():
+            if dim.cctype == cctype:
+                dim.transition_hypers()
+    return {
+        'dim.transition_hypers.%s' % (cctype,): benchmark(
+            lambda: transition_hypers(cctype), repeat=repeat)
+        for cctype in cctypes
+    }
+
+
+def benchmark_query(state, D, queries, repeat, rng):
+    """Time State.logpdf_bulk and State.simulate_bulk."""
+    rowids, targets_list, constraints_list = gen_queries(D, queries, rng)
+    return {
+        'state.logpdf_bulk': benchmark(
+            lambda: state.logpdf_bulk(rowids, targets_list, constraints_list),
+            repeat=repeat),
+        'state.simulate_bulk': benchmark(
+            lambda: state.simulate_bulk(
+                rowids, [t.keys() for t in targets_list], constraints_list,
+                Ns=[10] * queries),
+            repeat=repeat),
+    }
+
+
+def benchmark_engine(engine, D, queries, repeat, rng):
+    """Time the fan-out of Engine over its states, serially and in parallel.
+
+    The difference between the serial and parallel timings is the overhead
+    (or gain) of the fork-based parallel map.
+    """
+    rowids, targets_list, constraints_list = gen_queries(D, queries, rng)
+    results = {}
+    for mode, multiprocess in [('serial', 0), ('parallel', 1)]:
+        results['engine.transition.%s' % (mode,)] = benchmark(
+            lambda: engine.transition(
+                N=1, progress=False, multiprocess=multiprocess),
+            repeat=repeat)
+        results['engine.logpdf_bulk.%s' % (mode,)] = benchmark(
+            lambda: engine.logpdf_bulk(
+                rowids, targets_list, constraints_list,
+                multiprocess=multiprocess),
+            repeat=repeat)
+    return results
+
+
+def benchmark_serialize(state, engine, repeat):
+    """Time to_metadata, from_metadata and pickling of State and Engine."""
+    def to_pickle(model):
+        model.to_pickle(StringIO())
+    def pickled(model):
+        fileptr = StringIO()
+        model.to_pickle(fileptr)
+        fileptr.seek(0)
+        return fileptr
+    results = {}
+    for name, model in [('state', state), ('engine', engine)]:
+        Model = type(model)
+        metadata = model.to_metadata()
+        results.update({
+            '%s.to_metadata' % (name,): benchmark(
+                model.to_metadata, repeat=repeat),
+            '%s.from_metadata' % (name,): benchmark(
+                lambda: Model.from_metadata(metadata, rng=gu.gen_rng(0)),
+                repeat=repeat),
+            '%s.to_pickle' % (name,): benchmark(
+                lambda: to_pickle(model), repeat=repeat),
+            '%s.from_pickle' % (name,): benchmark(
+                lambda f: Model.from_pickle(f, rng=gu.gen_rng(0)),
+                repeat=repeat, setup=lambda: pickled(model)),
+        })
+    return results
+
+
+def gen_cgpms(rng):
+    """Return the foreign cgpms to benchmark, keyed by name.
+
+    The cgpms are modeled on the columns [0, 1, 2, 3] of the table from
+    gen_cgpm_table, whose cctypes are normal, normal, categorical(k=3) and
+    normal.
+    """
+    N, C = 'numerical', 'nominal'
+    return {
+        'kde': MultivariateKde(
+            outputs=[0, 1, 2], inputs=None,
+            distargs={'outputs': {
+                'stattypes': [N, N, C],
+                'statargs': [{}, {}, {'k': 3}]}},
+            rng=rng),
+        'knn': MultivariateKnn(
+            outputs=[0, 1, 2], inputs=None, K=10,
+            distargs={'outputs': {
+                'stattypes': [N, N, C],
+                'statargs': [{}, {}, {'k': 3}]}},
+            rng=rng),
+        'linreg': LinearRegression(
+            outputs=[0], inputs=[1, 2, 3],
+            distargs={'inputs': {
+                'stattypes': ['normal', 'categorical', 'normal'],
+                'statargs': [{}, {'k': 3}, {}]}},
+            rng=rng),
+        'forest': RandomForest(
+            outputs=[2], inputs=[0, 1, 3],
+            distargs={
+                'inputs': {
+                    'stattypes': ['normal', 'normal', 'normal'],
+                    'statargs': [{}, {}, {}]},
+                'k': 3},
+            rng=rng),
+    }
+
+
+def gen_cgpm_table(rows, seed=0):
+    """Return a table of shape (rows, 4) for the cgpms from gen_cgpms."""
+    D, _cctypes, _distargs = gen_table(
+        rows, 4, cctypes=['normal', 'normal', 'categorical(k=3)', 'normal'],
+        views=1, seed=seed)
+    return D
+
+
+def benchmark_cgpms(rows, queries, repeat, seed):
+    """Time incorporate, transition, logpdf and simulate of foreign cgpms."""
+    D = gen_cgpm_table(rows, seed=seed)
+    Dq = gen_cgpm_table(queries, seed=seed+1)
+    def incorporate(cgpm):
+        for rowid, row in enumerate(D):
+            cgpm.incorporate(
+                rowid,
+                {i: row[i] for i in cgpm.outputs},
+                {i: row[i] for i in cgpm.inputs})
+        return cgpm
+    def query(cgpm, method):
+        # Regressions are queried on their inputs, and joint models on their
+        # first output constrained on the others.
+        outputs = cgpm.outputs if cgpm.inputs else cgpm.outputs[:1]
+        for row in Dq:
+            targets = {i: row[i] for i in outputs}
+            constraints = {i: row[i] for i in cgpm.outputs[len(outputs):]}
+            inputs = {i: row[i] for i in cgpm.inputs}
+            if method == 'logpdf':
+                cgpm.logpdf(None, targets, constraints, inputs)
+            else:
+                cgpm.simulate(None, outputs, constraints, inputs)
+    results = {}
+    for name in sorted(gen_cgpms(gu.gen_rng(seed))):
+        new_cgpm = lambda: gen_cgpms(gu.gen_rng(seed))[name]
+        results['%s.incorporate' % (name,)] = benchmark(
+            incorporate, repeat=repeat, setup=new_cgpm)
+        cgpm = incorporate(new_cgpm())
+        results['%s.transition' % (name,)] = benchmark(
+            lambda: cgpm.transition(N=1), repeat=repeat)
+        for method in ['logpdf', 'simulate']:
+            results['%s.%s' % (name, method)] = benchmark(
+                lambda: query(cgpm, method), repeat=repeat)
+    return results
+
+
+def benchmark_network(rows, queries, repeat, seed, accuracy=100):
+    """Time the calls which ImportanceNetwork makes to a linreg for the
+    particles of composite queries, whose inputs are distinct samples of the
+    continuous parents of the linreg: one call per query of the logpdf_batch
+    or simulate_batch of the linreg ('batched'), or of their defaults in
+    CGpm, which call logpdf or simulate once per particle ('unbatched')."""
+    D = gen_cgpm_table(rows, seed=seed)
+    Dq = gen_cgpm_table(queries, seed=seed+1)
+    linreg = gen_cgpms(gu.gen_rng(seed))['linreg']
+    for rowid, row in enumerate(D):
+        linreg.incorporate(
+            rowid, {0: row[0]}, {i: row[i] for i in linreg.inputs})
+    inputs_list = [
+        {i: row[i] for i in linreg.inputs}
+        for row in gen_cgpm_table(accuracy, seed=seed+2)
+    ]
+    methods = [
+        ('batched', linreg.logpdf_batch, linreg.simulate_batch),
+        ('unbatched',
+            lambda *args: CGpm.logpdf_batch(linreg, *args),
+            lambda *args: CGpm.simulate_batch(linreg, *args)),
+    ]
+    results = {}
+    for mode, logpdf_batch, simulate_batch in methods:
+        results['network.linreg.logpdf.%s' % (mode,)] = benchmark(
+            lambda: [
+                logpdf_batch(None, {0: row[0]}, None, inputs_list)
+                for row in Dq],
+            repeat=repeat)
+        results['network.linreg.simulate.%s' % (mode,)] = benchmark(
+            lambda: [
+                simulate_batch(None, [0], None, inputs_list)
+                for _row in Dq],
+            repeat=repeat)
+    return results
+
+
+def git_commit():
+    """Return the git commit of the cgpm source tree, or None."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(rows=200, cols=8, cctypes=None, num_states=2, queries=20,
+        repeat=3, seed=0, groups=None, kernels=None):
+    """Run the benchmarks and return the results as a JSON-able dict.
+
+    Parameters
+    ----------
+    rows, cols : int, optional
+        Dimensions of the synthetic table.
+    cctypes : list<str>, optional
+        Cctypes of the columns, cycled over the columns, e.g. 'normal' or
+        'categorical(k=4)'.
+    num_states : int, optional
+        Number of states in the Engine benchmarks.
+    queries : int, optional
+        Number of queries in each logpdf and simulate benchmark.
+    repeat : int, optional
+        Number of timed calls of each benchmark.
+    seed : int, optional
+        Seed of the data and of the models.
+    groups : list<str>, optional
+        Groups of benchmarks to run, from GROUPS (default all).
+    kernels : list<str>, optional
+        Kernels of State.transition to time, default KERNELS.
+
+    Returns
+    -------
+    report : dict
+        The 'params' of the run, the 'commit', 'python' and 'numpy' versions,
+        and the 'results' of each benchmark, keyed by name.
+    """
+    if groups is None:
+        groups = GROUPS
+    if kernels is None:
+        kernels = KERNELS
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        raise ValueError('Unknown benchmark groups: %s' % (sorted(unknown),))
+    if cctypes is None:
+        cctypes = CCTYPES
+
+    rng = gu.gen_rng(seed)
+    D, cctypes_parsed, distargs = gen_table(rows, cols, cctypes, seed=seed)
+    state = State(
+        D, cctypes=cctypes_parsed, distargs=distargs, rng=gu.gen_rng(seed))
+    state.transition(N=1, progress=False)
+    engine = None
+    if 'engine' in groups or 'serialize' in groups:
+        engine = Engine(
+            D, num_states=num_states, cctypes=cctypes_parsed,
+            distargs=distargs, rng=gu.gen_rng(seed))
+        engine.transition(N=1, progress=False)
+
+    results = {}
+    if 'state' in groups:
+        results.update(benchmark_state(state, kernels, repeat))
+    if 'view' in groups:
+        results.update(benchmark_view(state, repeat))
+    if 'dim' in groups:
+        results.update(benchmark_dim(state, repeat))
+    if 'query' in groups:
+        results.update(benchmark_query(state, D, queries, repeat, rng))
+    if 'engine' in groups:
+        results.update(benchmark_engine(engine, D, queries, repeat, rng))
+    if 'serialize' in groups:
+        results.update(benchmark_serialize(state, engine, repeat))
+    if 'cgpm' in groups:
+        results.update(benchmark_cgpms(rows, queries, repeat, seed))
+        results.update(benchmark_network(rows, queries, repeat, seed))
+
+    return {
+        'params': {
+            'rows': rows, 'cols': cols, 'cctypes': list(cctypes),
+            'num_states': num_states, 'queries': queries, 'repeat': repeat,
+            'seed': seed, 'groups': list(groups), 'kernels': list(kernels),
+        },
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'timestamp': time.time(),
+        'results': results,
+    }
+
+
+def compare_benchmarks(old, new, statistic='median'):
+    """Compare the results of two runs of run_benchmarks.
+
+    Returns a list of (name, old seconds, new seconds, new/old ratio) for the
+    benchmarks in both runs, sorted by name, using the given statistic.
+    """
+    names = sorted(set(old['results']) & set(new['results']))
+    comparison = []
+    for name in names:
+        a = old['results'][name][statistic]
+        b = new['results'][name][statistic]
+        ratio = b / a if a > 0 else float('inf')
+        comparison.append((name, a, b, ratio))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the inference and query hot paths of cgpm.')
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--cols', type=int, default=8)
+    parser.add_argument('--cctypes', nargs='+', default=CCTYPES)
+    parser.add_argument('--num-states', type=int, default=2)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--groups', nargs='+', choices=GROUPS, default=GROUPS)
+    parser.add_argument('--kernels', nargs='+', default=KERNELS)
+    parser.add_argument('--output', help='JSON file, default stdout.')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+        help='Compare two JSON files instead of running benchmarks.')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0], 'r') as f:
+            old = json.load(f)
+        with open(args.compare[1], 'r') as f:
+            new = json.load(f)
+        for name, a, b, ratio in compare_benchmarks(old, new):
+            sys.stdout.write(
+                '%-40s %12.6f %12.6f %8.3fx\n' % (name, a, b, ratio))
+        return
+
+    report = run_benchmarks(
+        rows=args.rows, cols=args.cols, cctypes=args.cctypes,
+        num_states=args.num_states, queries=args.queries, repeat=args.repeat,
+        seed=args.seed, groups=args.groups, kernels=args.kernels)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
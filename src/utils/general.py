@@ -17,6 +17,8 @@
 import importlib
 import itertools
 import math
+import sys
+import types
 import warnings
 
 from collections import defaultdict
@@ -122,8 +124,38 @@ def logp_crp_fresh(N, Nk, alpha, m=1):
 
 def log_pflip(logp, array=None, size=None, rng=None):
     """Categorical draw from a vector logp of log probabilities."""
-    p = np.exp(log_normalize(logp))
-    return pflip(p, array=array, size=size, rng=rng)
+    logp = np.asarray(logp, dtype=float)
+    m = np.max(logp) if len(logp) else float('nan')
+    # Degenerate inputs (a single category, NaN or infinite weights) take the
+    # slow path through pflip which reports them.
+    if len(logp) == 1 or not np.isfinite(m):
+        p = np.exp(log_normalize(logp))
+        return pflip(p, array=array, size=size, rng=rng)
+    if rng is None:
+        rng = gen_rng()
+    # Inverse cdf sampling, consuming the same uniforms as rng.choice.
+    cdf = np.cumsum(np.exp(logp - m))
+    cdf /= cdf[-1]
+    index = cdf.searchsorted(rng.random_sample(size), side='right')
+    return index if array is None else np.asarray(array)[index]
+
+def log_pflip_rows(logps, rng=None):
+    """Categorical draw from each row of a matrix logps of log probabilities.
+
+    Returns a np array with one index into the columns of logps per row.
+    """
+    logps = np.asarray(logps, dtype=float)
+    if logps.ndim != 2 or logps.shape[1] == 0:
+        raise ValueError('log_pflip_rows requires a non-empty 2-D array.')
+    m = np.max(logps, axis=1)
+    if not np.all(np.isfinite(m)):
+        raise ValueError('log_pflip_rows requires finite max in every row.')
+    if rng is None:
+        rng = gen_rng()
+    cdf = np.cumsum(np.exp(logps - m[:,np.newaxis]), axis=1)
+    u = rng.random_sample(len(cdf)) * cdf[:,-1]
+    index = np.sum(cdf <= u[:,np.newaxis], axis=1)
+    return np.minimum(index, logps.shape[1] - 1)
 
 def pflip(p, array=None, size=None, rng=None):
     """Categorical draw from a vector p of probabilities."""
@@ -140,28 +172,29 @@ def pflip(p, array=None, size=None, rng=None):
 
 def logsumexp(array):
     # https://github.com/probcomp/bayeslite/blob/master/src/math_util.py
-    if len(array) == 0:
+    array = np.asarray(array, dtype=float)
+    if array.size == 0:
         return float('-inf')
-    m = max(array)
+    m = np.max(array)
 
     # m = +inf means addends are all +inf, hence so are sum and log.
     # m = -inf means addends are all zero, hence so is sum, and log is
     # -inf.  But if +inf and -inf are among the inputs, or if input is
     # NaN, let the usual computation yield a NaN.
-    if math.isinf(m) and min(array) != -m and \
-       all(not math.isnan(a) for a in array):
-        return m
+    if np.isinf(m) and np.min(array) != -m:
+        return float(m)
 
     # Since m = max{a_0, a_1, ...}, it follows that a <= m for all a,
     # so a - m <= 0; hence exp(a - m) is guaranteed not to overflow.
-    return m + math.log(sum(math.exp(a - m) for a in array))
+    with np.errstate(invalid='ignore'):
+        return float(m + np.log(np.sum(np.exp(array - m))))
 
 def logmeanexp(array):
     # https://github.com/probcomp/bayeslite/blob/master/src/math_util.py
-    inf = float('inf')
-    if len(array) == 0:
+    array = np.asarray(array, dtype=float)
+    if array.size == 0:
         # logsumexp will DTRT, but math.log(len(array)) will fail.
-        return -inf
+        return float('-inf')
 
     # Treat -inf values as log 0 -- they contribute zero to the sum in
     # logsumexp, but one to the count.
@@ -173,14 +206,14 @@ def logmeanexp(array):
     #
     # Can't say `a > -inf' because that excludes NaNs, but we want to
     # include them so they propagate.
-    noninfs = [a for a in array if not a == -inf]
+    noninfs = array[array != -np.inf]
 
     # probs = map(exp, logprobs)
     # log(mean(probs)) = log(sum(probs) / len(probs))
     #   = log(sum(probs)) - log(len(probs))
     #   = log(sum(map(exp, logprobs))) - log(len(logprobs))
     #   = logsumexp(logprobs) - log(len(logprobs))
-    return logsumexp(noninfs) - math.log(len(array))
+    return logsumexp(noninfs) - math.log(array.size)
 
 def logmeanexp_weighted(log_A, log_W):
     # https://github.com/probcomp/bayeslite/blob/master/src/math_util.py
@@ -200,6 +233,26 @@ def logmeanexp_weighted(log_A, log_W):
     return logsumexp([log_w + log_a for log_w, log_a in zip(log_W, log_A)]) \
         - logsumexp(log_W)
 
+def split_rhat(chains):
+    """Split potential scale reduction factor R-hat of a list of chains
+    (Gelman et al., Bayesian Data Analysis, 3rd ed., Sec 11.4).
+
+    The chains are truncated to the length of the shortest chain, rounded
+    down to be even, and each chain is split into halves. Returns inf if the
+    chains have fewer than four draws.
+    """
+    n = min(len(chain) for chain in chains) // 2 * 2
+    if n < 4:
+        return float('inf')
+    draws = np.asarray([chain[len(chain)-n:] for chain in chains], dtype=float)
+    halves = draws.reshape(-1, n // 2)
+    B = halves.shape[1] * np.var(np.mean(halves, axis=1), ddof=1)
+    W = np.mean(np.var(halves, axis=1, ddof=1))
+    if W == 0:
+        return 1. if B == 0 else float('inf')
+    var = (halves.shape[1] - 1.) / halves.shape[1] * W + B / halves.shape[1]
+    return float(np.sqrt(var / W))
+
 def log_linspace(a, b, n):
     """linspace from a to b with n entries over log scale."""
     return np.exp(np.linspace(log(a), log(b), n))
@@ -245,6 +298,38 @@ def simulate_crp(N, alpha, rng=None):
     #     rng.shuffle(partition)
     return partition
 
+def simulate_crp_fast(N, alpha, rng=None):
+    """Generates random N-length partition from the CRP with parameter alpha.
+
+    Same distribution as simulate_crp, with tables labeled 0,1,... in order of
+    their first customer, but without a python loop over customers. Customer
+    i sits at a new table with probability alpha/(i+alpha), otherwise at the
+    table of a uniformly chosen earlier customer (which picks an existing
+    table in proportion to its count). All choices are drawn at once, and
+    each customer is resolved to the first customer at its table by pointer
+    jumping.
+    """
+    if rng is None:
+        rng = gen_rng()
+
+    assert N > 0 and alpha > 0.
+    alpha = float(alpha)
+
+    customers = np.arange(N)
+    fresh = rng.uniform(size=N) * (customers + alpha) < alpha
+    fresh[0] = True
+    earlier = np.floor(rng.uniform(size=N) * customers).astype(int)
+    pointer = np.where(fresh, customers, earlier)
+    # Every jump halves the remaining distance to the first customer of the
+    # table, so the number of jumps is logarithmic in the chain depth.
+    while True:
+        jumped = pointer[pointer]
+        if np.array_equal(jumped, pointer):
+            break
+        pointer = jumped
+    labels = np.cumsum(fresh) - 1
+    return labels[pointer].tolist()
+
 def simulate_crp_constrained(N, alpha, Cd, Ci, Rd, Ri, rng=None):
     """Simulates a CRP with N customers and concentration alpha. Cd is a list,
     where each entry is a list of friends. Ci is a list of tuples, where each
@@ -418,3 +503,46 @@ def build_cgpm(metadata, rng):
     module = importlib.import_module(modname)
     builder = getattr(module, attrname)
     return builder.from_metadata(metadata, rng)
+
+
+# Objects which sizeof does not count, nor traverse.
+_SIZEOF_SKIP = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+    types.MethodType, types.ClassType,
+)
+
+def sizeof(obj, seen=None):
+    """Approximate number of bytes held by obj and the objects it references.
+
+    Traverses containers, numpy arrays and the attributes of objects, but
+    not classes, modules or functions. Objects whose id is in seen are not
+    counted, and the ids of counted objects are added to seen, so that
+    several calls sharing seen count every object once.
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SIZEOF_SKIP):
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        if isinstance(o, np.ndarray):
+            # The buffer of a view belongs to its base array.
+            if o.base is not None:
+                stack.append(o.base)
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.iterkeys())
+            stack.extend(o.itervalues())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        if hasattr(o, '__dict__'):
+            stack.append(o.__dict__)
+        slots = getattr(type(o), '__slots__', ())
+        for slot in [slots] if isinstance(slots, str) else slots:
+            if hasattr(o, slot):
+                stack.append(getattr(o, slot))
+    return size
@@ -191,7 +191,7 @@ def plot_logscore(logscores, ax=None):
 
 def engine_to_zmatrix_history(engine, ordering=None):
     num_transitions = len(engine.states[0].diagnostics['column_partition'])
-    Zvs = [[dict(state.diagnostics['column_partition'][i])
+    Zvs = [[dict(zip(state.outputs, state.diagnostics['column_partition'][i]))
         for state in engine.states] for i in xrange(num_transitions)]
 
     # Find the ordering at the final step.
@@ -430,6 +430,56 @@ def restrict_evidence_to_query(query, evidence):
     """Return subset of evidence whose rows are also present in query."""
     return {i: j for i, j in evidence.iteritems() if i in query.keys()}
 
+def gen_clumped_data(n_rows, n_cols, rng):
+    """Return two well separated clumps of rows, with missing cells."""
+    X = np.vstack((
+        rng.normal(loc=-10, size=(n_rows//2, n_cols)),
+        rng.normal(loc=10, size=(n_rows - n_rows//2, n_cols))))
+    X[::7,1] = np.nan
+    return X
+
+def gen_mixed_state(seed, Zv=None):
+    """Return a State with two dependent columns, missing cells, and an
+    uncollapsed normal_trunc column 4."""
+    rng = gu.gen_rng(0)
+    X = rng.normal(size=(50, 5))
+    X[:,1] = X[:,0] + rng.normal(scale=.1, size=50)
+    X[::5,3] = np.nan
+    X[:,4] = rng.uniform(high=5, size=50)
+    return State(
+        X, cctypes=['normal']*4 + ['normal_trunc'],
+        distargs=[None]*4 + [{'l': 0, 'h': 10}], Zv=Zv,
+        rng=gu.gen_rng(seed))
+
+def check_view_consistent(view):
+    """Assert the row partition of view agrees with the assignments, the
+    clusters and the cluster data of its dims."""
+    Zr = view.Zr()
+    Nk = view.Nk()
+    assert set(Nk) == set(Zr.values())
+    for k in Nk:
+        assert Nk[k] == sum(1 for z in Zr.itervalues() if z == k)
+    for dim in view.dims.itervalues():
+        assert gu.merged(dim.Zr, dim.Zi) == Zr
+        assert set(dim.clusters) == set(Nk)
+        for k, cluster in dim.clusters.iteritems():
+            rowids = sorted(r for r in dim.Zr if dim.Zr[r] == k)
+            assert sorted(cluster.data) == rowids
+            assert np.allclose(
+                [cluster.data[r] for r in rowids],
+                [view.X[dim.index][r] for r in rowids])
+
+def check_state_consistent(state):
+    """Assert the column partition of state agrees with its views, and that
+    every view is consistent."""
+    assert sorted(state.Zv()) == sorted(state.outputs)
+    assert set(state.Zv().values()) == set(state.views)
+    for v, view in state.views.iteritems():
+        assert set(view.dims) == \
+            set(c for c in state.outputs if state.Zv(c) == v)
+        assert sorted(view.Zr()) == range(state.n_rows())
+        check_view_consistent(view)
+
 _gen_data = {
     'bernoulli'         : _gen_bernoulli_data,
     'beta'              : _gen_beta_data,
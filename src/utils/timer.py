@@ -14,8 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import threading
 import time
 
+from collections import defaultdict
+from contextlib import contextmanager
+
+
 class Timer(object):
     def __enter__(self):
         self.start = time.time()
@@ -32,3 +38,166 @@ def progress(percentage, stream):
     progress = '[' + '=' * fill + progress[fill:] + ']'
     stream.write('\r{} {:1.2f}%'.format(progress, 100 * percentage))
     stream.flush()
+
+
+# Active query profiles, see profile_queries.
+_PROFILES = []
+
+
+class QueryProfile(object):
+    """Wall time of queries, and of the stages within each query.
+
+    Attributes
+    ----------
+    queries : list<dict>
+        One record per query, with the name of the 'query', its total
+        'seconds', and the 'stages' dict of seconds spent in each stage.
+    seconds : dict
+        Total seconds in each stage (and query) across all queries.
+    calls : dict
+        Total number of calls of each stage (and query).
+
+    Times are inclusive: the time of a stage also counts towards every stage
+    which encloses it. Queries made concurrently by several threads are each
+    credited with the stages of their own thread, and of the threads which
+    run work on their behalf (see in_query).
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.queries = []
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        # In-flight query of each thread.
+        self._queries = {}
+        # Stages may be recorded by the threads of an ImportanceNetwork.
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+            query = self._queries.get(threading.current_thread())
+            if query is not None:
+                stages = query['stages']
+                stages[stage] = stages.get(stage, 0) + seconds
+
+    def _open_query(self, query):
+        with self._lock:
+            if threading.current_thread() in self._queries:
+                return False
+            self._queries[threading.current_thread()] = \
+                {'query': query, 'seconds': 0, 'stages': {}}
+            return True
+
+    def _close_query(self, seconds):
+        with self._lock:
+            query = self._queries.pop(threading.current_thread())
+            query['seconds'] = seconds
+            self.queries.append(query)
+        if self.callback is not None:
+            self.callback(query)
+
+
+@contextmanager
+def profile_queries(callback=None):
+    """Profile the queries made within the block.
+
+    Yields a QueryProfile, which records the time spent in the stages of
+    every query to a State or View (validation, loading constraints from the
+    data, building the network, the logpdf and simulate of each cgpm in the
+    network, and assembling the result). If given, callback is called with
+    the record of each query when it completes.
+    """
+    profile = QueryProfile(callback=callback)
+    _PROFILES.append(profile)
+    try:
+        yield profile
+    finally:
+        _PROFILES.remove(profile)
+
+
+@contextmanager
+def profiled(stage):
+    """Record the wall time of the block as stage in the active profiles.
+
+    The stage is a name, or a function returning the name which is only
+    called if a profile is active."""
+    if not _PROFILES:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.time() - start
+        name = stage() if callable(stage) else stage
+        for profile in list(_PROFILES):
+            profile.record(name, seconds)
+
+
+def in_query(function):
+    """Return function, crediting the stages it records when called in
+    another thread (such as a thread of an ImportanceNetwork) to the queries
+    in flight in the calling thread."""
+    if not _PROFILES:
+        return function
+    caller = threading.current_thread()
+    queries = [
+        (profile, profile._queries.get(caller))
+        for profile in list(_PROFILES)
+    ]
+    @functools.wraps(function)
+    def function_in_query(*args, **kwargs):
+        thread = threading.current_thread()
+        adopted = []
+        for profile, query in queries:
+            with profile._lock:
+                if query is not None and thread not in profile._queries:
+                    profile._queries[thread] = query
+                    adopted.append(profile)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            for profile in adopted:
+                with profile._lock:
+                    del profile._queries[thread]
+    return function_in_query
+
+
+def cgpm_stage(cgpm, method):
+    """Name of the stage for calls of method on cgpm, such as
+    'View[1000000].logpdf', identifying cgpm by its first output."""
+    return '%s[%s].%s' % (type(cgpm).__name__, cgpm.outputs[0], method)
+
+
+def profiled_method(query):
+    """Decorator to profile every call of a method as query (see
+    profiled_query)."""
+    def decorator(method):
+        @functools.wraps(method)
+        def profiled_call(*args, **kwargs):
+            with profiled_query(query):
+                return method(*args, **kwargs)
+        return profiled_call
+    return decorator
+
+
+@contextmanager
+def profiled_query(query):
+    """As profiled, also recording the block as a new query in the active
+    profiles which are not already within a query."""
+    if not _PROFILES:
+        yield
+        return
+    profiles = list(_PROFILES)
+    opened = [p for p in profiles if p._open_query(query)]
+    start = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.time() - start
+        for profile in opened:
+            profile._close_query(seconds)
+        for profile in profiles:
+            profile.record(query, seconds)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+
+class Trace(object):
+    """Values recorded at a sequence of checkpoints, stored in typed arrays.
+
+    Scalar values are stored in a single numpy array of dtype, and ragged
+    values (such as a column partition) as a list of numpy arrays of dtype.
+
+    Without a capacity, the value of every checkpoint is retained. With a
+    capacity, at most capacity values are retained; once full, either the
+    oldest value is dropped (a ring buffer) or, if thin, every other value is
+    dropped and only every other subsequent checkpoint is recorded, so that
+    the retained values span all checkpoints at a decreasing resolution.
+
+    The retained values are those of checkpoints first, first + stride, ...,
+    out of count checkpoints in total.
+    """
+
+    def __init__(self, dtype=float, ragged=False, capacity=None, thin=False):
+        if capacity is not None and capacity < 2:
+            raise ValueError('Trace requires capacity >= 2: %s.' % (capacity,))
+        self.dtype = np.dtype(dtype)
+        self.ragged = ragged
+        self.capacity = capacity
+        self.thin = thin
+        self.count = 0
+        self.stride = 1
+        self.first = 0
+        self.size = 0
+        self._values = [] if ragged else np.zeros(0, dtype=self.dtype)
+
+    @classmethod
+    def from_values(cls, values, count=None, stride=1, first=0, **kwargs):
+        """Return a Trace retaining values, recorded at the checkpoints
+        first, first + stride, ..., out of count (default len(values))."""
+        trace = cls(**kwargs)
+        trace.stride = stride
+        trace.first = first
+        trace.record(values, first + stride * len(values))
+        trace.count = len(values) if count is None else count
+        return trace
+
+    def records(self):
+        """True if the next checkpoint will be recorded; its value need not
+        be computed otherwise."""
+        stride = self.stride
+        if self.thin and self._full():
+            stride *= 2
+        return self.count % stride == 0
+
+    def append(self, value):
+        """Append the value of the next checkpoint, which is discarded unless
+        records()."""
+        if self.records():
+            if self._full():
+                self._drop()
+            self._store(value)
+        self.count += 1
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def record(self, values, count):
+        """Store values of the checkpoints following the last retained one,
+        and set the number of checkpoints to count, e.g. to replay a
+        Trace.since."""
+        for value in values:
+            if self._full():
+                self._drop()
+            self._store(value)
+        self.count = count
+
+    def since(self, count):
+        """Return the retained values of checkpoints count, count + 1, ..."""
+        index = max(0, -(-(count - self.first) // self.stride))
+        return self[index:]
+
+    def tolist(self):
+        if self.ragged:
+            return [value.tolist() for value in self._values]
+        return self._values[:self.size].tolist()
+
+    def to_metadata(self):
+        """Return the position of the retained values, see from_values."""
+        return {'count': self.count, 'stride': self.stride, 'first': self.first}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if self.ragged:
+            return self._values[index]
+        return self._values[:self.size][index].tolist()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __eq__(self, other):
+        if isinstance(other, Trace):
+            other = other.tolist()
+        return self.tolist() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Trace(%s, count=%d, stride=%d, first=%d)' % (
+            self.tolist(), self.count, self.stride, self.first)
+
+    def _full(self):
+        return self.capacity is not None and self.size >= self.capacity
+
+    def _drop(self):
+        if self.thin:
+            # Retain the values of checkpoints which are multiples of twice
+            # the stride, i.e. every other value.
+            offset = (self.first // self.stride) % 2
+            self._keep(slice(offset, self.size, 2))
+            self.first += offset * self.stride
+            self.stride *= 2
+        else:
+            self._keep(slice(1, self.size))
+            self.first += self.stride
+
+    def _keep(self, index):
+        if self.ragged:
+            self._values = self._values[index]
+            self.size = len(self._values)
+        else:
+            values = self._values[index].copy()
+            self.size = len(values)
+            self._values[:self.size] = values
+
+    def _store(self, value):
+        if self.ragged:
+            self._values.append(np.array(value, dtype=self.dtype))
+        else:
+            if self.size == len(self._values):
+                grown = np.zeros(max(1, 2 * self.size), dtype=self.dtype)
+                if self.capacity is not None:
+                    grown = grown[:self.capacity]
+                grown[:self.size] = self._values[:self.size]
+                self._values = grown
+            self._values[self.size] = value
+        self.size += 1
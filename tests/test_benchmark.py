@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pytest
+
+from cgpm.utils import benchmark as bu
+
+
+def test_run_benchmarks_smoke():
+    report = bu.run_benchmarks(
+        rows=20, cols=4, num_states=2, queries=3, repeat=2,
+        groups=['state', 'view', 'dim', 'query', 'serialize'],
+        kernels=['alpha', 'rows'])
+    results = report['results']
+    assert 'state.transition.alpha' in results
+    assert 'state.transition.rows' in results
+    assert 'state.transition.columns' not in results
+    assert 'view.gibbs_transition_row' in results
+    assert 'dim.transition_hypers.normal' in results
+    assert 'state.logpdf_bulk' in results
+    assert 'engine.from_pickle' in results
+    for result in results.itervalues():
+        assert len(result['seconds']) == 2
+        assert result['min'] <= result['median'] <= max(result['seconds'])
+    assert report['params']['rows'] == 20
+    # The report is machine-readable, and comparable with itself.
+    report = json.loads(json.dumps(report))
+    comparison = bu.compare_benchmarks(report, report)
+    assert [c[0] for c in comparison] == sorted(results)
+
+
+def test_benchmark_cgpms_smoke():
+    results = bu.benchmark_cgpms(rows=30, queries=3, repeat=1, seed=0)
+    for name in ['kde', 'knn', 'linreg', 'forest']:
+        for method in ['incorporate', 'transition', 'logpdf', 'simulate']:
+            assert '%s.%s' % (name, method) in results
+
+
+def test_benchmark_network():
+    results = bu.benchmark_network(rows=30, queries=3, repeat=1, seed=0)
+    for method in ['logpdf', 'simulate']:
+        for mode in ['batched', 'unbatched']:
+            assert 'network.linreg.%s.%s' % (method, mode) in results
+
+
+def test_run_benchmarks_unknown_group():
+    with pytest.raises(ValueError):
+        bu.run_benchmarks(rows=10, cols=2, groups=['state', 'bogus'])
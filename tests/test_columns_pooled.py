@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+from cgpm.crosscat.state import State
+from cgpm.utils import general as gu
+from cgpm.utils import test as tu
+
+
+def test_partition_logp_matches_incorporate():
+    rng = gu.gen_rng(1)
+    X = rng.normal(size=(40, 4))
+    X[::5, 1] = np.nan
+    X[:, 3] = rng.randint(0, 3, size=40)
+    state = State(
+        X, cctypes=['normal']*3 + ['categorical'], distargs=[None]*3+[{'k':3}],
+        Zv={0:0, 1:0, 2:1, 3:1}, rng=rng)
+    for col in state.outputs:
+        dim = state.dim_for(col)
+        for v in state.views:
+            view = state.views[v]
+            logp_partition = state._dim_get_partition_logp(view, dim)
+            logp_incorporate = state._dim_get_data_logp(view, dim)
+            state.view_for(col).incorporate_dim(dim, reassign=True)
+            assert np.allclose(logp_partition, logp_incorporate)
+    # The partition score does not modify the dim.
+    dim = state.dim_for(1)
+    Zr, clusters = dict(dim.Zr), set(dim.clusters)
+    state._dim_get_partition_logp(state.views[1], dim)
+    assert dim.Zr == Zr and set(dim.clusters) == clusters
+
+
+def test_columns_pooled_two_views():
+    rng = gu.gen_rng(4)
+    T, Zv, _Zc = tu.gen_data_table(
+        150, [.5, .5], [[.5, .5], [.2, .3, .5]], ['normal']*6, [None]*6,
+        [.95]*6, rng=rng)
+    state = State(T.T, cctypes=['normal']*6, Zv={i:0 for i in xrange(6)},
+        rng=rng)
+    state.transition(
+        N=20, kernels=['rows', 'view_alphas', 'columns_pooled'],
+        progress=False)
+    assert state.diagnostics['iterations']['columns'] == 20
+    for i in xrange(6):
+        for j in xrange(6):
+            assert (state.Zv(i) == state.Zv(j)) == (Zv[i] == Zv[j])
+
+
+def test_columns_pooled_uncollapsed():
+    # Uncollapsed columns use the standard column kernel.
+    rng = gu.gen_rng(3)
+    X = rng.uniform(size=(20, 3))
+    state = State(
+        X, cctypes=['normal', 'beta', 'normal'], Zv={0:0, 1:1, 2:2}, rng=rng)
+    state.transition(N=5, kernels=['columns_pooled'], progress=False)
+    assert sorted(state.Zv()) == [0, 1, 2]
+    assert set(state.Zv().values()) == set(state.views)
+
+
+def test_partition_logps_sharded():
+    rng = gu.gen_rng(5)
+    X = rng.normal(size=(30, 5))
+    state = State(
+        X, cctypes=['normal']*5, Zv={0:0, 1:0, 2:1, 3:2, 4:2}, rng=rng)
+    pool = [state._simulate_aux_partition() for _i in xrange(2)]
+    scores = state._dim_get_partition_logps(state.outputs, pool, 3)
+    assert len(scores) == 5 * (3 + 2)
+    for c in state.outputs:
+        dim = state.dim_for(c)
+        for v in state.views:
+            assert np.allclose(
+                scores[(c, v)],
+                state._dim_get_partition_logp(state.views[v], dim))
+        for i, (_alpha, Zr) in enumerate(pool):
+            assert np.allclose(
+                scores[(c, ('aux', i))],
+                dim.logpdf_score_partition(state.X[c], Zr))
+
+
+def test_columns_pooled_multiprocess():
+    # Precomputed scores give the same chain as scoring on demand.
+    def make_state():
+        X = gu.gen_rng(6).normal(size=(30, 6))
+        return State(X, cctypes=['normal']*6, rng=gu.gen_rng(7))
+    state_serial = make_state()
+    state_sharded = make_state()
+    state_serial.transition(N=4, kernels=['columns_pooled'], progress=False)
+    state_sharded.transition(
+        N=4, kernels=['columns_pooled'], multiprocess=2, progress=False)
+    assert state_serial.Zv() == state_sharded.Zv()
+    assert np.allclose(
+        state_serial.logpdf_score(), state_sharded.logpdf_score())
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from cgpm.crosscat.engine import Engine
+from cgpm.crosscat.state import State
+from cgpm.mixtures.dim import CompactAssignments
+from cgpm.mixtures.dim import CompactData
+from cgpm.utils import general as gu
+from cgpm.utils import test as tu
+
+
+CCTYPES, DISTARGS = ['normal', 'categorical', 'poisson', 'bernoulli'], \
+    [None, {'k': 3}, None, None]
+
+
+def gen_data(rng):
+    T, _Zv, _Zc = tu.gen_data_table(
+        40, [.5, .5], [[.5, .5], [.3, .7]], CCTYPES, DISTARGS, [.8]*4,
+        rng=rng)
+    return T.T
+
+
+def test_compact_data():
+    column = [.5, 1.5, 2.5, 3.5]
+    data = CompactData(column)
+    data[1] = 1.5
+    data.update([(2, 2.5), (3, 3.5)])
+    assert 1 in data and 0 not in data
+    assert len(data) == 3
+    assert data[2] == 2.5
+    assert sorted(data.items()) == [(1, 1.5), (2, 2.5), (3, 3.5)]
+    assert data.pop(3) == 3.5
+    assert sorted(data.keys()) == [1, 2]
+    assert data.get(3) is None
+    with pytest.raises(KeyError):
+        data[0]
+    # Members are a sorted array of rowids.
+    data.update([(2, 2.5), (0, .5), (0, .5)])
+    assert len(data) == 3 and -1 not in data and 10 not in data
+    assert list(data.rowids) == [0, 1, 2]
+    data[3] = 3.5
+    assert list(data.rowids) == [0, 1, 2, 3]
+    del data[0]
+    assert len(data) == 3 and list(data) == [1, 2, 3]
+    with pytest.raises(KeyError):
+        del data[0]
+
+
+def test_compact_assignments():
+    class Partition(object):
+        data = {0: 1, 1: 1, 2: 3, 5: 3}
+    assignments = CompactAssignments(Partition())
+    Zr, Zi = assignments.observed, assignments.missing
+    Zr[0] = 1
+    Zr.update([(1, 1), (5, 3)])
+    Zi[2] = 3
+    assert Zr == {0: 1, 1: 1, 5: 3}
+    assert Zi == {2: 3}
+    assert 2 not in Zr and 2 in Zi and -1 not in Zr and 10 not in Zr
+    assert len(Zr) == 3 and len(Zi) == 1
+    assert Zr.pop(1) == 1
+    assert Zr.keys() == [0, 5]
+    del Zi[2]
+    assert len(Zi) == 0
+    with pytest.raises(KeyError):
+        Zi[2]
+    assert list(assignments.codes[:6]) == [1, 0, 0, 0, 0, 1]
+    # Lengths are counted as rows change code, also with repeated rowids.
+    Zi.update([(0, 1), (2, 3), (2, 3)])
+    assert len(Zr) == 1 and len(Zi) == 2
+    Zr[0] = 1
+    assert len(Zr) == 2 and len(Zi) == 1
+    assert len(Zr) == len(Zr.keys()) and len(Zi) == len(Zi.keys())
+
+
+def test_compact_state_matches_default():
+    D = gen_data(gu.gen_rng(0))
+    states = [
+        State(D, cctypes=CCTYPES, distargs=DISTARGS, compact=compact,
+            rng=gu.gen_rng(1))
+        for compact in [False, True]
+    ]
+    for state in states:
+        state.transition(N=3, progress=False, multiprocess=0)
+        state.incorporate(40, {0: 1., 1: 2, 2: 3, 3: 1})
+        state.transition(N=1, progress=False, multiprocess=0)
+    assert states[0].Zv() == states[1].Zv()
+    assert np.allclose(states[0].logpdf_score(), states[1].logpdf_score())
+    # Observed cells are read back from the dataset.
+    assert states[1].simulate(40, [1]) == {1: 2}
+    for state in states:
+        state.unincorporate(40)
+    assert np.allclose(states[0].logpdf_score(), states[1].logpdf_score())
+    # Collapsed clusters share the dataset rather than keep their own copy,
+    # and dims share the row partition of their view.
+    for dim in states[1].dims():
+        for cluster in dim.clusters.itervalues():
+            assert isinstance(cluster.data, CompactData)
+            assert cluster.data.column is states[1].X[dim.index]
+        view = states[1].view_for(dim.index)
+        assert dim.Zr.assignments.partition is view.crp.clusters[0]
+        assert gu.merged(dim.Zr, dim.Zi) == view.Zr()
+        assert len(dim.Zr) == len(dim.Zr.keys())
+        assert len(dim.Zi) == len(dim.Zi.keys())
+        assert all(np.isnan(states[1].X[dim.index][r]) for r in dim.Zi)
+
+
+def test_compact_memory_usage():
+    D = gen_data(gu.gen_rng(0))
+    D = np.vstack([D] * 10)
+    usage = [
+        State(D, cctypes=CCTYPES, distargs=DISTARGS, Zv={0:0, 1:0, 2:0, 3:0},
+            Zrv={0: [0] * len(D)}, compact=compact,
+            rng=gu.gen_rng(1)).memory_usage()
+        for compact in [False, True]
+    ]
+    assert usage[1]['X'] == usage[0]['X']
+    assert usage[1]['data'] < .1 * usage[0]['data']
+    assert usage[1]['assignments'] < usage[0]['assignments']
+    # Memory of compact clusters grows with their members, not with the rows,
+    # so many small clusters stay smaller than their dicts too.
+    usage = [
+        State(D, cctypes=CCTYPES, distargs=DISTARGS, Zv={0:0, 1:0, 2:0, 3:0},
+            Zrv={0: range(len(D))}, compact=compact,
+            rng=gu.gen_rng(1)).memory_usage()
+        for compact in [False, True]
+    ]
+    assert usage[1]['data'] < .5 * usage[0]['data']
+
+
+def test_compact_serialize():
+    D = gen_data(gu.gen_rng(2))
+    engine = Engine(
+        D, cctypes=CCTYPES, distargs=DISTARGS, num_states=2, compact=True,
+        rng=gu.gen_rng(1))
+    engine.transition(N=2, progress=False)
+    engine = Engine.from_metadata(engine.to_metadata())
+    for state in engine.states:
+        assert state.compact
+        assert all(view.compact for view in state.views.itervalues())
+        state.transition(N=1, progress=False, multiprocess=0)
+    state = State.from_metadata(engine.states[0].to_metadata())
+    assert state.compact
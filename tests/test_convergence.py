@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import numpy as np
+import pytest
+
+from cgpm.crosscat import engine as engine_module
+from cgpm.crosscat.engine import Engine
+from cgpm.crosscat.state import State
+from cgpm.utils import general as gu
+
+
+def make_data():
+    rng = gu.gen_rng(0)
+    return rng.normal(size=(20, 3))
+
+
+def test_split_rhat():
+    rng = gu.gen_rng(1)
+    chains = rng.normal(size=(4, 1000))
+    assert abs(gu.split_rhat(chains) - 1) < .01
+    # Chains stuck at different values, or drifting within each chain.
+    assert gu.split_rhat(chains + np.arange(4)[:,np.newaxis]) > 1.5
+    assert gu.split_rhat(chains + np.linspace(0, 10, 1000)) > 1.5
+    # Degenerate chains.
+    assert gu.split_rhat([[1, 1, 1, 1], [1, 1, 1, 1]]) == 1
+    assert gu.split_rhat([[1, 1, 1, 1], [2, 2, 2, 2]]) == float('inf')
+    assert gu.split_rhat([[1, 2, 3], [1, 2, 3, 4]]) == float('inf')
+
+
+def test_state_transition_tolerance():
+    state = State(make_data(), cctypes=['normal']*3, rng=gu.gen_rng(1))
+    with pytest.raises(ValueError):
+        state.transition(N=10, tolerance=.01, progress=False)
+    # A loose tolerance stops at the first full window of checkpoints.
+    state.transition(N=100, checkpoint=2, tolerance=1., progress=False)
+    assert len(state.diagnostics['logscore']) == 6
+    assert state.diagnostics['iterations']['rows'] == 12
+    # A zero tolerance never stops early.
+    state.transition(N=14, checkpoint=1, tolerance=0, progress=False)
+    assert len(state.diagnostics['logscore']) == 20
+
+
+def test_engine_transition_rhat():
+    engine = Engine(make_data(), num_states=3, cctypes=['normal']*3,
+        rng=gu.gen_rng(1), multiprocess=0)
+    with pytest.raises(ValueError):
+        engine.transition(N=10, rhat=1.1, multiprocess=0, progress=False)
+    # A loose threshold stops once the chains have four checkpoints.
+    engine.transition(
+        N=100, checkpoint=2, rhat=100, multiprocess=0,
+        progress=False)
+    for state in engine.states:
+        assert len(state.diagnostics['logscore']) == 4
+        assert state.diagnostics['iterations']['rows'] == 8
+    # A zero threshold runs all N iterations.
+    engine.transition(
+        N=5, checkpoint=2, rhat=0, multiprocess=0, progress=False)
+    for state in engine.states:
+        assert state.diagnostics['iterations']['rows'] == 13
+
+
+def test_engine_transition_tolerance():
+    engine = Engine(make_data(), num_states=2, cctypes=['normal']*3,
+        rng=gu.gen_rng(1), multiprocess=0)
+    engine.transition(
+        N=100, checkpoint=1, tolerance=1., multiprocess=0, progress=False)
+    for state in engine.states:
+        assert len(state.diagnostics['logscore']) == 6
+    engine.transition(
+        N=100, checkpoint=1, tolerance=1., rhat=0, multiprocess=0,
+        progress=False)
+    for state in engine.states:
+        assert len(state.diagnostics['logscore']) == 12
+
+
+def test_engine_transition_timeslice():
+    engine = Engine(make_data(), num_states=4, cctypes=['normal']*3,
+        rng=gu.gen_rng(1), multiprocess=0)
+    with pytest.raises(ValueError):
+        engine.transition(N=10, timeslice=.1, multiprocess=0, progress=False)
+    with pytest.raises(ValueError):
+        engine.transition(
+            S=1, timeslice=.1, tolerance=.1, checkpoint=1, multiprocess=0,
+            progress=False)
+    # The budget is for the whole ensemble, shared by all the states.
+    start = time.time()
+    engine.transition(S=1, timeslice=.1, multiprocess=0, progress=False)
+    assert time.time() - start < 1.5
+    iterations = [s.diagnostics['iterations']['rows'] for s in engine.states]
+    assert all(0 < n for n in iterations)
+    # Every state completes N iterations if the budget allows, besides the
+    # kernels of iterations cut short at the end of a slice.
+    start = time.time()
+    engine.transition(
+        N=3, S=60, timeslice=.1, multiprocess=0, progress=False)
+    assert time.time() - start < 30
+    for n, state in zip(iterations, engine.states):
+        assert n + 3 <= state.diagnostics['iterations']['rows']
+
+
+def test_engine_transition_timeslice_checkpoint():
+    engine = Engine(make_data(), num_states=2, cctypes=['normal']*3,
+        rng=gu.gen_rng(1), multiprocess=0)
+    # Slices far shorter than the checkpoint interval still checkpoint every
+    # checkpoint iterations of each state.
+    engine.transition(
+        N=6, S=60, timeslice=1e-4, checkpoint=3, kernels=['alpha'],
+        multiprocess=0, progress=False)
+    for state in engine.states:
+        assert state.diagnostics['iterations']['alpha'] == 6
+        assert len(state.diagnostics['logscore']) == 2
+
+
+def test_engine_transition_timeslice_floor(monkeypatch):
+    engine = Engine(make_data(), num_states=4, cctypes=['normal']*3,
+        rng=gu.gen_rng(1), multiprocess=0)
+    # Slices in forked processes last at least MIN_TIMESLICE seconds.
+    slices = []
+    def parallel_map(f, args, parallelism=None):
+        slices.extend(kwargs['S'] for _state, kwargs in args)
+        return map(f, args)
+    monkeypatch.setattr(engine_module, 'parallel_map', parallel_map)
+    monkeypatch.setattr(engine_module, 'cpu_count', lambda: 2)
+    engine.transition(
+        N=2, S=60, timeslice=.01, kernels=['alpha'], multiprocess=1,
+        progress=False)
+    assert slices
+    assert all(S == engine_module.MIN_TIMESLICE for S in slices)
+
+
+def test_engine_transition_timeslice_floor_deadline(monkeypatch):
+    engine = Engine(make_data(), num_states=12, cctypes=['normal']*3,
+        rng=gu.gen_rng(1), multiprocess=0)
+    # With many states per process, a round of MIN_TIMESLICE slices would
+    # overrun the deadline, so only the states which fit are sliced.
+    monkeypatch.setattr(engine_module, 'cpu_count', lambda: 2)
+    S = 2
+    start = time.time()
+    engine.transition(
+        S=S, timeslice=.1, kernels=['alpha'], multiprocess=1, progress=False)
+    assert time.time() - start < S + engine_module.MIN_TIMESLICE
+    iterations = [s.diagnostics['iterations'].get('alpha', 0)
+        for s in engine.states]
+    assert sum(0 < n for n in iterations) <= S * 2
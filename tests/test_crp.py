@@ -392,3 +392,68 @@ def test_crp_same_table_probability():
     # Confirm no mutation has occured.
     assert crp.data == crp_data_full
     assert crp.logpdf_score() == logpdf_score_full
+
+
+def test_simulate_crp_fast():
+    rng = gu.gen_rng(2)
+    N, alpha = 200, 3.
+    partitions = [gu.simulate_crp_fast(N, alpha, rng=rng)
+        for _i in xrange(2000)]
+    for A in partitions:
+        assert len(A) == N
+        # Tables are labeled in order of their first customer.
+        first = [A.index(k) for k in xrange(max(A)+1)]
+        assert first == sorted(first)
+    # Expected number of tables is sum_i alpha/(alpha+i).
+    expected = sum(alpha / (alpha + i) for i in xrange(N))
+    observed = np.mean([max(A)+1 for A in partitions])
+    assert np.allclose(expected, observed, rtol=.05)
+    # Expected size of the first table is 1+(N-1)/(1+alpha).
+    observed = np.mean([A.count(0) for A in partitions])
+    assert np.allclose(1 + (N-1) / (1 + alpha), observed, rtol=.1)
+    assert gu.simulate_crp_fast(1, alpha) == [0]
+
+
+def test_crp_incorporate_bulk():
+    A = [0, 0, 2, 1, 2, 2, 5, 1]
+    crp_bulk = Crp(outputs=[0], inputs=None, hypers={'alpha': 2.})
+    crp_bulk.incorporate_bulk(range(len(A)), A)
+    crp = Crp(outputs=[0], inputs=None, hypers={'alpha': 2.})
+    for rowid, x in enumerate(A):
+        crp.incorporate(rowid, {0: x})
+    assert crp_bulk.data == crp.data
+    assert crp_bulk.counts == crp.counts
+    assert crp_bulk.N == crp.N
+    assert np.allclose(crp_bulk.logpdf_score(), crp.logpdf_score())
+    with pytest.raises(ValueError):
+        crp_bulk.incorporate_bulk([3], [1])
+    with pytest.raises(ValueError):
+        crp_bulk.incorporate_bulk([8, 8], [1, 1])
+
+
+def test_dim_incorporate_bulk():
+    from cgpm.mixtures.dim import Dim
+    rowids = [0, 1, 2, 3, 4, 5]
+    values = [1.2, float('nan'), -.5, 3.1, 0.4, 2.2]
+    clusters = [1, 0, 1, 7, 0, 7]
+    dim_bulk = Dim([2], [-1], cctype='normal', rng=gu.gen_rng(1))
+    dim_bulk.transition_hyper_grids(values)
+    dim = Dim(
+        [2], [-1], cctype='normal', hypers=dim_bulk.hypers, rng=gu.gen_rng(1))
+    dim.transition_hyper_grids(values)
+    dim_bulk.incorporate_bulk(rowids, values, clusters)
+    for rowid, x, k in zip(rowids, values, clusters):
+        dim.incorporate(rowid, {2: x}, {-1: k})
+    assert dim_bulk.Zr == dim.Zr
+    assert dim_bulk.Zi == dim.Zi == {1: 0}
+    assert sorted(dim_bulk.clusters) == [0, 1, 7]
+    for k in dim.clusters:
+        assert dim_bulk.clusters[k].data == dim.clusters[k].data
+    assert np.allclose(dim_bulk.logpdf_score(), dim.logpdf_score())
+    with pytest.raises(ValueError):
+        dim_bulk.incorporate_bulk([0], [1.], [0])
+    dim_conditional = Dim(
+        [2], [-1, 3], cctype='linear_regression',
+        distargs={'inputs': {'stattypes': ['normal'], 'statargs': [None]}})
+    with pytest.raises(ValueError):
+        dim_conditional.incorporate_bulk([0], [1.], [0])
@@ -14,11 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import time
 
+import numpy as np
+
 from cgpm.crosscat.engine import Engine
+from cgpm.crosscat.state import State
 from cgpm.utils import general as gu
 from cgpm.utils import test as tu
+from cgpm.utils.trace import Trace
 
 from markers import integration
 
@@ -73,3 +78,57 @@ def test_simple_diagnostics():
     start = time.time()
     engine.transition_lovecat(N=20000, S=1, checkpoint=1)
     assert 1 < time.time() - start < 3
+
+
+def test_trace_ring():
+    trace = Trace(capacity=4)
+    trace.extend(range(10))
+    assert trace.tolist() == [6., 7., 8., 9.]
+    assert (trace.count, trace.stride, trace.first) == (10, 1, 6)
+    assert trace.since(8) == [8., 9.]
+    assert trace.since(0) == [6., 7., 8., 9.]
+
+
+def test_trace_thin():
+    trace = Trace(dtype=int, ragged=True, capacity=4, thin=True)
+    for i in xrange(20):
+        trace.append([i, i+1] if trace.records() else None)
+    # Checkpoints 0, 4, 8, 12 fill the trace, then 16 doubles the stride.
+    assert trace.tolist() == [[0, 1], [8, 9], [16, 17]]
+    assert (trace.count, trace.stride, trace.first) == (20, 8, 0)
+    assert trace[1].dtype == int
+    assert not trace.records()
+    trace2 = Trace.from_values(
+        trace.tolist(), dtype=int, ragged=True, capacity=4, thin=True,
+        **trace.to_metadata())
+    for i in xrange(20, 30):
+        trace.append([i, i+1])
+        trace2.append([i, i+1])
+    assert trace2 == trace
+    assert trace.tolist() == [[0, 1], [8, 9], [16, 17], [24, 25]]
+
+
+def test_state_max_checkpoints():
+    D = retrieve_normal_dataset()
+    # Checkpoints 0, 2, 4, 6, 8 fill the trace, then 12 doubles the stride.
+    state = State(
+        D.T, cctypes=['normal', 'normal'], max_checkpoints=5,
+        thin_checkpoints=True, rng=gu.gen_rng(1))
+    state.transition(N=13, checkpoint=1, progress=False)
+    logscore = state.diagnostics['logscore']
+    assert len(logscore) == 4
+    assert (logscore.count, logscore.stride) == (13, 4)
+    assert np.allclose(logscore[-1], state.logpdf_score())
+    assert state.diagnostics['column_partition'][-1].tolist() == \
+        [state.Zv(c) for c in state.outputs]
+    metadata = json.loads(json.dumps(state.to_metadata()))
+    state2 = State.from_metadata(metadata, rng=gu.gen_rng(1))
+    for key in ['logscore', 'column_crp_alpha', 'column_partition']:
+        assert state2.diagnostics[key] == state.diagnostics[key]
+        assert state2.diagnostics[key].count == 13
+    # Partitions recorded as lists of items are converted.
+    metadata['diagnostics']['column_partition'] = [[[1, 2], [0, 1]]]
+    del metadata['diagnostics']['traces']
+    state3 = State.from_metadata(metadata, rng=gu.gen_rng(1))
+    assert state3.diagnostics['column_partition'].tolist() == [[1, 2]]
+    assert state3.diagnostics['logscore'].count == 4
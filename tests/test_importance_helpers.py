@@ -452,3 +452,76 @@ def test_retrieve_descends():
     assert set(retrieve_descendents(cgpms, 1)) == set([0])
     assert set(retrieve_descendents(cgpms, 2)) == set([0])
     assert set(retrieve_descendents(cgpms, 0)) == set([])
+
+
+def test_topological_sort():
+    def check_order(graph, order):
+        position = {node: i for i, node in enumerate(order)}
+        assert sorted(order) == sorted(dict(graph))
+        for node, edges in dict(graph).iteritems():
+            assert all(position[node] > position[e] for e in edges
+                if e in position)
+
+    graph = {0: [], 1: [0], 2: [0, 1], 3: [2], 4: []}
+    check_order(graph, helpers.topological_sort(graph))
+
+    # Edges from nodes outside the graph are ignored.
+    graph = [(10, [8, 7]), (5, [8, 7, 9, 10, 11, 13, 15])]
+    assert helpers.topological_sort(graph) == [10, 5]
+
+    # Long chain, in reverse order of the keys.
+    graph = {i: [i+1] for i in xrange(500)}
+    graph[500] = []
+    assert helpers.topological_sort(graph) == range(500, -1, -1)
+
+    with pytest.raises(ValueError):
+        helpers.topological_sort({0: [1], 1: [2], 2: [0]})
+    with pytest.raises(ValueError):
+        helpers.topological_sort({0: [], 1: [2], 2: [1]})
+
+
+def test_compiled_graph():
+    builders = [
+        build_cgpm_no_connection,
+        build_cgpms_v_structure,
+        build_cgpms_markov_chain,
+        build_cgpms_complex,
+        build_cgpms_fork,
+        build_cgpms_four_forests,
+    ]
+    for builder in builders:
+        cgpms = builder()
+        graph = helpers.CompiledGraph(cgpms)
+        vtc = helpers.retrieve_variable_to_cgpm(cgpms)
+        adjacency = helpers.retrieve_adjacency_list(cgpms, vtc)
+        assert graph.parents == adjacency
+        for i in graph.children:
+            assert set(graph.children[i]) == \
+                set(j for j in adjacency if i in adjacency[j])
+        assert set(graph.extraneous) == \
+            set(helpers.retrieve_extraneous_inputs(cgpms, vtc))
+        assert np.allclose(
+            graph.components,
+            helpers.retrieve_weakly_connected_components(cgpms))
+        position = {c: i for i, c in enumerate(graph.topo)}
+        for i in adjacency:
+            assert all(position[p] < position[i] for p in adjacency[i])
+        depth = {c: d for d, level in enumerate(graph.levels) for c in level}
+        assert sorted(depth) == sorted(graph.topo)
+        for i in adjacency:
+            assert all(depth[p] < depth[i] for p in adjacency[i])
+        for v in vtc:
+            assert graph.ancestors(v) == \
+                set(helpers.retrieve_ancestors(cgpms, v))
+            assert graph.component(v) == graph.components[vtc[v]]
+
+    graph = helpers.CompiledGraph(build_cgpms_fork())
+    assert graph.levels == [[1, 2], [0]]
+
+    graph = helpers.CompiledGraph(build_cgpms_markov_chain())
+    assert graph.levels == [[0], [2], [1]]
+    with pytest.raises(ValueError):
+        graph.ancestors(5)
+    with pytest.raises(ValueError):
+        helpers.CompiledGraph([CGpm(outputs=[0], inputs=[1]),
+            CGpm(outputs=[1], inputs=[0])])
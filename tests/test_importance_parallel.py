@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for concurrent evaluation of independent cgpms in ImportanceNetwork."""
+
+import os
+import threading
+
+import numpy as np
+
+from scipy.stats import norm
+
+from cgpm.cgpm import CGpm
+from cgpm.crosscat.engine import DummyCgpm
+from cgpm.crosscat.state import State
+from cgpm.network import importance
+from cgpm.network.importance import ImportanceNetwork
+from cgpm.utils import general as gu
+
+
+class RendezvousNormal(CGpm):
+    """Standard normal whose queries wait until a partner cgpm is queried."""
+
+    def __init__(self, outputs, inputs, mine, partner):
+        self.outputs = outputs
+        self.inputs = inputs
+        self.mine = mine
+        self.partner = partner
+        self.met = False
+
+    def rendezvous(self):
+        self.mine.set()
+        self.met = self.partner.wait(2) or self.partner.is_set()
+
+    def logpdf(self, rowid, targets, constraints=None, inputs=None):
+        self.rendezvous()
+        return norm.logpdf(targets[self.outputs[0]])
+
+    def simulate(self, rowid, targets, constraints=None, inputs=None, N=None):
+        self.rendezvous()
+        samples = [{self.outputs[0]: 0.} for _i in xrange(N or 1)]
+        return samples[0] if N is None else samples
+
+
+def build_rendezvous():
+    events = [threading.Event(), threading.Event()]
+    return [
+        RendezvousNormal([0], [], events[0], events[1]),
+        RendezvousNormal([1], [], events[1], events[0]),
+    ]
+
+
+def test_parallel_network_evaluates_components_concurrently():
+    # Each cgpm can only observe its partner if both run at the same time.
+    cgpms = build_rendezvous()
+    network = ImportanceNetwork(cgpms, parallelism=2)
+    logp = network.logpdf(None, {0: 1., 1: 2.})
+    assert np.allclose(logp, norm.logpdf(1.) + norm.logpdf(2.))
+    assert all(c.met for c in cgpms)
+
+    # Same for the batched particle mode.
+    cgpms = build_rendezvous()
+    network = ImportanceNetwork(cgpms, accuracy=5, parallelism=2)
+    samples = network.simulate(None, [0, 1], N=3)
+    assert samples == [{0: 0., 1: 0.}] * 3
+    assert all(c.met for c in cgpms)
+
+
+def test_parallel_state_matches_serial():
+    rng = gu.gen_rng(1)
+    X = rng.normal(size=(20, 4))
+    state = State(X, cctypes=['normal']*4, Zv={0:0, 1:0, 2:1, 3:1}, rng=rng)
+    state.compose_cgpm(DummyCgpm(inputs=[0, 2], outputs=[1000]))
+    targets = {0: .1, 3: -.3}
+    constraints = {1: .4, 2: .2}
+    lp_serial = state.logpdf(-1, targets, constraints)
+    lp_parallel = state.logpdf(-1, targets, constraints, parallelism=4)
+    assert np.allclose(lp_serial, lp_parallel)
+    samples = state.simulate(-1, [0, 3], constraints, N=10, parallelism=4)
+    assert len(samples) == 10
+    assert all(set(s) == set([0, 3]) for s in samples)
+
+
+def test_thread_pools_lifetime():
+    pool = importance._get_thread_pool(2)
+    assert importance._get_thread_pool(2) is pool
+    # Pools inherited from another process are dropped, not reused.
+    importance._THREAD_POOLS[(os.getpid() + 1, 2)] = object()
+    assert importance._get_thread_pool(2) is pool
+    assert (os.getpid() + 1, 2) not in importance._THREAD_POOLS
+    # Closing the pools of the process (at exit) joins their threads.
+    importance._close_thread_pools()
+    assert not importance._THREAD_POOLS
+    assert all(not worker.is_alive() for worker in pool._pool)
+    assert importance._get_thread_pool(2) is not pool
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the batched particle mode of ImportanceNetwork."""
+
+import numpy as np
+
+from scipy.stats import norm
+
+from cgpm.cgpm import CGpm
+from cgpm.crosscat.engine import DummyCgpm
+from cgpm.crosscat.state import State
+from cgpm.network.importance import ImportanceNetwork
+from cgpm.utils import general as gu
+
+
+class CountingNormal(CGpm):
+    """Normal with mean equal to the sum of its inputs, counting queries."""
+
+    def __init__(self, outputs, inputs, rng):
+        self.outputs = outputs
+        self.inputs = inputs
+        self.rng = rng
+        self.calls = {'logpdf': 0, 'simulate': 0}
+
+    def logpdf(self, rowid, targets, constraints=None, inputs=None):
+        self.calls['logpdf'] += 1
+        loc = sum(inputs[i] for i in self.inputs)
+        return norm.logpdf(targets[self.outputs[0]], loc=loc)
+
+    def simulate(self, rowid, targets, constraints=None, inputs=None, N=None):
+        self.calls['simulate'] += 1
+        loc = sum(inputs[i] for i in self.inputs)
+        xs = self.rng.normal(loc=loc, size=1 if N is None else N)
+        samples = [{self.outputs[0]: x} for x in xs]
+        return samples[0] if N is None else samples
+
+
+class VectorNormal(CountingNormal):
+    """CountingNormal which evaluates many inputs in one call."""
+
+    def __init__(self, outputs, inputs, rng):
+        super(VectorNormal, self).__init__(outputs, inputs, rng)
+        self.calls.update({'logpdf_batch': 0, 'simulate_batch': 0})
+
+    def logpdf_batch(self, rowid, targets, constraints=None, inputs_list=None):
+        self.calls['logpdf_batch'] += 1
+        locs = [sum(inputs[i] for i in self.inputs) for inputs in inputs_list]
+        return norm.logpdf(targets[self.outputs[0]], loc=locs)
+
+    def simulate_batch(self, rowid, targets, constraints=None,
+            inputs_list=None):
+        self.calls['simulate_batch'] += 1
+        locs = [sum(inputs[i] for i in self.inputs) for inputs in inputs_list]
+        return [{self.outputs[0]: x} for x in self.rng.normal(loc=locs)]
+
+
+def build_chain(rng):
+    return [
+        CountingNormal(outputs=[0], inputs=[], rng=rng),
+        CountingNormal(outputs=[1], inputs=[0, -1], rng=rng),
+    ]
+
+
+def test_batch_invokes_cgpm_once_per_distinct_inputs():
+    rng = gu.gen_rng(2)
+    cgpms = build_chain(rng)
+    network = ImportanceNetwork(cgpms, accuracy=20, rng=rng)
+
+    # Root is simulated once for all particles, child once per particle.
+    network.simulate(None, [1], inputs={-1: 0})
+    assert cgpms[0].calls == {'logpdf': 0, 'simulate': 1}
+    assert cgpms[1].calls == {'logpdf': 0, 'simulate': 20}
+
+    # Constraining the root fixes the inputs of the child for all particles.
+    for cgpm in cgpms:
+        cgpm.calls = {'logpdf': 0, 'simulate': 0}
+    samples, weights = network.weighted_samples(None, [1], {0: 1.}, {-1: 0})
+    assert len(samples) == len(weights) == 20
+    assert cgpms[0].calls == {'logpdf': 1, 'simulate': 0}
+    assert cgpms[1].calls == {'logpdf': 0, 'simulate': 1}
+    assert np.allclose(weights, norm.logpdf(1.))
+    assert all(s[0] == 1. for s in samples)
+
+
+def test_batch_default_methods():
+    cgpm = CountingNormal(outputs=[0], inputs=[1], rng=gu.gen_rng(1))
+    inputs_list = [{1: 0.}, {1: 0.}, {1: 5.}, {1: 0.}]
+    logps = cgpm.logpdf_batch(None, {0: 1.}, None, inputs_list)
+    assert np.allclose(logps, norm.logpdf(1., loc=[0, 0, 5, 0]))
+    samples = cgpm.simulate_batch(None, [0], None, inputs_list)
+    assert len(samples) == 4 and all(0 in s for s in samples)
+    # Runs of equal consecutive inputs share one call of simulate.
+    assert cgpm.calls == {'logpdf': 4, 'simulate': 3}
+
+
+def test_batch_vector_cgpm_with_continuous_inputs():
+    rng = gu.gen_rng(2)
+    cgpms = [
+        CountingNormal(outputs=[0], inputs=[], rng=rng),
+        VectorNormal(outputs=[1], inputs=[0, -1], rng=rng),
+    ]
+    network = ImportanceNetwork(cgpms, accuracy=20, rng=rng)
+    # The child is invoked once for all particles, despite their distinct
+    # continuous inputs.
+    samples, weights = network.weighted_samples(None, [], {1: .5}, {-1: 0})
+    assert len(set(s[0] for s in samples)) == 20
+    assert cgpms[1].calls == {
+        'logpdf': 0, 'simulate': 0, 'logpdf_batch': 1, 'simulate_batch': 0}
+    assert np.allclose(
+        weights, [norm.logpdf(.5, loc=s[0]) for s in samples])
+    network.simulate(None, [1], inputs={-1: 0})
+    assert cgpms[1].calls['simulate_batch'] == 1
+    assert cgpms[1].calls['simulate'] == 0
+    # Posterior x0|x1 ~ Normal(x1/2, sqrt(1/2)).
+    network = ImportanceNetwork(cgpms, accuracy=2000, rng=rng)
+    samples = network.simulate(None, [0], {1: 2.}, {-1: 0}, N=200)
+    assert np.allclose(np.mean([s[0] for s in samples]), 1., atol=.2)
+
+
+def test_batch_logpdf_marginal():
+    rng = gu.gen_rng(4)
+    network = ImportanceNetwork(build_chain(rng), accuracy=2000, rng=rng)
+    # Marginally x1 ~ Normal(0, sqrt(2)).
+    logp = network.logpdf(None, {1: .5}, None, {-1: 0})
+    assert np.allclose(logp, norm.logpdf(.5, scale=np.sqrt(2)), atol=.05)
+    # Conditionally x1|x0 ~ Normal(x0, 1).
+    logp = network.logpdf(None, {1: .5}, {0: 1.}, {-1: 0})
+    assert np.allclose(logp, norm.logpdf(.5, loc=1.))
+    # Posterior x0|x1 ~ Normal(x1/2, sqrt(1/2)).
+    samples = network.simulate(None, [0], {1: 2.}, {-1: 0}, N=200)
+    assert np.allclose(np.mean([s[0] for s in samples]), 1., atol=.2)
+
+
+def test_batch_state_logpdf_matches_direct():
+    rng = gu.gen_rng(1)
+    X = rng.normal(size=(20, 3))
+    state = State(X, cctypes=['normal']*3, rng=rng)
+    state.transition(N=2, progress=False)
+    targets = {0: .1, 2: -.3}
+    constraints = {1: .4}
+    lp_direct = state.logpdf(-1, targets, constraints)
+    state.compose_cgpm(DummyCgpm(inputs=state.outputs, outputs=[1000]))
+    lp_network = state.logpdf(-1, targets, constraints, accuracy=10)
+    assert np.allclose(lp_direct, lp_network)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import numpy as np
+
+from cgpm.crosscat.state import State
+from cgpm.utils import config as cu
+from cgpm.utils import general as gu
+
+
+DATA = {
+    'bernoulli': ([0, 1, 1, 0, 1], None),
+    'categorical': ([0, 2, 2, 1, 0], {'k': 3}),
+    'exponential': ([.1, 2., 1.3, .4, 5.], None),
+    'geometric': ([0, 3, 1, 2, 0], None),
+    'lognormal': ([.1, 2., 1.3, .4, 5.], None),
+    'normal': ([-1.2, 2., .3, .4, -5.], None),
+    'normal_trunc': ([-1.2, 2., .3, .4, -5.], {'l': -10, 'h': 10}),
+    'poisson': ([0, 3, 1, 2, 0], None),
+    'vonmises': ([.1, 2., 1.3, .4, 5.], None),
+}
+
+
+@pytest.mark.parametrize('cctype', sorted(DATA))
+def test_incorporate_bulk_matches_incorporate(cctype):
+    values, distargs = DATA[cctype]
+    model = cu.cctype_class(cctype)
+    params = {'mu': .5, 'sigma': 1.}
+    bulk = model([0], [], distargs=distargs, params=params, rng=gu.gen_rng(1))
+    serial = model([0], [], distargs=distargs, params=params, rng=gu.gen_rng(1))
+    bulk.incorporate_bulk(range(len(values)), values)
+    for rowid, x in enumerate(values):
+        serial.incorporate(rowid, {0: x})
+    assert bulk.data == serial.data
+    for stat, value in serial.get_suffstats().iteritems():
+        assert np.allclose(bulk.get_suffstats()[stat], value)
+    assert np.allclose(
+        bulk.logpdf_score(), serial.logpdf_score(), equal_nan=True)
+    # Removing rows from a bulk incorporated model gives the same statistics.
+    bulk.unincorporate(0)
+    serial.unincorporate(0)
+    assert np.allclose(
+        bulk.logpdf_score(), serial.logpdf_score(), equal_nan=True)
+
+
+@pytest.mark.parametrize('cctype, value', [
+    ('bernoulli', 2),
+    ('categorical', 3),
+    ('categorical', 1.5),
+    ('exponential', -1),
+    ('geometric', -1),
+    ('lognormal', 0),
+    ('normal_trunc', 11),
+    ('poisson', .5),
+    ('vonmises', 7),
+])
+def test_incorporate_bulk_invalid(cctype, value):
+    values, distargs = DATA[cctype]
+    model = cu.cctype_class(cctype)([0], [], distargs=distargs)
+    with pytest.raises(ValueError):
+        model.incorporate_bulk([0, 1], [values[0], value])
+    assert not model.data
+
+
+def test_view_bulk_incorporate_dim():
+    # Incorporating a dim into a view assigns rows by cluster, with nan rows in
+    # Zi, and its score matches the dim built one row at a time.
+    rng = gu.gen_rng(2)
+    X = rng.normal(size=(50, 3))
+    X[::7, 2] = np.nan
+    state = State(X, cctypes=['normal']*3, Zv={0:0, 1:0, 2:0}, rng=rng)
+    view = state.views[0]
+    dim = view.dims[2]
+    assert sorted(dim.Zi) == range(0, 50, 7)
+    assert sorted(dim.Zr.keys() + dim.Zi.keys()) == range(50)
+    for rowid in dim.Zr:
+        assert rowid in dim.clusters[view.Zr(rowid)].data
+    logp_bulk = dim.logpdf_score()
+    dim_serial = state.dim_for(2)
+    dim_serial.clusters = {}
+    dim_serial.Zr = {}
+    dim_serial.Zi = {}
+    dim_serial.aux_model = dim_serial.create_aux_model()
+    for rowid in xrange(50):
+        dim_serial.incorporate(
+            rowid, {2: X[rowid,2]}, {dim.inputs[0]: view.Zr(rowid)})
+    assert np.allclose(dim_serial.logpdf_score(), logp_bulk)
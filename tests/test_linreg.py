@@ -169,6 +169,29 @@ def test_simulate():
     # plt.close('all')
 
 
+def test_batch():
+    linreg = LinearRegression(
+        OUTPUTS, INPUTS,
+        distargs={'inputs':{'stattypes': CCTYPES, 'statargs': CCARGS}},
+        rng=gu.gen_rng(0))
+    for rowid, row in enumerate(D[:25]):
+        linreg.incorporate(rowid, {0:row[0]}, {i:row[i] for i in linreg.inputs})
+    inputs_list = [{i: row[i] for i in linreg.inputs} for row in D[25:]]
+    # The predictive evaluated for all inputs at once matches each logpdf.
+    logps = linreg.logpdf_batch(None, {0: 1.}, None, inputs_list)
+    assert np.allclose(
+        logps, [linreg.logpdf(None, {0: 1.}, None, i) for i in inputs_list])
+    # Samples for all inputs at once match repeated simulate in distribution.
+    inputs = inputs_list[0]
+    batch = linreg.simulate_batch(None, [0], None, [inputs] * 2000)
+    serial = linreg.simulate(None, [0], None, inputs, N=2000)
+    assert len(batch) == 2000
+    for statistic in [np.mean, np.std]:
+        assert np.allclose(
+            statistic([s[0] for s in batch]),
+            statistic([s[0] for s in serial]), atol=.15)
+
+
 def test_missing_inputs():
     outputs = [0]
     inputs = [2, 4, 6]
@@ -17,6 +17,8 @@
 import math
 import pytest
 
+import numpy as np
+
 from cgpm.utils import general as gu
 
 def relerr(expected, actual):
@@ -58,3 +60,45 @@ def test_logmeanexp():
     assert math.isnan(gu.logmeanexp([nan, inf]))
     assert math.isnan(gu.logmeanexp([nan, -3]))
     assert math.isnan(gu.logmeanexp([nan]))
+
+def test_logsumexp_numpy():
+    inf = float('inf')
+    assert gu.logsumexp(np.array([])) == -inf
+    assert gu.logsumexp(np.array([-inf, -inf])) == -inf
+    assert gu.logsumexp(np.log([.25, .25, .5])) == 0.
+    assert isinstance(gu.logsumexp(np.zeros(3)), float)
+    assert gu.logmeanexp(np.array([-inf, 0, +inf])) == +inf
+    assert relerr(-3 - math.log(2.), gu.logmeanexp(np.array([-inf, -3]))) \
+        < 1e-15
+
+def test_log_pflip():
+    inf = float('inf')
+    logp = np.log([.1, .2, .3, .4])
+    # The draws match rng.choice for the same seed.
+    draws = gu.log_pflip(logp, size=1000, rng=gu.gen_rng(2))
+    expected = gu.gen_rng(2).choice(4, size=1000, p=[.1, .2, .3, .4])
+    assert np.all(draws == expected)
+    assert np.allclose(np.bincount(draws) / 1000., [.1, .2, .3, .4], atol=.05)
+    # Unnormalized weights, -inf weights and labels.
+    assert gu.log_pflip([-inf, 10., -inf], rng=gu.gen_rng(0)) == 1
+    assert gu.log_pflip([-inf, 3.], array=['a', 'b'], rng=gu.gen_rng(0)) \
+        == 'b'
+    assert gu.log_pflip([0.], array=[7], size=2) == [7, 7]
+    with pytest.raises(ValueError):
+        gu.log_pflip([-inf, -inf], rng=gu.gen_rng(0))
+
+def test_log_pflip_rows():
+    inf = float('inf')
+    logps = np.log([[.1, .9], [.9, .1], [.5, .5]])
+    logps = np.tile(logps, (2000, 1))
+    draws = gu.log_pflip_rows(logps, rng=gu.gen_rng(1))
+    assert draws.shape == (6000,)
+    assert np.allclose(np.mean(draws[0::3]), .9, atol=.03)
+    assert np.allclose(np.mean(draws[1::3]), .1, atol=.03)
+    assert np.allclose(np.mean(draws[2::3]), .5, atol=.03)
+    assert np.all(gu.log_pflip_rows([[-inf, 0, -inf], [5, -inf, -inf]]) \
+        == [1, 0])
+    with pytest.raises(ValueError):
+        gu.log_pflip_rows([[-inf, -inf]])
+    with pytest.raises(ValueError):
+        gu.log_pflip_rows([0., 1.])
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+from cgpm.crosscat.engine import Engine
+from cgpm.crosscat.state import State
+from cgpm.utils import general as gu
+
+
+def test_sizeof_shared():
+    x = range(1000)
+    assert gu.sizeof([x, x]) < 2 * gu.sizeof(x)
+    seen = set()
+    assert gu.sizeof(x, seen) > 0
+    assert gu.sizeof(x, seen) == 0
+    assert gu.sizeof(np.zeros(1000)) >= 8000
+
+
+def test_state_memory_usage():
+    rng = gu.gen_rng(0)
+    X = rng.normal(size=(100, 4))
+    state = State(X, cctypes=['normal']*4, rng=rng)
+    state.transition(N=2, progress=False)
+    usage = state.memory_usage()
+    assert usage.keys() == [
+        'X', 'data', 'assignments', 'clusters', 'diagnostics',
+        'hooked_cgpms', 'other', 'total']
+    assert usage['total'] == sum(v for k, v in usage.iteritems()
+        if k != 'total')
+    assert all(v > 0 for v in usage.itervalues())
+    # The state holds at least the dataset and the data dict entries.
+    assert usage['X'] >= 400 * 8
+    # Usage grows with the rows.
+    for rowid in xrange(100, 200):
+        state.incorporate(rowid, {c: 0. for c in state.outputs})
+    usage_more = state.memory_usage()
+    assert usage_more['X'] > usage['X']
+    assert usage_more['data'] > usage['data']
+    assert usage_more['assignments'] > usage['assignments']
+
+
+def test_engine_memory_usage():
+    rng = gu.gen_rng(1)
+    X = rng.normal(size=(30, 3))
+    engine = Engine(
+        X, num_states=3, cctypes=['normal']*3, rng=rng, multiprocess=0)
+    usage = engine.memory_usage()
+    assert len(usage['states']) == 3
+    for key in usage['total']:
+        assert usage['total'][key] == sum(s[key] for s in usage['states'])
+    usage = engine.memory_usage(statenos=[1])
+    assert usage['states'] == [engine.states[1].memory_usage()]
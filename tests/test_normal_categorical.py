@@ -63,7 +63,7 @@ def state():
     engine = Engine(
         DATA, cctypes=['normal', 'categorical'], distargs=[None, {'k':6}],
         num_states=4, rng=gu.gen_rng(212))
-    engine.transition(N=15)
+    engine.transition(N=50)
     marginals = engine.logpdf_score()
     ranking = np.argsort(marginals)[::-1]
     return engine.get_state(ranking[0])
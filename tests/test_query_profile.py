@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import numpy as np
+
+from scipy.stats import norm
+
+from cgpm.cgpm import CGpm
+from cgpm.crosscat.state import State
+from cgpm.network.importance import ImportanceNetwork
+from cgpm.utils import general as gu
+from cgpm.utils import timer as tu
+
+
+class ShiftNormal(CGpm):
+    """Normal with unit variance centered at the input."""
+
+    def __init__(self, outputs, inputs):
+        self.outputs = outputs
+        self.inputs = inputs
+
+    def logpdf(self, rowid, targets, constraints=None, inputs=None):
+        return norm.logpdf(
+            targets[self.outputs[0]], loc=inputs[self.inputs[0]])
+
+    def simulate(self, rowid, targets, constraints=None, inputs=None, N=None):
+        samples = [{self.outputs[0]: inputs[self.inputs[0]]}
+            for _i in xrange(N or 1)]
+        return samples[0] if N is None else samples
+
+
+def make_state():
+    rng = gu.gen_rng(1)
+    X = rng.normal(size=(20, 3))
+    return State(X, cctypes=['normal']*3, Zv={0:0, 1:0, 2:1}, rng=rng)
+
+
+def test_profile_crosscat_queries():
+    state = make_state()
+    queries = []
+    with tu.profile_queries(callback=queries.append) as profile:
+        state.logpdf(-1, {0: 1.}, {2: .5})
+        state.simulate(-1, [0, 2], N=3)
+    # Queries outside the block are not recorded.
+    state.logpdf(-1, {0: 1.})
+    assert profile.queries == queries
+    assert [q['query'] for q in queries] == ['State.logpdf', 'State.simulate']
+    assert profile.calls['State.logpdf'] == 1
+    assert profile.calls['State._validate_cgpm_query'] == 2
+    view = state.views[0]
+    stages = queries[1]['stages']
+    assert set(stages) == set([
+        'State._validate_cgpm_query', 'State.assemble',
+        'View[%d].simulate' % (view.outputs[0],),
+        'View[%d].simulate' % (state.views[1].outputs[0],),
+    ])
+    assert all(0 <= t <= queries[1]['seconds'] for t in stages.itervalues())
+
+
+def test_profile_composite_queries():
+    state = make_state()
+    token = state.compose_cgpm(ShiftNormal(outputs=[1000], inputs=[0]))
+    with tu.profile_queries() as profile:
+        logp = state.logpdf(-1, {1000: .5, 0: 1.})
+        state.simulate(-1, [1000], {0: 1.})
+    assert np.allclose(
+        logp,
+        state.views[0].logpdf(-1, {0: 1.}) + norm.logpdf(.5, loc=1.))
+    assert state.hooked_cgpms[token].outputs == [1000]
+    assert len(profile.queries) == 2
+    stages = profile.queries[0]['stages']
+    for stage in [
+            'State._validate_cgpm_query', 'State._populate_constraints',
+            'State.build_network', 'ShiftNormal[1000].logpdf',
+            'View[%d].logpdf' % (state.views[0].outputs[0],),
+            'View._populate_constraints', 'View.build_network',
+            'ImportanceNetwork.assemble']:
+        assert stage in stages
+    assert 'ShiftNormal[1000].simulate' in profile.queries[1]['stages']
+
+
+def test_profile_parallel_network():
+    # Stages recorded by threads of the network reach the profile.
+    cgpms = [ShiftNormal([0], [2]), ShiftNormal([1], [2])]
+    network = ImportanceNetwork(cgpms, accuracy=4, parallelism=2)
+    with tu.profile_queries() as profile:
+        network.simulate(None, [0, 1], inputs={2: 1.}, N=5)
+    assert profile.calls['ShiftNormal[0].simulate'] == 5
+    assert profile.calls['ShiftNormal[1].simulate'] == 5
+    # The network is not a query itself.
+    assert profile.queries == []
+    assert not tu._PROFILES
+
+
+def test_profile_concurrent_queries():
+    # Each query is credited with the stages of its own thread, including
+    # those of network threads working on its behalf.
+    started = [threading.Event(), threading.Event()]
+    cgpms = [ShiftNormal([0], [2]), ShiftNormal([1], [2])]
+    def query(name, mine, partner):
+        with tu.profiled_query(name):
+            mine.set()
+            partner.wait(2)
+            with tu.profiled('stage-%s' % (name,)):
+                pass
+            if name == 'b':
+                network = ImportanceNetwork(cgpms, accuracy=2, parallelism=2)
+                network.simulate(None, [0, 1], inputs={2: 1.})
+    with tu.profile_queries() as profile:
+        threads = [
+            threading.Thread(target=query, args=('a',) + tuple(started)),
+            threading.Thread(target=query, args=('b',) + tuple(started[::-1])),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    queries = {q['query']: q['stages'] for q in profile.queries}
+    assert set(queries) == set(['a', 'b'])
+    assert set(queries['a']) == set(['stage-a'])
+    assert set(queries['b']) == set([
+        'stage-b', 'ShiftNormal[0].simulate', 'ShiftNormal[1].simulate',
+        'ImportanceNetwork.assemble'])
+    assert not profile._queries
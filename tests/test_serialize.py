@@ -16,13 +16,16 @@
 
 """Crash test for serialization of state and engine."""
 
+import gc
 import importlib
 import json
 import tempfile
+import weakref
 
 import numpy as np
 
 from cgpm.crosscat.engine import Engine
+from cgpm.crosscat.engine import LazyStates
 from cgpm.crosscat.state import State
 from cgpm.mixtures.view import View
 from cgpm.regressions.forest import RandomForest
@@ -82,6 +85,66 @@ def test_engine_serialize():
     serialize_generic(Engine, additional=additional)
 
 
+def test_engine_lazy_states():
+    data = np.random.normal(size=(50,3))
+    engine = Engine(
+        data, cctypes=['normal']*3, num_states=4, rng=gu.gen_rng(0),
+        multiprocess=0)
+    engine.transition(N=2, multiprocess=0)
+    eager = Engine.from_metadata(engine.to_metadata(), multiprocess=0)
+    lazy = Engine.from_metadata(engine.to_metadata(), lazy=True, max_states=2)
+    assert isinstance(lazy.states, LazyStates)
+    assert lazy.num_states() == 4
+    assert not lazy.states.cache
+    # Only the queried states are built.
+    assert np.allclose(
+        lazy.logpdf(-1, {0:1}, statenos=[2], multiprocess=0),
+        eager.logpdf(-1, {0:1}, statenos=[2], multiprocess=0))
+    assert lazy.states.cache.keys() == [2]
+    # Querying every state holds at most max_states of them.
+    assert np.allclose(
+        lazy.logpdf(-1, {0:1}, {1:0}, multiprocess=0),
+        eager.logpdf(-1, {0:1}, {1:0}, multiprocess=0))
+    assert lazy.states.cache.keys() == [2, 3]
+    # Transitioned states survive eviction.
+    lazy.transition(N=1, statenos=[1], multiprocess=0)
+    logscore = lazy.get_state(1).logpdf_score()
+    lazy.get_state(0)
+    lazy.get_state(2)
+    assert 1 not in lazy.states.cache
+    assert np.allclose(lazy.get_state(1).logpdf_score(), logscore)
+    lazy.drop_state(0)
+    assert lazy.num_states() == 3
+    assert np.allclose(lazy.get_state(0).logpdf_score(), logscore)
+    # A state rebuilt after eviction draws fresh random numbers; seeding the
+    # states builds none of them.
+    samples = lazy.simulate(-1, [0], statenos=[0], multiprocess=0)
+    lazy.get_state(1)
+    lazy.get_state(2)
+    assert 0 not in lazy.states.cache
+    assert lazy.simulate(-1, [0], statenos=[0], multiprocess=0) != samples
+    assert lazy.states.cache.keys() == [2, 0]
+    # A transition of every state holds at most max_states at once.
+    alive = weakref.WeakSet(lazy.states.cache.values())
+    held = []
+    from_metadata, transition = State.from_metadata, State.transition
+    def tracked_from_metadata(metadata, rng=None):
+        state = from_metadata(metadata, rng=rng)
+        alive.add(state)
+        return state
+    def counted_transition(state, **kwargs):
+        gc.collect()
+        held.append(len(alive))
+        return transition(state, **kwargs)
+    State.from_metadata = staticmethod(tracked_from_metadata)
+    State.transition = counted_transition
+    try:
+        lazy.transition(N=1, multiprocess=0)
+    finally:
+        State.from_metadata, State.transition = from_metadata, transition
+    assert held == [2, 2, 2]
+
+
 def test_view_serialize():
     data = np.random.normal(size=(100,5))
     data[:,0] = 0
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+from cgpm.crosscat import binary
+from cgpm.crosscat.engine import Engine
+from cgpm.crosscat.state import State
+from cgpm.dummy.piecewise import PieceWise
+from cgpm.utils import general as gu
+from cgpm.utils import test as tu
+
+
+CCTYPES, DISTARGS = ['normal', 'categorical', 'poisson', 'bernoulli'], \
+    [None, {'k': 3}, None, None]
+
+
+def gen_data(rng):
+    T, _Zv, _Zc = tu.gen_data_table(
+        50, [.5, .5], [[.5, .5], [.3, .7]], CCTYPES, DISTARGS, [.8]*4,
+        rng=rng)
+    X = T.T
+    X[[3, 7, 11], 0] = np.nan
+    X[[5, 7], 1] = np.nan
+    return X
+
+
+@pytest.yield_fixture
+def path():
+    path = tempfile.mkdtemp(prefix='cgpm-binary')
+    yield path
+    shutil.rmtree(path)
+
+
+def check_same_state(state, state2):
+    assert state2.outputs == state.outputs
+    assert dict(state2.Zv()) == dict(state.Zv())
+    assert np.allclose(state2.alpha(), state.alpha())
+    assert np.allclose(
+        state2.data_array(), state.data_array(), equal_nan=True)
+    for v, view in state.views.iteritems():
+        view2 = state2.views[v]
+        assert dict(view2.Zr()) == dict(view.Zr())
+        assert np.allclose(view2.alpha(), view.alpha())
+        for c, dim in view.dims.iteritems():
+            dim2 = view2.dims[c]
+            assert dim2.hypers == dim.hypers
+            assert dict(dim2.Zr) == dict(dim.Zr)
+            assert dict(dim2.Zi) == dict(dim.Zi)
+            assert sorted(dim2.clusters) == sorted(dim.clusters)
+            for k, cluster in dim.clusters.iteritems():
+                stats = cluster.get_suffstats()
+                stats2 = dim2.clusters[k].get_suffstats()
+                assert sorted(stats2) == sorted(stats)
+                for s in stats:
+                    assert np.allclose(stats2[s], stats[s])
+                assert sorted(dim2.clusters[k].data) == sorted(cluster.data)
+    assert np.allclose(state2.logpdf_score(), state.logpdf_score())
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_state_binary(path, compact):
+    rng = gu.gen_rng(2)
+    state = State(
+        gen_data(rng), cctypes=CCTYPES, distargs=DISTARGS, compact=compact,
+        rng=rng)
+    state.transition(N=3, checkpoint=1, progress=False)
+    state.to_binary(path)
+    state2 = State.from_binary(path, rng=gu.gen_rng(1))
+    assert state2.compact == compact
+    assert state2.diagnostics['logscore'] == state.diagnostics['logscore']
+    check_same_state(state, state2)
+    # The restored clusters support further inference.
+    state2.transition(N=2, progress=False)
+    state2.incorporate(50, {0: 1., 1: 2, 2: 3, 3: 1})
+    state2.unincorporate(50)
+
+
+def test_state_binary_interrupted(path, monkeypatch):
+    rng = gu.gen_rng(2)
+    state = State(
+        gen_data(rng), cctypes=CCTYPES, distargs=DISTARGS, rng=rng)
+    state.to_binary(path)
+    saved = State.from_binary(path)
+    state.transition(N=3, progress=False)
+    # A save interrupted before metadata.pkl is written leaves the previous
+    # State, rather than new arrays with its metadata.
+    def interrupt(obj, path):
+        raise IOError('Interrupted.')
+    monkeypatch.setattr(binary, '_write_pickle', interrupt)
+    with pytest.raises(IOError):
+        state.to_binary(path)
+    check_same_state(saved, State.from_binary(path))
+
+
+def test_engine_binary(path):
+    rng = gu.gen_rng(2)
+    engine = Engine(
+        gen_data(rng), cctypes=CCTYPES, distargs=DISTARGS, num_states=3,
+        rng=rng)
+    engine.transition(N=2, progress=False)
+    engine.to_binary(path)
+    engine2 = Engine.from_binary(path, rng=gu.gen_rng(1))
+    assert engine2.num_states() == 3
+    for state, state2 in zip(engine.states, engine2.states):
+        check_same_state(state, state2)
+    # An engine is not a state.
+    with pytest.raises(ValueError):
+        State.from_binary(path)
+
+
+def test_engine_binary_mmap(path):
+    rng = gu.gen_rng(2)
+    engine = Engine(
+        gen_data(rng), cctypes=CCTYPES, distargs=DISTARGS, num_states=2,
+        rng=rng)
+    engine.transition(N=2, progress=False)
+    engine.to_binary(path)
+    engine2 = Engine.from_binary(path, rng=gu.gen_rng(1), mmap=True)
+    for state, state2 in zip(engine.states, engine2.states):
+        assert state2.readonly
+        # Columns are read-only slices of the memory-mapped dataset.
+        assert not state2.X[0].flags.writeable
+        # Views are constructed on first access.
+        assert all(
+            isinstance(view, functools.partial)
+            for view in dict.values(state2.views))
+        assert np.allclose(
+            state2.logpdf(-1, {0: 1., 2: 3}, {1: 2}),
+            state.logpdf(-1, {0: 1., 2: 3}, {1: 2}))
+        assert np.allclose(
+            state2.logpdf(7, {0: 1.}), state.logpdf(7, {0: 1.}))
+        check_same_state(state, state2)
+        with pytest.raises(ValueError):
+            state2.incorporate(50, {0: 1., 1: 2, 2: 3, 3: 1})
+        with pytest.raises(ValueError):
+            state2.force_cell(3, {0: 1.})
+    samples = engine2.simulate(-1, [0, 1], N=5, multiprocess=0)
+    assert len(samples) == 2 and len(samples[0]) == 5
+
+
+def test_state_checkpoint(path):
+    rng = gu.gen_rng(2)
+    state = State(
+        gen_data(rng), cctypes=CCTYPES, distargs=DISTARGS, rng=rng)
+    state.transition(N=4, checkpoint=1, checkpoint_path=path, progress=False)
+    assert os.path.exists(os.path.join(path, 'deltas.pkl'))
+    generation = binary.Checkpointer(state, path).generation
+    state2 = State.from_binary(path)
+    check_same_state(state, state2)
+    for key in ['logscore', 'column_crp_alpha', 'column_partition']:
+        assert state2.diagnostics[key] == state.diagnostics[key]
+    assert state2.diagnostics['iterations'] == state.diagnostics['iterations']
+    # A later transition continues the checkpoint, ignoring a truncated delta.
+    with open(os.path.join(path, 'deltas.pkl'), 'ab') as f:
+        f.write('\x80\x02}q')
+    state.transition(N=2, checkpoint=1, checkpoint_path=path, progress=False)
+    assert binary.Checkpointer(state, path).generation == generation
+    state2 = State.from_binary(path)
+    check_same_state(state, state2)
+    assert state2.diagnostics['logscore'] == state.diagnostics['logscore']
+    # Compaction discards the deltas.
+    state.transition(N=1, progress=False)
+    state.to_checkpoint(path, max_deltas=1)
+    assert not os.path.exists(os.path.join(path, 'deltas.pkl'))
+    check_same_state(state, State.from_binary(path))
+    # Deltas do not record new rows, which compact the checkpoint.
+    state.incorporate(50, {0: 1., 1: 2, 2: 3, 3: 1})
+    state.to_checkpoint(path)
+    check_same_state(state, State.from_binary(path))
+
+
+def test_state_checkpoint_partial(path):
+    rng = gu.gen_rng(2)
+    state = State(
+        gen_data(rng), cctypes=CCTYPES, distargs=DISTARGS, rng=rng)
+    # The iteration after the last checkpoint is written at the end.
+    state.transition(N=5, checkpoint=2, checkpoint_path=path, progress=False)
+    deltas, _end = binary._read_deltas(path)
+    assert len(deltas) == 3
+    check_same_state(state, State.from_binary(path))
+    # As are the iterations of a transition stopped by its deadline.
+    state.transition(
+        S=.5, checkpoint=10**6, checkpoint_path=path, progress=False)
+    deltas, _end = binary._read_deltas(path)
+    assert len(deltas) == 4
+    check_same_state(state, State.from_binary(path))
+
+
+def test_state_checkpoint_hooked(path):
+    rng = gu.gen_rng(2)
+    state = State(
+        gen_data(rng), cctypes=CCTYPES, distargs=DISTARGS, rng=rng)
+    state.compose_cgpm(PieceWise(outputs=[10, 11], inputs=[0], rng=rng))
+    state.transition(N=2, checkpoint=1, checkpoint_path=path, progress=False)
+    state.compose_cgpm(PieceWise(outputs=[12, 13], inputs=[2], rng=rng))
+    state.transition(N=2, checkpoint=1, checkpoint_path=path, progress=False)
+    # Only the delta after composing the second cgpm records hooked cgpms.
+    deltas, _end = binary._read_deltas(path)
+    assert ['hooked_cgpms' in delta for delta in deltas] == \
+        [False, False, True, False]
+    state2 = State.from_binary(path)
+    assert sorted(state2.hooked_cgpms) == sorted(state.hooked_cgpms)
+
+
+def test_state_checkpoint_thinned(path):
+    rng = gu.gen_rng(2)
+    state = State(
+        gen_data(rng), cctypes=CCTYPES, distargs=DISTARGS, max_checkpoints=3,
+        thin_checkpoints=True, rng=rng)
+    for _i in xrange(3):
+        state.transition(
+            N=3, checkpoint=1, checkpoint_path=path, progress=False)
+        state2 = State.from_binary(path)
+        for key in ['logscore', 'column_crp_alpha', 'column_partition']:
+            assert state2.diagnostics[key] == state.diagnostics[key]
+            assert state2.diagnostics[key].count == \
+                state.diagnostics[key].count
+    assert state2.diagnostics['logscore'].stride == 4
+    assert state2.max_checkpoints == 3
+
+
+def test_engine_checkpoint(path):
+    rng = gu.gen_rng(2)
+    engine = Engine(
+        gen_data(rng), cctypes=CCTYPES, distargs=DISTARGS, num_states=2,
+        rng=rng)
+    engine.transition(
+        N=3, checkpoint=1, checkpoint_path=path, progress=False,
+        multiprocess=0)
+    engine2 = Engine.from_binary(path)
+    for state, state2 in zip(engine.states, engine2.states):
+        check_same_state(state, state2)
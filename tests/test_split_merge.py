@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+import numpy as np
+import pytest
+
+from cgpm.crosscat.state import State
+from cgpm.mixtures.view import View
+from cgpm.utils import general as gu
+from cgpm.utils import test as tu
+
+
+def make_view(X, Zr, seed, alpha=None, hypers=None):
+    return View(
+        {c: x for c, x in enumerate(X.T)}, outputs=[1000] + range(X.shape[1]),
+        cctypes=['normal']*X.shape[1], alpha=alpha, hypers=hypers, Zr=Zr,
+        rng=gu.gen_rng(seed))
+
+
+def test_rows_split_merge_splits():
+    X = tu.gen_clumped_data(60, 2, gu.gen_rng(0))
+    view = make_view(X, [0]*60, 1)
+    view.transition_rows_split_merge(N=50)
+    tu.check_view_consistent(view)
+    # The clumps of rows are split into two large clusters, up to a few rows
+    # which only single row moves reassign.
+    Zr = view.Zr()
+    counts = [
+        collections.Counter(Zr[r] for r in rows).most_common(1)[0]
+        for rows in [xrange(30), xrange(30, 60)]
+    ]
+    assert counts[0][0] != counts[1][0]
+    assert all(25 <= n for _k, n in counts)
+
+
+def test_rows_split_merge_merges():
+    rng = gu.gen_rng(0)
+    X = rng.normal(size=(40, 2))
+    view = make_view(X, [0, 1]*20, 1)
+    view.transition_rows_split_merge(N=50)
+    tu.check_view_consistent(view)
+    assert len(view.Nk()) == 1
+
+
+def test_rows_split_merge_posterior():
+    # The split-merge moves alone leave the posterior of the row partition
+    # invariant, which is computed exactly for three rows.
+    X = np.asarray([[-1.], [.2], [3.]])
+    hypers = [{'m': 0, 'r': 1, 's': 1, 'nu': 1}]
+    partitions = [(0,0,0), (0,0,1), (0,1,0), (0,1,1), (0,1,2)]
+    logps = []
+    for Zr in partitions:
+        view = make_view(X, list(Zr), 0, alpha=1., hypers=hypers)
+        logps.append(view.crp.logpdf_score() + view.dims[0].logpdf_score())
+    expected = np.exp(np.subtract(logps, gu.logsumexp(logps)))
+    view = make_view(X, [0, 0, 0], 1, alpha=1., hypers=hypers)
+    counts = collections.Counter()
+    for _i in xrange(4000):
+        view.transition_rows_split_merge()
+        Zr = view.Zr()
+        relabel = {}
+        counts[tuple(relabel.setdefault(Zr[r], len(relabel))
+            for r in xrange(3))] += 1
+    frequencies = [counts[Zr] / 4000. for Zr in partitions]
+    assert np.allclose(frequencies, expected, atol=.03)
+
+
+def test_rows_split_merge_uncollapsed_error():
+    X = np.random.RandomState(0).uniform(high=5, size=(10, 2))
+    state = State(
+        X, cctypes=['normal', 'normal_trunc'],
+        distargs=[None, {'l': 0, 'h': 10}], Zv={0:0, 1:0}, rng=gu.gen_rng(0))
+    with pytest.raises(ValueError):
+        state.transition(N=1, kernels=['rows_split_merge'], progress=False)
+    with pytest.raises(ValueError):
+        state.transition(N=1, kernels=['columns_split_merge'], progress=False)
+
+
+def test_columns_split_merge_splits():
+    rng = gu.gen_rng(2)
+    A = np.repeat([-10, 10], 30)
+    B = np.tile([-10, 10], 30)
+    X = np.column_stack((A, A, B, B)) + rng.normal(size=(60, 4))
+    state = State(
+        X, cctypes=['normal']*4, Zv={0:0, 1:0, 2:0, 3:0}, rng=gu.gen_rng(1))
+    state.transition(
+        N=30, kernels=[
+            'columns_split_merge', 'rows', 'view_alphas', 'alpha',
+            'column_hypers',
+        ], progress=False)
+    assert state.Zv(0) == state.Zv(1)
+    assert state.Zv(2) == state.Zv(3)
+    assert state.Zv(0) != state.Zv(2)
+    assert state.diagnostics['iterations']['columns_split_merge'] == 30
+    for view in state.views.itervalues():
+        tu.check_view_consistent(view)
+
+
+def test_columns_split_merge_independence():
+    # Identical columns never share a view under an independence constraint.
+    rng = gu.gen_rng(0)
+    x = rng.normal(size=30)
+    X = np.column_stack((x, x, rng.normal(size=30)))
+    state = State(
+        X, cctypes=['normal']*3, Ci=[(0, 1)], rng=gu.gen_rng(2))
+    for _i in xrange(30):
+        state.transition_dims_split_merge()
+        assert state.Zv(0) != state.Zv(1)
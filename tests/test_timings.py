@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import numpy as np
+
+from cgpm.crosscat.engine import Engine
+from cgpm.crosscat.state import State
+from cgpm.utils import general as gu
+
+
+def make_data():
+    rng = gu.gen_rng(0)
+    X = rng.normal(size=(20, 3))
+    X[:,2] = rng.randint(3, size=20)
+    return X
+
+
+CCTYPES = ['normal', 'normal', 'categorical']
+DISTARGS = [None, None, {'k': 3}]
+
+
+def test_state_timings():
+    state = State(
+        make_data(), cctypes=CCTYPES, distargs=DISTARGS, rng=gu.gen_rng(1))
+    state.transition(N=3, progress=False)
+    state.transition(N=2, kernels=['rows', 'columns_pooled'], progress=False)
+    diagnostics = state.diagnostics
+    assert diagnostics['calls'] == {
+        'alpha': 3, 'view_alphas': 3, 'column_params': 3,
+        'column_hypers': 3, 'rows': 5, 'columns': 3, 'columns_pooled': 2,
+    }
+    assert set(diagnostics['seconds']) == set(diagnostics['calls'])
+    assert all(0 <= t for t in diagnostics['seconds'].itervalues())
+    for kernel in ['column_params', 'column_hypers']:
+        timings = diagnostics['column_seconds'][kernel]
+        assert sorted(timings) == [0, 1, 2]
+        assert sum(timings.values()) <= diagnostics['seconds'][kernel]
+
+
+def test_state_timings_multiprocess_serialize():
+    state = State(
+        make_data(), cctypes=CCTYPES, distargs=DISTARGS, rng=gu.gen_rng(1))
+    state.transition(N=2, kernels=['column_hypers'], multiprocess=2,
+        progress=False)
+    assert sorted(state.diagnostics['column_seconds']['column_hypers']) \
+        == [0, 1, 2]
+    # Column keys survive a JSON round trip.
+    metadata = json.loads(json.dumps(state.to_metadata()))
+    state = State.from_metadata(metadata, rng=gu.gen_rng(2))
+    state.transition(N=1, kernels=['column_hypers'], progress=False)
+    assert sorted(state.diagnostics['column_seconds']['column_hypers']) \
+        == [0, 1, 2]
+    assert state.diagnostics['calls']['column_hypers'] == 3
+
+
+def test_engine_timings():
+    engine = Engine(
+        make_data(), num_states=3, cctypes=CCTYPES, distargs=DISTARGS,
+        rng=gu.gen_rng(1), multiprocess=0)
+    engine.transition(N=2, multiprocess=0, progress=False)
+    timings = engine.timings()
+    assert timings['calls']['rows'] == 6
+    assert np.allclose(
+        timings['seconds']['rows'],
+        sum(s.diagnostics['seconds']['rows'] for s in engine.states))
+    assert sorted(timings['cctype_seconds']['column_hypers']) == \
+        ['categorical', 'normal']
+    assert np.allclose(
+        sum(timings['cctype_seconds']['column_hypers'].values()),
+        sum(timings['column_seconds']['column_hypers'].values()))
+    assert engine.timings(statenos=[0])['calls']['rows'] == 2
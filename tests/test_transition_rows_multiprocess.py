@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+from cgpm.utils import general as gu
+from cgpm.utils import test as tu
+
+
+def make_state(seed):
+    # The normal_trunc column 4 is uncollapsed.
+    return tu.gen_mixed_state(seed, Zv={0:0, 1:1, 4:1, 2:2, 3:2})
+
+
+def check_state_consistent(state):
+    tu.check_state_consistent(state)
+    # All cgpms share the rng of the state.
+    for dim in state.dims():
+        assert dim.rng is state.rng
+        assert all(c.rng is state.rng for c in dim.clusters.values())
+
+
+def test_transition_rows_multiprocess_deterministic():
+    states = [make_state(1), make_state(1), make_state(1)]
+    for state, multiprocess in zip(states, [2, 3, True]):
+        state.transition(
+            N=3, kernels=['rows'], multiprocess=multiprocess, progress=False)
+        check_state_consistent(state)
+    # Results do not depend on the number of processes.
+    for state in states[1:]:
+        for v in states[0].views:
+            assert state.views[v].Zr() == states[0].views[v].Zr()
+        assert np.allclose(state.logpdf_score(), states[0].logpdf_score())
+    assert states[0].diagnostics['iterations']['rows'] == 3
+
+
+def test_transition_rows_multiprocess_matches_view():
+    # The parallel kernel transitions each view as View.transition_rows would
+    # with the seeded rng.
+    state = make_state(2)
+    expected = make_state(2)
+    state.transition_view_rows(views=[1], multiprocess=2)
+    seed = expected.rng.randint(low=1, high=2**32-1, size=1)[0]
+    view = expected.views[1]
+    view._set_rng(gu.gen_rng(seed))
+    view.transition_rows()
+    assert state.views[1].Zr() == view.Zr()
+    assert np.allclose(
+        state.views[1].logpdf_likelihood(), view.logpdf_likelihood())
+    check_state_consistent(state)
+
+
+def test_transition_hypers_multiprocess_deterministic():
+    states = [make_state(3), make_state(3)]
+    for state, multiprocess in zip(states, [2, 3]):
+        state.transition(
+            N=2, kernels=['column_hypers', 'rows'], multiprocess=multiprocess,
+            progress=False)
+        check_state_consistent(state)
+        for dim in state.dims():
+            assert all(c.get_hypers() == dim.hypers
+                for c in dim.clusters.values())
+            assert dim.aux_model.get_hypers() == dim.hypers
+    for c in states[0].outputs:
+        assert states[0].dim_for(c).hypers == states[1].dim_for(c).hypers
+    assert states[0].diagnostics['iterations']['column_hypers'] == 2
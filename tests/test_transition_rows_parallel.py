@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+from cgpm.crosscat.state import State
+from cgpm.utils import general as gu
+from cgpm.utils import test as tu
+
+
+def make_state(seed, cctypes=None, distargs=None):
+    X = tu.gen_clumped_data(60, 3, gu.gen_rng(0))
+    return State(
+        X, cctypes=cctypes or ['normal']*3, distargs=distargs,
+        Zv={0:0, 1:0, 2:0}, Zrv={0:[0]*60}, rng=gu.gen_rng(seed))
+
+
+def test_transition_rows_parallel_separates_clusters():
+    state = make_state(1)
+    state.transition(
+        N=5, kernels=['rows_parallel'], multiprocess=3, progress=False)
+    view = state.views[0]
+    tu.check_view_consistent(view)
+    Zr = view.Zr()
+    # The two clumps of rows never share a cluster.
+    assert not set(Zr[r] for r in xrange(30)) & \
+        set(Zr[r] for r in xrange(30, 60))
+    assert state.diagnostics['iterations']['rows'] == 5
+
+
+def test_transition_rows_parallel_deterministic():
+    states = [make_state(2), make_state(2)]
+    for state in states:
+        state.transition(
+            N=2, kernels=['rows_parallel'], multiprocess=2, progress=False)
+    assert states[0].views[0].Zr() == states[1].views[0].Zr()
+    assert np.allclose(states[0].logpdf_score(), states[1].logpdf_score())
+
+
+def test_transition_rows_parallel_new_tables_distinct():
+    # Tables opened by different shards are never merged.
+    state = make_state(3)
+    state.transition(N=2, kernels=['column_hypers'], progress=False)
+    view = state.views[0]
+    rng_state = view.rng.get_state()
+    view.transition_rows_parallel(shards=3)
+    tu.check_view_consistent(view)
+    # Recover the shards from the rng.
+    rng = np.random.RandomState()
+    rng.set_state(rng_state)
+    rows = rng.permutation(range(60))
+    shards = [set(rows[i::3]) for i in xrange(3)]
+    Zr = view.Zr()
+    fresh = [k for k in view.Nk() if k != 0]
+    assert 2 <= len(fresh)
+    for k in fresh:
+        rowids = [r for r in Zr if Zr[r] == k]
+        assert any(set(rowids) <= shard for shard in shards)
+
+
+def test_transition_rows_parallel_uncollapsed_is_exact():
+    # Views with uncollapsed dims fall back to the sequential kernel.
+    kwargs = {
+        'cctypes': ['normal', 'normal_trunc', 'normal'],
+        'distargs': [None, {'l': -20, 'h': 20}, None],
+    }
+    state = make_state(4, **kwargs)
+    expected = make_state(4, **kwargs)
+    state.views[0].transition_rows_parallel(shards=3)
+    expected.views[0].transition_rows()
+    assert state.views[0].Zr() == expected.views[0].Zr()
+    tu.check_view_consistent(state.views[0])
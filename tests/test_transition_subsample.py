@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015-2016 MIT Probabilistic Computing Project
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from cgpm.crosscat.state import State
+from cgpm.utils import general as gu
+from cgpm.utils import test as tu
+
+
+def test_row_subsample():
+    state = tu.gen_mixed_state(1)
+    rows = state._get_row_subsample(None, .25)
+    assert len(rows) == 13
+    assert len(set(rows)) == 13
+    assert rows == sorted(rows)
+    assert set(rows) <= set(range(50))
+    assert len(state._get_row_subsample(range(10, 20), .01)) == 1
+    assert state._get_row_subsample(range(10, 20), 1) == range(10, 20)
+    for fraction in [0, -.5, 1.5]:
+        with pytest.raises(ValueError):
+            state._get_row_subsample(None, fraction)
+
+
+def test_transition_rows_fraction():
+    # Only rows in the subsample may move.
+    state = tu.gen_mixed_state(2)
+    Zr = {v: view.Zr() for v, view in state.views.iteritems()}
+    rng_state = state.rng.get_state()
+    state.transition_view_rows(fraction=.2)
+    rng = np.random.RandomState()
+    rng.set_state(rng_state)
+    rows = set(rng.choice(range(50), size=10, replace=False))
+    for v, view in state.views.iteritems():
+        assert all(view.Zr(r) == Zr[v][r] for r in Zr[v] if r not in rows)
+    tu.check_state_consistent(state)
+
+
+@pytest.mark.parametrize('exact', [False, True])
+def test_transition_columns_fraction(exact):
+    state = tu.gen_mixed_state(3)
+    state.transition(
+        N=10, kernels=['columns', 'view_alphas', 'alpha'],
+        column_fraction=.2, column_exact=exact, progress=False)
+    tu.check_state_consistent(state)
+    assert state.diagnostics['iterations']['columns'] == 10
+    # The two dependent columns end up in the same view.
+    assert state.Zv(0) == state.Zv(1)
+
+
+def test_transition_columns_fraction_exact_all_rows():
+    # With all rows the proposal is the exact conditional, and every move is
+    # accepted without drawing a uniform.
+    state = tu.gen_mixed_state(4)
+    col = 2
+    rows = range(state.n_rows())
+    rng_state = state.rng.get_state()
+    state._gibbs_transition_dim_subsample(col, 1, rows, exact=False)
+    Zv = state.Zv()
+    expected = tu.gen_mixed_state(4)
+    expected.rng.set_state(rng_state)
+    expected._gibbs_transition_dim_subsample(col, 1, rows, exact=True)
+    assert expected.Zv() == Zv
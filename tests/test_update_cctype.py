@@ -89,14 +89,15 @@ def test_categorical_forest():
         T, cctypes=CCTYPES, distargs=DISTARGS, rng=gu.gen_rng(1))
     state.transition(N=1, progress=False)
     cat_id = CCTYPES.index('categorical')
+    distargs = DISTARGS[cat_id].copy()
 
     # If cat_id is singleton migrate first.
     if len(state.view_for(cat_id).dims) == 1:
-        distargs = DISTARGS[cat_id].copy()
+        v = min(v for v in state.views if v != state.Zv(cat_id))
         state.unincorporate_dim(cat_id)
         state.incorporate_dim(
             T[:,cat_id], outputs=[cat_id], cctype='categorical',
-            distargs=distargs, v=0)
+            distargs=distargs, v=v)
     state.update_cctype(cat_id, 'random_forest', distargs=distargs)
 
     bernoulli_id = CCTYPES.index('bernoulli')
@@ -124,9 +125,14 @@ def test_categorical_forest():
 
 
 def test_categorical_forest_manual_inputs_errors():
+    # Two views which the transition keeps, so that some columns lie outside
+    # the first view whatever the seed.
     state = State(
-        T, cctypes=CCTYPES, distargs=DISTARGS, rng=gu.gen_rng(1))
-    state.transition(N=1, progress=False)
+        T, cctypes=CCTYPES, distargs=DISTARGS,
+        Zv={c: c % 2 for c in xrange(len(CCTYPES))}, rng=gu.gen_rng(1))
+    state.transition(
+        N=1, kernels=['alpha', 'view_alphas', 'column_hypers', 'rows'],
+        progress=False)
     cat_id = CCTYPES.index('categorical')
 
     # Put 1201 into the first view.